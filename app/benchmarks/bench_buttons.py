@@ -0,0 +1,132 @@
+"""
+Simulated benchmark for ButtonControl: compares the "edge" and "poll" modes.
+
+No GPIO hardware is touched, the line request is replaced by a small in-memory
+stand-in that behaves like a gpiod LineRequest (get_values, fd,
+read_edge_events). For every mode we measure
+- press-to-callback latency (time from the simulated press to the callback)
+- idle wakeups per second of the monitor thread
+- the time close() takes to stop the thread and release the lines
+
+Usage (from the app folder):
+    python benchmarks/bench_buttons.py [--presses 50] [--idle 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from hal import EdgeEvent, Value
+from buttons import ButtonControl
+
+
+class SimulatedLines:
+    """In-memory replacement for a gpiod LineRequest with pulled-up inputs."""
+
+    def __init__(self, pins):
+        self.pins = list(pins)
+        self.values = {pin: Value.ACTIVE for pin in self.pins}
+        self.events = []
+        self.cond = threading.Condition()
+        # becomes readable while events are queued, like the line request fd
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+    def set(self, pin, value):
+        """Changes a line and queues the matching edge event."""
+        with self.cond:
+            if self.values[pin] == value:
+                return
+            self.values[pin] = value
+            event_type = EdgeEvent.Type.RISING_EDGE if value is Value.ACTIVE else EdgeEvent.Type.FALLING_EDGE
+            self.events.append(EdgeEvent(event_type, time.monotonic_ns(), pin, 0, 0))
+            os.write(self._write_fd, b"\0")
+
+    def get_values(self):
+        with self.cond:
+            return [self.values[pin] for pin in self.pins]
+
+    @property
+    def fd(self):
+        return self._read_fd
+
+    def read_edge_events(self, max_events=None):
+        with self.cond:
+            events, self.events = self.events, []
+            try:
+                os.read(self._read_fd, 4096)
+            except BlockingIOError:
+                pass
+            return events
+
+    def release(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class SimulatedButtonControl(ButtonControl):
+    def _setup_gpio(self):
+        self.lines = SimulatedLines(self.pins)
+
+
+def run_mode(mode, presses, idle_s):
+    pins = [9, 10, 24]
+    pressed_at = {}
+    latencies = []
+    done = threading.Event()
+
+    def callback(pin, state, timestamp_ns):
+        now = time.monotonic_ns()
+        if pin in pressed_at:
+            latencies.append((now - pressed_at.pop(pin)) / 1e6)
+            done.set()
+
+    bc = SimulatedButtonControl(pins, callback, mode=mode)
+    bc.start_monitoring()
+    try:
+        # idle phase: nobody touches the radio
+        time.sleep(0.05)
+        wakeups_before = bc.wakeups
+        time.sleep(idle_s)
+        idle_wakeups = (bc.wakeups - wakeups_before) / idle_s
+
+        # press phase: toggle buttons with some jitter between presses
+        for i in range(presses):
+            pin = pins[i % len(pins)]
+            value = Value.INACTIVE if bc.lines.values[pin] is Value.ACTIVE else Value.ACTIVE
+            done.clear()
+            pressed_at[pin] = time.monotonic_ns()
+            bc.lines.set(pin, value)
+            done.wait(1.0)
+            time.sleep(0.013 * (i % 5))
+    finally:
+        stop_start = time.monotonic_ns()
+        bc.close()
+        stop_ms = (time.monotonic_ns() - stop_start) / 1e6
+
+    return {
+        "mode": mode,
+        "presses": len(latencies),
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_max": max(latencies),
+        "idle_wakeups_per_s": idle_wakeups,
+        "stop_ms": stop_ms,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=3.0, help="idle phase in seconds")
+    args = parser.parse_args()
+
+    for mode in ("poll", "edge"):
+        r = run_mode(mode, args.presses, args.idle)
+        print(f"{r['mode']:>5}: {r['presses']} presses, "
+              f"latency p50 {r['latency_ms_p50']:.2f} ms / max {r['latency_ms_max']:.2f} ms, "
+              f"idle wakeups {r['idle_wakeups_per_s']:.1f}/s, stop {r['stop_ms']:.2f} ms")
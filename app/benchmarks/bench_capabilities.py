@@ -0,0 +1,57 @@
+"""
+Compares the script and native capability backends on the radio itself.
+
+Every capability is enabled and disabled a few times with both backends,
+the wall clock time and CPU time (this process + child processes) of every
+call are reported. This really switches the capabilities, so run it with
+the rossis_roehren_radio service stopped.
+
+Usage (from the app folder):
+    python benchmarks/bench_capabilities.py [--rounds 5] [spotifyd bluetooth radio]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from capabilities import create_backends
+from main import CAPABILITIES_DIR, SHELL_WORKERS
+from scripts import CapabilityRegistry
+
+
+def measure(backend, rounds, settle_s):
+    results = {"enable": [], "disable": []}
+    for _ in range(rounds):
+        for action in ("enable", "disable"):
+            getattr(backend, action)()
+            results[action].append(backend.last_timing)
+            time.sleep(settle_s)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", default=["spotifyd", "bluetooth", "radio"])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--settle", type=float, default=0.5, help="pause between calls in seconds")
+    args = parser.parse_args()
+
+    registry = CapabilityRegistry(CAPABILITIES_DIR, workers=SHELL_WORKERS)
+    for native in (False, True):
+        backends = create_backends(registry, args.names, native=native)
+        for name in args.names:
+            backend = backends[name]
+            if native and backend.kind != "native":
+                print(f"{name}: no native backend available")
+                continue
+            for action, timings in measure(backend, args.rounds, args.settle).items():
+                wall = [t["wall_ms"] for t in timings]
+                cpu = [t["cpu_ms"] for t in timings]
+                print(f"{name:>10} {backend.kind:>6} {action:>7}: "
+                      f"wall p50 {statistics.median(wall):7.1f} ms / max {max(wall):7.1f} ms, "
+                      f"cpu p50 {statistics.median(cpu):6.1f} ms")
+    registry.close()
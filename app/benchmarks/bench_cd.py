@@ -0,0 +1,113 @@
+"""
+Benchmarks the CD player (cd.CdPlayer) on the simulated drive.
+
+Plays the fake disc, waits until the read-ahead is done and then measures
+how long next/previous take until the new track reaches the output, how
+often the drive had to spin up and how long it was stopped. With enough
+read-ahead a jump should be a few milliseconds (one period of the output)
+instead of a spin-up and seek.
+
+With --rip-mb the player rips into a RipCache, the benchmark waits until the
+disc is ripped and then plays it a second time: that should start without a
+single read from the drive.
+
+Usage (from the app folder):
+    python benchmarks/bench_cd.py [--speed 24] [--buffer-mb 160] [--jumps 10] [--rip-mb 1024]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["RRR_HAL"] = "sim"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import hal
+import cd
+
+
+class RecordingOutput:
+    """The simulated playback device, remembers which track every write came from."""
+
+    def __init__(self, log):
+        self._playback = hal.open_playback("default", period_frames=1024)
+        self._log = log
+
+    def write(self, data):
+        self._log.append((time.monotonic(), data[0]))  # the fake disc's bytes are the track number
+        return self._playback.write(data)
+
+    def close(self):
+        self._playback.close()
+
+
+def wait_for_track(log, since, track, timeout_s=10.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        for timestamp, written in log[since:]:
+            if written == track:
+                return timestamp
+        time.sleep(0.001)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--speed", type=float, default=24.0, help="read speed of the drive (x real time)")
+    parser.add_argument("--buffer-mb", type=int, default=160)
+    parser.add_argument("--jumps", type=int, default=10, help="alternating next/previous")
+    parser.add_argument("--rip-mb", type=int, default=0, help="size of the rip cache, 0 = no ripping")
+    args = parser.parse_args()
+
+    drive = hal.open_cdrom()
+    drive.speed = args.speed
+    log = []
+    with tempfile.TemporaryDirectory() as tmp:
+        toc_cache = cd.TocCache(os.path.join(tmp, "cd.json"))
+        rip_cache = cd.RipCache(os.path.join(tmp, "rip"), args.rip_mb * 1024 * 1024) if args.rip_mb else None
+        player = cd.CdPlayer(drive, lambda: RecordingOutput(log), toc_cache,
+                             max_buffer_bytes=args.buffer_mb * 1024 * 1024, rip_cache=rip_cache)
+        player.start()
+        start = time.monotonic()
+        player.play(1)
+        first = wait_for_track(log, 0, 1)
+        print(f"{player.toc}, first audio after {(first - start) * 1000:.0f} ms")
+
+        while not drive.stops and time.monotonic() - start < 600:
+            time.sleep(0.05)
+        print(f"read-ahead done after {time.monotonic() - start:.1f} s: {player.stats()}")
+
+        latencies = []
+        spin_ups = drive.spin_ups
+        for i in range(args.jumps):
+            since = len(log)
+            jumped = time.monotonic()
+            track = player.next() if i % 2 == 0 else player.previous()
+            written = wait_for_track(log, since, track)
+            latencies.append((written - jumped) * 1000 if written else float("inf"))
+            time.sleep(0.2)  # previous() right after a jump goes back a track
+        print(f"next/previous: p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms, "
+              f"spin-ups for more read-ahead meanwhile: {drive.spin_ups - spin_ups}")
+        if rip_cache:
+            # the drive was only stopped once the disc was ripped (or the cache was full)
+            print(f"ripped {rip_cache.total_bytes / 1024 / 1024:.0f} MiB, complete: {rip_cache.complete(player.toc)}")
+        player.close()
+
+        if rip_cache:
+            reads, spin_ups = drive.reads, drive.spin_ups
+            log.clear()
+            player = cd.CdPlayer(hal.open_cdrom(), lambda: RecordingOutput(log), toc_cache,
+                                 max_buffer_bytes=args.buffer_mb * 1024 * 1024, rip_cache=rip_cache)
+            player.start()
+            replayed = time.monotonic()
+            track = player.play()
+            first = wait_for_track(log, 0, track)
+            time.sleep(2)
+            print(f"second play (track {track}): first audio after {(first - replayed) * 1000:.0f} ms, "
+                  f"{drive.reads - reads} drive reads, {drive.spin_ups - spin_ups} spin-ups, {player.stats()}")
+            player.close()
+    print(f"drive: {drive.reads} reads, {drive.toc_reads} TOC reads, {drive.spin_ups} spin-ups, "
+          f"{drive.stops} stops")
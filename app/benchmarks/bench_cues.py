@@ -0,0 +1,75 @@
+"""
+Benchmarks the CuePlayer without a sound card.
+
+Plays the synthetic cues in bursts (like feedback while turning the wheel)
+into a null stand-in with a real-time device buffer and reports the time
+from play() to the first period written, and how often the output had to
+be opened. With a sound file as argument the first (ffmpeg decode) and a
+cached (mmap) load of the CueCache are timed as well.
+
+Usage (from the app folder):
+    python benchmarks/bench_cues.py [--cues 30] [path/to/intro.mp3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cues import CueCache, CuePlayer, SYNTHETIC_CUES, tone
+from passthrough import NullPlayback
+
+
+def run_player(count, hold_s):
+    player = CuePlayer(lambda: NullPlayback(None), hold_s=hold_s)
+    for name, segments in SYNTHETIC_CUES.items():
+        player.add(name, tone(segments))
+    player.start()
+    names = list(SYNTHETIC_CUES)
+    for i in range(count):
+        player.play(names[i % len(names)])
+        player.wait_idle()
+        time.sleep(0.05 if i % 5 else 0.4)  # bursts with pauses in between
+    player.stop()
+    return player
+
+
+def time_cache(source):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CueCache(tmp)
+        start = time.perf_counter()
+        cache.load(source).close()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        pcm = cache.load(source)
+        cached = time.perf_counter() - start
+        size = len(pcm)
+        pcm.close()
+    return first, cached, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="sound file to decode and cache")
+    parser.add_argument("--cues", type=int, default=30)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for segments in SYNTHETIC_CUES.values():
+        tone(segments)
+    print(f"synthetic cues generated in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for hold_s in (0.0, 2.0):
+        player = run_player(args.cues, hold_s)
+        latencies = player.start_latencies_ms
+        print(f"hold {hold_s:.1f}s: {player.played} cues, {player.opens} output opens, "
+              f"start latency p50 {statistics.median(latencies):.2f} ms / max {max(latencies):.2f} ms")
+
+    if args.source:
+        first, cached, size = time_cache(args.source)
+        print(f"{args.source}: decode {first * 1000:.0f} ms, cached load {cached * 1000:.2f} ms, "
+              f"{size / 1024:.0f} KiB PCM")
@@ -0,0 +1,337 @@
+"""
+End-to-end benchmark of the MainController on the simulated hardware.
+
+The controller runs unchanged on RRR_HAL=sim (see hal/__init__.py): the
+buttons and flywheel sensors are driven through the simulated GPIO chip,
+the volume goes to the simulated mixer, the radio to the fake tuner and
+every script is replaced by a short `sleep`. Scenarios:
+- idle: nothing happens, shows the background cost
+- button_storm: bursts of presses on random buttons a few ms apart, only
+  the last one of a burst has to be applied
+- mode_flip: radio <-> spotifyd, the next flip right after the last one
+  was applied
+- wheel_slow / wheel_fast: spins in alternating directions
+
+Every scenario reports the p50/p99 latency of button edge -> capability
+enabled and wheel edge -> volume applied (where it has those events), the
+CPU time of the process and its children and the wakeups per second
+(context switches of all threads, the simulated hardware included).
+
+The results can be written as JSON and compared against an earlier run;
+the exit status is 1 if a metric got worse by more than the tolerance.
+
+Usage (from the app folder):
+    python benchmarks/bench_e2e.py [--rounds 20] [--json run.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# must be set before the hal package is imported
+os.environ["RRR_HAL"] = "sim"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import main
+from hal import sim_gpio
+from hal.sim_process import runner
+
+PINS = {name: pin for pin, name in main.BUTTON_CONFIG.items()}
+
+# metrics checked by --compare (all lower is better) and the smallest change
+# that counts, so noise on tiny numbers isn't reported as a regression
+COMPARED_METRICS = {
+    "p50_ms": 1.0,
+    "p99_ms": 2.0,
+    "cpu_pct": 1.0,
+    "wakeups_per_s": 5.0,
+}
+
+
+class BenchController(main.MainController):
+    """MainController that records when each requested mode was applied."""
+
+    def __init__(self):
+        super().__init__()
+        self.applied = None       # (pin, timestamp_ns of the request) of the last finished transition
+        self.switch_latencies_ms = []
+        self._applied_cond = threading.Condition()
+
+    def _apply_mode(self, pin, timestamp_ns=None, superseded=lambda: False):
+        try:
+            super()._apply_mode(pin, timestamp_ns, superseded)
+        finally:
+            done_ns = time.monotonic_ns()
+            with self._applied_cond:
+                if not superseded() and timestamp_ns is not None:
+                    self.switch_latencies_ms.append((done_ns - timestamp_ns) / 1e6)
+                self.applied = (pin, timestamp_ns)
+                self._applied_cond.notify_all()
+
+    def wait_applied(self, pin, timeout_s=5.0):
+        """Waits until the newest request is applied and selects `pin`."""
+        # presses only arrive after the debounce period, a press right after
+        # the release of the same button doesn't arrive at all (it bounced)
+        time.sleep(self.bc.debounce_period.total_seconds() * 2)
+        transitions = self.transitions
+        with self._applied_cond:
+            return self._applied_cond.wait_for(
+                lambda: self.applied == (pin, transitions._target_ns) and transitions.target == pin, timeout_s)
+
+
+class Buttons:
+    """The radio's latching buttons: pressing one pops the other one out."""
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.pressed = None
+
+    def press(self, pin):
+        self.chip.press(pin)
+        if self.pressed is not None and self.pressed != pin:
+            self.chip.release(self.pressed)
+        self.pressed = pin
+
+
+def sleep_until(deadline):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def spin(chip, magnets, period_s, gap_s, direction):
+    """Moves `magnets` magnets past both sensors, `gap_s` apart, one every `period_s`."""
+    first, second = main.FLYWHEEL_PINS if direction > 0 else reversed(main.FLYWHEEL_PINS)
+    start = time.monotonic()
+    for i in range(magnets):
+        t = start + i * period_s
+        sleep_until(t)
+        chip.press(first)
+        sleep_until(t + gap_s)
+        chip.press(second)
+        sleep_until(t + gap_s + min(gap_s, period_s - gap_s) / 2)
+        chip.release(first)
+        chip.release(second)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, None without values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def latency_stats(values):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p99_ms": percentile(values, 99),
+        "max_ms": max(values) if values else None,
+    }
+
+
+def _wakeups():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+
+def measured(controller, scenario):
+    """Runs `scenario()` and adds duration, CPU and wakeups to the latencies it reports."""
+    actuator = controller.volume_actuator
+    actuator.latencies_ms.clear()
+    controller.switch_latencies_ms.clear()
+    events_before, writes_before = actuator.events, actuator.writes
+    cpu_before = main._cpu_seconds()
+    wakeups_before = _wakeups()
+    start = time.monotonic()
+    details = scenario() or {}
+    duration_s = time.monotonic() - start
+    cpu_ms = (main._cpu_seconds() - cpu_before) * 1000
+
+    result = {
+        "duration_s": duration_s,
+        "cpu_ms": cpu_ms,
+        "cpu_pct": cpu_ms / 10 / duration_s,
+        "wakeups_per_s": (_wakeups() - wakeups_before) / duration_s,
+    }
+    if controller.switch_latencies_ms:
+        result["switch"] = latency_stats(controller.switch_latencies_ms)
+    if actuator.latencies_ms:
+        result["volume"] = dict(latency_stats(list(actuator.latencies_ms)),
+                                events=actuator.events - events_before,
+                                writes=actuator.writes - writes_before)
+    result.update(details)
+    return result
+
+
+def run_scenarios(controller, args):
+    chip = sim_gpio.chip(main.CHIP_NAME)
+    buttons = Buttons(chip)
+    rng = random.Random(args.seed)
+    results = {}
+
+    results["idle"] = measured(controller, lambda: time.sleep(args.idle))
+
+    def button_storm():
+        presses = 0
+        for _ in range(args.rounds):
+            for _ in range(args.storm):
+                pin = rng.choice([pin for pin in PINS.values() if pin != buttons.pressed])
+                buttons.press(pin)
+                presses += 1
+                time.sleep(rng.uniform(0.002, 0.02))
+            if not controller.wait_applied(pin):
+                print(f"button_storm: {main.BUTTON_CONFIG[pin]} was not applied in time", file=sys.stderr)
+            time.sleep(0.05)
+        return {"presses": presses}
+    results["button_storm"] = measured(controller, button_storm)
+
+    def mode_flip():
+        pins = [PINS["radio"], PINS["spotifyd"]]
+        if buttons.pressed == pins[0]:
+            pins.reverse()
+        for i in range(args.rounds):
+            pin = pins[i % 2]
+            buttons.press(pin)
+            if not controller.wait_applied(pin):
+                print(f"mode_flip: {main.BUTTON_CONFIG[pin]} was not applied in time", file=sys.stderr)
+        return {"flips": args.rounds}
+    results["mode_flip"] = measured(controller, mode_flip)
+
+    # past the suppression window of the last switch
+    time.sleep(main.WHEEL_SUPPRESS_AFTER_SWITCH_S + 0.2)
+
+    for name, period_s, gap_s in (("wheel_slow", 0.25, 0.05), ("wheel_fast", 0.03, 0.008)):
+        def wheel(period_s=period_s, gap_s=gap_s):
+            for i in range(args.spins):
+                spin(chip, args.magnets, period_s, gap_s, 1 if i % 2 == 0 else -1)
+            time.sleep(0.2)  # let the actuator write the rest
+            return {"magnets": args.spins * args.magnets}
+        results[name] = measured(controller, wheel)
+
+    return results
+
+
+def run_benchmark(args):
+    controller = BenchController()
+    thread = threading.Thread(target=controller.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while "first_mode_switch" not in controller.timeline.marks:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("the controller did not start")
+        time.sleep(0.01)
+    time.sleep(args.settle)  # intro and cue output are closed again
+
+    try:
+        scenarios = run_scenarios(controller, args)
+    finally:
+        controller.stop()
+        thread.join()
+        controller.cleanup()
+    return {
+        "startup_ms": dict(controller.timeline.marks),
+        "scenarios": scenarios,
+        "shutdown_ms": controller.last_shutdown_timings,
+    }
+
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline, current, tolerance):
+    """Prints the compared metrics of both runs, returns the regressions."""
+    regressions = []
+    old_flat = flatten(baseline["scenarios"])
+    new_flat = flatten(current["scenarios"])
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        min_delta = COMPARED_METRICS.get(key.rsplit(".", 1)[-1])
+        if min_delta is None:
+            continue
+        old, new = old_flat[key], new_flat[key]
+        worse = new > old * (1 + tolerance) and new - old > min_delta
+        change = f"{(new - old) / old * 100:+6.0f}%" if old else "    n/a"
+        print(f"{key:>32}: {old:9.2f} -> {new:9.2f} {change}{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def print_results(results):
+    for name, result in results["scenarios"].items():
+        line = (f"{name:>12}: {result['duration_s']:5.1f} s, cpu {result['cpu_pct']:5.1f} %, "
+                f"{result['wakeups_per_s']:7.1f} wakeups/s")
+        for kind in ("switch", "volume"):
+            if kind in result:
+                stats = result[kind]
+                line += (f", {kind} p50 {stats['p50_ms']:6.1f} ms / p99 {stats['p99_ms']:6.1f} ms"
+                         f" ({stats['count']})")
+        print(line)
+    print("shutdown:", ", ".join(f"{k}={v:.1f}" for k, v in results["shutdown_ms"].items()))
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20, help="storm bursts and mode flips")
+    parser.add_argument("--storm", type=int, default=8, help="presses per storm burst")
+    parser.add_argument("--spins", type=int, default=4, help="wheel spins per speed")
+    parser.add_argument("--magnets", type=int, default=20, help="magnets per wheel spin")
+    parser.add_argument("--idle", type=float, default=3.0, help="length of the idle scenario in seconds")
+    parser.add_argument("--settle", type=float, default=2.5, help="wait after the startup in seconds")
+    parser.add_argument("--script-ms", type=float, default=50, help="run time of the simulated scripts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--verbose", action="store_true", help="show the controller output")
+    args = parser.parse_args()
+
+    runner.default_script_s = args.script_ms / 1000
+
+    output = contextlib.nullcontext() if args.verbose else open(os.devnull, "w")
+    with output, contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        results = run_benchmark(args)
+    results["meta"] = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "args": vars(args),
+    }
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print("written to", args.json)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared to {args.compare} ({baseline['meta'].get('revision')}):")
+        if compare(baseline, results, args.tolerance):
+            sys.exit(1)
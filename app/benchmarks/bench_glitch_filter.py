@@ -0,0 +1,61 @@
+"""
+Per-edge cost and hit rate of the flywheel GlitchFilter.
+
+A synthetic edge stream (a wheel speeding up and slowing down) gets short
+spikes injected, like the ones the aux/USB port causes. Reports the time per
+accept() call and how many spikes / real edges were rejected.
+
+Usage (from the app folder):
+    python benchmarks/bench_glitch_filter.py [--edges 200000] [--spike-rate 0.02]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flywheel import GlitchFilter
+
+
+def edge_stream(count, spike_rate, seed=1):
+    """Yields (line, timestamp_ns, is_spike) for two alternating sensor lines."""
+    rng = random.Random(seed)
+    t = 0
+    for i in range(count):
+        # interval between 10 and 200 ms, changing smoothly
+        interval_ms = 105 + 95 * math.sin(i / 500)
+        t += int(interval_ms * 1_000_000 * rng.uniform(0.9, 1.1))
+        line = 7 + (i % 2)
+        yield line, t, False
+        if rng.random() < spike_rate:
+            yield line, t + rng.randint(100_000, 3_000_000), True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, default=200_000)
+    parser.add_argument("--spike-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    events = list(edge_stream(args.edges, args.spike_rate))
+    glitch_filter = GlitchFilter()
+    accept = glitch_filter.accept
+
+    results = []
+    start = time.perf_counter_ns()
+    for line, timestamp_ns, _ in events:
+        results.append(accept(line, timestamp_ns))
+    elapsed_ns = time.perf_counter_ns() - start
+
+    spikes = sum(1 for e in events if e[2])
+    spikes_passed = sum(1 for e, ok in zip(events, results) if e[2] and ok)
+    real_dropped = sum(1 for e, ok in zip(events, results) if not e[2] and not ok)
+
+    print(f"{len(events)} edges, {elapsed_ns / len(events):.0f} ns per edge")
+    print(f"spikes: {spikes}, passed: {spikes_passed}")
+    print(f"real edges dropped: {real_dropped}")
+    print(glitch_filter.stats())
@@ -0,0 +1,66 @@
+"""
+Benchmarks the AudioPassthrough engine without a sound card.
+
+A file stand-in delivers a sine tone in real time like a capture device, a
+null stand-in consumes it like a playback device with a real-time device
+buffer. For every period size the input-to-output latency, xruns and CPU
+use are reported.
+
+Usage (from the app folder):
+    python benchmarks/bench_passthrough.py [--seconds 3] [--periods 4]
+"""
+
+import argparse
+import array
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from passthrough import AudioPassthrough, FileCapture, NullPlayback
+
+RATE = 44100
+CHANNELS = 2
+
+
+def write_tone(path, seconds=1.0, freq=440.0):
+    samples = array.array("h")
+    for i in range(int(RATE * seconds)):
+        value = int(12000 * math.sin(2 * math.pi * freq * i / RATE))
+        samples.extend([value] * CHANNELS)
+    with open(path, "wb") as f:
+        samples.tofile(f)
+
+
+def run(path, period_frames, periods, seconds):
+    source = FileCapture(path, RATE, CHANNELS, period_frames, periods)
+    sink = NullPlayback(None, RATE, CHANNELS, period_frames, periods)
+    engine = AudioPassthrough(source, sink)
+
+    cpu_before = time.process_time()
+    engine.start()
+    time.sleep(seconds)
+    stats = engine.stats()
+    engine.stop()
+    stats["cpu_percent"] = (time.process_time() - cpu_before) / seconds * 100
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--periods", type=int, default=4, help="device buffer size in periods")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tone = os.path.join(tmp, "tone.raw")
+        write_tone(tone)
+        for period_frames in (64, 128, 256, 512, 1024):
+            r = run(tone, period_frames, args.periods, args.seconds)
+            print(f"period {period_frames:>4} x {args.periods}: "
+                  f"latency p50 {r['latency_ms_p50']:6.1f} ms / p99 {r['latency_ms_p99']:6.1f} ms, "
+                  f"xruns capture {r['capture_xruns']} playback {r['playback_xruns']} ring {r['ring_overruns']}, "
+                  f"cpu {r['cpu_percent']:.1f}%")
@@ -0,0 +1,59 @@
+"""
+Compares running a capability script with a new bash per call against the
+persistent ShellWorkers of scripts.CapabilityRegistry.
+
+Runs a trivial script, so mostly the shell start is measured, and times
+the script lookup of the registry against exists() + resolve(). Nothing on
+the machine is switched, the script lives in a temporary folder.
+
+Usage (from the app folder):
+    python benchmarks/bench_scripts.py [--runs 200] [--workers 2]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from scripts import CapabilityRegistry, run_script
+
+
+def measure(func, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def report(name, times):
+    times = sorted(times)
+    print(f"{name:>22}: p50 {statistics.median(times):7.3f} ms, "
+          f"p99 {times[int(len(times) * 0.99) - 1]:7.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.mkdir(os.path.join(tmp, "bench"))
+        with open(os.path.join(tmp, "bench", "enable_bench.sh"), "w") as f:
+            f.write("#!/bin/bash\necho \"enabled by $0\"\n")
+        registry = CapabilityRegistry(tmp, workers=args.workers)
+        path = registry.script("bench", "enable")
+
+        report("lookup (registry)", measure(lambda: registry.script("bench", "enable"), args.runs))
+        report("lookup (exists+resolve)", measure(
+            lambda: path.exists() and path.resolve(), args.runs))
+        report("new bash per script", measure(lambda: run_script(path), args.runs))
+        report("shell worker", measure(lambda: registry.run("bench", "enable"), args.runs))
+        print(f"exit statuses: {registry.exits}, folder scans: {registry.scans}")
+        registry.close()
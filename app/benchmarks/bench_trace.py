@@ -0,0 +1,71 @@
+"""
+Benchmarks the edge trace (hal/trace.py) without GPIO hardware.
+
+Measures per edge: buffering and writing with an EdgeRecorder, reading
+through the memory-mapped TraceReader and replaying into a WheelControl on
+the simulated GPIO as fast as possible. A wheel spinning at full speed
+produces a few hundred edges per second, all numbers should be far below
+a millisecond.
+
+Usage (from the app folder):
+    python benchmarks/bench_trace.py [--edges 200000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ["RRR_HAL"] = "sim"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from hal import EdgeEvent
+from hal.trace import EdgeRecorder, TraceEvent, TraceReader, replay
+from flywheel import WheelControl, GlitchFilter
+
+
+def synthetic_spin(count, pin_a=7, pin_b=8, period_ns=20_000_000, gap_ns=4_000_000):
+    """Falling edges of a wheel turning at constant speed, in batches like read_edge_events()."""
+    start_ns = time.monotonic_ns()
+    events = []
+    for i in range(count):
+        magnet, second = divmod(i, 2)
+        timestamp_ns = start_ns + magnet * period_ns + second * gap_ns
+        events.append(TraceEvent(EdgeEvent.Type.FALLING_EDGE, timestamp_ns,
+                                 pin_b if second else pin_a, i + 1, 0))
+    return [events[i:i + 16] for i in range(0, count, 16)]
+
+
+def per_edge_ns(start, count):
+    return (time.perf_counter() - start) * 1e9 / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, default=200000)
+    args = parser.parse_args()
+
+    batches = synthetic_spin(args.edges)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.rre")
+
+        start = time.perf_counter()
+        with EdgeRecorder(path) as recorder:
+            for batch in batches:
+                recorder.add(batch)
+        print(f"record: {per_edge_ns(start, args.edges):6.0f} ns/edge, "
+              f"{recorder.flushes} writes, {os.path.getsize(path) / 1024:.0f} KiB")
+
+        with TraceReader(path) as reader:
+            start = time.perf_counter()
+            count = sum(1 for _ in reader.events())
+            print(f"read:   {per_edge_ns(start, count):6.0f} ns/edge ({count} edges)")
+
+            wheel = WheelControl(7, 8, lambda direction, speed_kmh, timestamp_ns: None,
+                                 distance_m=0.08, glitch_filter=GlitchFilter())
+            start = time.perf_counter()
+            count = replay(reader, {7: wheel, 8: wheel}, speed=0)
+            print(f"replay: {per_edge_ns(start, count):6.0f} ns/edge into WheelControl, "
+                  f"filter {wheel.filter.stats()}")
+            wheel.stop()
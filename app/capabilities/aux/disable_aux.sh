@@ -1,13 +1,18 @@
 #!/bin/bash
 
 # This script finds and stops the audio passthrough processes.
+# Under the radio controller (RRR_SUPERVISED is set) the supervisor kills the
+# passthrough with the process group of enable_aux.sh, the pkill is only for
+# running this script by hand.
 
 echo "Stopping audio passthrough..."
 
-# Use pkill to send a termination signal to any process named 'arecord'
-pkill arecord
+if [ -z "$RRR_SUPERVISED" ]; then
+    # Use pkill to send a termination signal to any process named 'arecord'
+    pkill arecord
 
-# Also kill the aplay process
-pkill aplay
+    # Also kill the aplay process
+    pkill aplay
+fi
 
-echo "Passthrough stopped."
\ No newline at end of file
+echo "Passthrough stopped."
@@ -1 +1,5 @@
-eject /dev/sr0
\ No newline at end of file
+#!/bin/bash
+
+# Stops the vlc started by enable_cd.sh, through its rc socket if it answers.
+
+echo "shutdown" | nc -U -q 1 /tmp/vlc.sock > /dev/null 2>&1 || pkill -x vlc
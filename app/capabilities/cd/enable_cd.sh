@@ -1,8 +1,7 @@
-# https://github.com/codazoda/hub-ctrl.c
-# sudo apt install uhubctl
+#!/bin/bash
 
-# sudo apt install vlc, netcat
-# ls /dev/sr*
-# cvlc cdda:///dev/sr0
-# cvlc --intf rc --rc-unix /tmp/vlc.sock cdda:///dev/sr0  # geht dann in ne console, vlt nicht richtiger command
-# echo "next" | nc -U /tmp/vlc.sock
\ No newline at end of file
+# Fallback for the CD player in the radio (cd.py): plays the disc with vlc.
+# sudo apt install vlc
+# Control it over the rc socket, e.g.: echo "next" | nc -U -q 0 /tmp/vlc.sock
+
+cvlc --intf rc --rc-unix /tmp/vlc.sock --rc-fake-tty --disc-caching=20000 cdda:///dev/sr0 > /dev/null 2>&1 &
@@ -1,71 +1,120 @@
 # KI - wird schon tun was es soll
 
-import gpiod
-from gpiod.line import Direction, Bias, Value
+from hal import Direction, Bias, Value, Edge, EdgeEvent, LineSettings, request_lines
 import threading
 import time
+from datetime import timedelta
+from reactor import Wakeup
 
 class ButtonControl:
     """
     A class to monitor multiple GPIO buttons using gpiod and trigger a 
     callback function on state changes.
 
+    Two modes are supported:
+    - "edge": the lines are requested with both-edge detection and kernel
+      debounce, the thread blocks on the line request fd and only wakes up
+      when a button actually changes.
+    - "poll": the lines are read every `poll_interval_s` seconds. This is the
+      fallback if edge detection can't be requested.
+
+    Both loops also wait on a Wakeup, so stop_monitoring() returns as soon as
+    the thread has seen the request instead of after the next edge or poll.
+
     This class runs a monitoring loop in a separate thread. It is best used
     as a context manager (`with` statement) to ensure proper cleanup of GPIO
     resources and the background thread.
     """
     
-    def __init__(self, pins, callback, chip_name="/dev/gpiochip0", consumer="ButtonControl"):
+    # no timeout needed to notice a stop request, the Wakeup interrupts the wait
+    EDGE_WAIT_TIMEOUT_S = None
+
+    def __init__(self, pins, callback, chip_name="/dev/gpiochip0", consumer="ButtonControl",
+                 mode="edge", debounce_ms=10, poll_interval_s=0.1):
         """
         Initializes the button controller.
 
         Args:
             pins (list[int]): A list of GPIO pin numbers (BCM numbering) to monitor.
             callback (function): A function to call when a button state changes.
-                                 The callback will be called with two arguments:
-                                 callback(pin: int, new_state: int)
+                                 The callback will be called with three arguments:
+                                 callback(pin: int, new_state: int, timestamp_ns: int)
                                  - pin: The pin number that changed.
                                  - new_state: 0 for pressed (LOW), 1 for released (HIGH).
+                                 - timestamp_ns: CLOCK_MONOTONIC time of the change. In
+                                   edge mode this is the kernel event timestamp.
             chip_name (str): The name of the GPIO chip device.
             consumer (str): A name for the consumer of the GPIO lines.
+            mode (str): "edge" (default) or "poll".
+            debounce_ms (int): Kernel debounce period used in edge mode.
+            poll_interval_s (float): Time between two reads in poll mode.
         """
         if not callable(callback):
             raise TypeError("The provided callback must be a callable function.")
         
-        self.pins = pins
+        if mode not in ("edge", "poll"):
+            raise ValueError(f"Unknown button mode '{mode}', use 'edge' or 'poll'.")
+
+        self.pins = list(pins)
         self.callback = callback
         self.chip_name = chip_name
         self.consumer = consumer
+        self.mode = mode
+        self.debounce_period = timedelta(milliseconds=debounce_ms)
+        self.poll_interval_s = poll_interval_s
         
         self.lines = None
         self._monitor_thread = None
         self._running = False
+        self._wakeup = Wakeup()
+        self._pin_index = {pin: i for i, pin in enumerate(self.pins)}
+
+        # number of times the monitor thread woke up, used to compare the modes
+        self.wakeups = 0
+        # edge events read per line, read by the metrics
+        self.edge_counts = dict.fromkeys(self.pins, 0)
         
         # Initialize GPIO lines
         self._setup_gpio()
 
     def _setup_gpio(self):
         """Configures and requests the GPIO lines from the system."""
+        if self.mode == "edge":
+            try:
+                self.lines = self._request_lines(
+                    edge_detection=Edge.BOTH,
+                    debounce_period=self.debounce_period
+                )
+                print(f"Successfully requested GPIO pins {self.pins} with edge detection")
+                return
+            except OSError as e:
+                print(f"Edge detection not available ({e}), falling back to polling")
+                self.mode = "poll"
+
         try:
-            # Define the settings for all input pins
-            # PULL_UP means the pin is HIGH (1) by default and goes LOW (0) when pressed.
-            settings = gpiod.LineSettings(
-                direction=Direction.INPUT,
-                bias=Bias.PULL_UP
-            )
-            config = {pin: settings for pin in self.pins}
-            
-            # Request the lines from the GPIO chip
-            self.lines = gpiod.request_lines(
-                self.chip_name,
-                consumer=self.consumer,
-                config=config
-            )
+            self.lines = self._request_lines()
             print(f"Successfully requested GPIO pins: {self.pins}")
         except Exception as e:
             print(f"Error setting up GPIO: {e}")
             raise
 
+    def _request_lines(self, **edge_settings):
+        # Define the settings for all input pins
+        # PULL_UP means the pin is HIGH (1) by default and goes LOW (0) when pressed.
+        settings = LineSettings(
+            direction=Direction.INPUT,
+            bias=Bias.PULL_UP,
+            **edge_settings
+        )
+        config = {pin: settings for pin in self.pins}
+
+        # Request the lines from the GPIO chip
+        return request_lines(
+            self.chip_name,
+            consumer=self.consumer,
+            config=config
+        )
+
     def start_monitoring(self):
         """Starts the background thread that monitors for button presses."""
         if self._running:
@@ -75,9 +124,11 @@ class ButtonControl:
         # default start, so we get if a button is already pressed before start of the pi
         self.last_states = [Value.ACTIVE for _ in self.pins]
         self._running = True
-        self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._wakeup.clear()
+        target = self._edge_loop if self.mode == "edge" else self._monitor_loop
+        self._monitor_thread = threading.Thread(target=target, daemon=True)
         self._monitor_thread.start()
-        print("Button monitoring started.")
+        print(f"Button monitoring started ({self.mode} mode).")
 
     def stop_monitoring(self):
         """Stops the background monitoring thread."""
@@ -85,36 +136,91 @@ class ButtonControl:
             return
             
         self._running = False
+        self._wakeup.set()
         if self._monitor_thread and self._monitor_thread.is_alive():
             self._monitor_thread.join() # Wait for the thread to finish
+        self._monitor_thread = None
         print("Button monitoring stopped.")
 
     def _monitor_loop(self):
-        """The core loop that runs in a thread to check for state changes."""
+        """The polling loop: reads all lines and compares them to the last read."""
         while self._running:
-            current_states = self.lines.get_values()
-            
-            for i, pin in enumerate(self.pins):
-                last_state = self.last_states[i]
-                current_state = current_states[i]
-                
-                if current_state != last_state:
-                    # State has changed, trigger the callback
-                    try:
-                        self.callback(pin, 1 if current_state is Value.ACTIVE else 0)
-                    except Exception as e:
-                        print(f"Error in user callback for pin {pin}: {e}")
-                
-            self.last_states = current_states
-            time.sleep(0.1) # Poll ~20 times/sec. Adjust as needed.
+            self.wakeups += 1
+            self._check_values()
+            self._wakeup.wait(timeout_s=self.poll_interval_s)
+
+    def _check_values(self):
+        current_states = self.lines.get_values()
+        timestamp_ns = time.monotonic_ns()
+
+        for i, pin in enumerate(self.pins):
+            if current_states[i] != self.last_states[i]:
+                # State has changed, trigger the callback
+                self._notify(pin, current_states[i], timestamp_ns)
+
+        self.last_states = list(current_states)
+
+    def _edge_loop(self):
+        """The edge loop: blocks until the kernel reports a (debounced) edge."""
+        # catch buttons that are already pressed before the first edge arrives
+        self._check_values()
+
+        while self._running:
+            self.wakeups += 1
+            if self._wakeup.wait(self.lines.fd, self.EDGE_WAIT_TIMEOUT_S):
+                for event in self.lines.read_edge_events():
+                    self._handle_edge_event(event)
+
+    def _handle_edge_event(self, event):
+        self.edge_counts[event.line_offset] += 1
+        i = self._pin_index[event.line_offset]
+        state = Value.ACTIVE if event.event_type is EdgeEvent.Type.RISING_EDGE else Value.INACTIVE
+        if state == self.last_states[i]:
+            # e.g. the edge that brought us to the state we read at startup
+            return
+
+        self.last_states[i] = state
+        self._notify(event.line_offset, state, event.timestamp_ns)
+
+    def _notify(self, pin, state, timestamp_ns):
+        try:
+            self.callback(pin, 1 if state is Value.ACTIVE else 0, timestamp_ns)
+        except Exception as e:
+            print(f"Error in user callback for pin {pin}: {e}")
+
+    # --- GpioReactor source interface (see reactor.py) ---
+    def attach(self, reactor):
+        """
+        Lets a GpioReactor deliver the edge events instead of the own thread.
+        Only available in edge mode.
+        """
+        if self.mode != "edge":
+            raise RuntimeError("Only edge mode buttons can be attached to a reactor.")
+        # same as the edge loop: report buttons that are pressed already
+        self.last_states = [Value.ACTIVE for _ in self.pins]
+        self._check_values()
+        reactor.add_source(self)
+
+    def fileno(self):
+        return self.lines.fd
+
+    def read_events(self):
+        return self.lines.read_edge_events()
+
+    def handle_event(self, event):
+        self._handle_edge_event(event)
 
     def close(self):
         """Stops monitoring and releases GPIO resources."""
+        # the thread has exited when this returns, only then the lines go away
         self.stop_monitoring()
         if self.lines:
             self.lines.release()
             self.lines = None
             print("GPIO lines released.")
+        if self._wakeup:
+            self._wakeup.close()
+            self._wakeup = None
             
     # --- Context Manager Support ---
     def __enter__(self):
@@ -132,10 +238,10 @@ if __name__ == "__main__":
     BUTTON_PINS = [9, 10, 24, 23, 22, 27, 17]
     
     # Define your callback function
-    def handle_button_press(pin, state):
+    def handle_button_press(pin, state, timestamp_ns):
         """This function is called whenever a button's state changes."""
         status = "Released" if state == 1 else "Pressed"
-        print(f"Button on GPIO {pin} was {status}")
+        print(f"Button on GPIO {pin} was {status} (t={timestamp_ns} ns)")
 
         # You can add specific logic here, e.g.:
         # if pin == 9 and state == 0: # Pin 9 was pressed
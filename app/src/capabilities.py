@@ -0,0 +1,815 @@
+import os
+import resource
+import signal
+import subprocess
+import threading
+import hal
+import time
+from metrics import CAPABILITY_SECONDS
+import ringlog
+from supervisor import process_usage
+from collections import deque
+
+_log = ringlog.get("capabilities")
+
+
+class CapabilityBackend:
+    """
+    Base class for the things a button can switch on and off (spotifyd,
+    bluetooth, radio, ...).
+
+    Subclasses implement `_enable`, `_disable` and optionally `status`.
+    `enable()` and `disable()` measure every call (wall clock time and CPU
+    time of this thread plus reaped child processes) and keep the result in
+    `last_timing` and `timings`.
+
+    With a `supervisor` (set by create_backends) the processes a backend
+    leaves running are adopted by it, and disable() kills whatever is left
+    of them afterwards.
+    """
+    kind = "none"
+    # True while the capability is disabled but kept running, paused and
+    # without the audio device (see WarmStandby)
+    warm = False
+    supervisor = None
+
+    def __init__(self, name):
+        self.name = name
+        self.last_timing = None
+        self.timings = deque(maxlen=64)
+
+    def enable(self, on_start=None):
+        """
+        Enables the capability.
+
+        Args:
+            on_start (function): Called with the Popen object (or ScriptJob) if a
+                                 script is started, so the caller can kill its
+                                 process group.
+        """
+        return self._measured("enable", self._enable, on_start)
+
+    def disable(self):
+        return self._measured("disable", self._supervised_disable)
+
+    def status(self):
+        """Returns True/False if the capability is running, None if that's unknown."""
+        return None
+
+    def start(self):
+        """Starts background work of the backend (if any). Called once by the controller."""
+        pass
+
+    def stop(self):
+        """Stops what start() started."""
+        pass
+
+    def _enable(self, on_start=None):
+        pass
+
+    def _disable(self):
+        pass
+
+    def _supervised_disable(self):
+        try:
+            return self._disable()
+        finally:
+            if self.supervisor and not self.warm:
+                self.supervisor.stop(self.name)
+
+    def _adopt(self, *procs):
+        """Hands processes the backend started over to the supervisor."""
+        if self.supervisor:
+            for proc in procs:
+                self.supervisor.adopt(self.name, proc)
+
+    def _measured(self, action, func, *args):
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_before = time.thread_time()
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            children_cpu = (children_after.ru_utime + children_after.ru_stime
+                            - children_before.ru_utime - children_before.ru_stime)
+            self.last_timing = {
+                "capability": self.name,
+                "backend": self.kind,
+                "action": action,
+                "wall_ms": (time.perf_counter() - start) * 1000,
+                "cpu_ms": (time.thread_time() - cpu_before + children_cpu) * 1000,
+            }
+            self.timings.append(self.last_timing)
+            CAPABILITY_SECONDS.observe(self.last_timing["wall_ms"] / 1000, self.name, self.kind, action)
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.name}')"
+
+
+class ScriptBackend(CapabilityBackend):
+    """Runs capabilities/<name>/enable_<name>.sh and disable_<name>.sh through a CapabilityRegistry."""
+    kind = "script"
+
+    def __init__(self, name, registry):
+        super().__init__(name)
+        self.registry = registry
+
+    def script_path(self, mode):
+        return self.registry.script(self.name, mode)
+
+    def _enable(self, on_start=None):
+        started = []
+        def track(proc):
+            started.append(proc)
+            if on_start:
+                on_start(proc)
+        result = self.registry.run(self.name, "enable", track)
+        if self.supervisor and started:
+            # the script's background jobs are still in its process group
+            self.supervisor.adopt_group(self.name, started[0].pid)
+        return result
+
+    def _disable(self):
+        return self.registry.run(self.name, "disable")
+
+
+class NativeBackend(CapabilityBackend):
+    """
+    Base class for in-process backends. If the native implementation fails
+    (missing permissions, daemon not reachable, ...) the call is repeated with
+    the script backend of the same capability.
+    """
+    kind = "native"
+
+    def __init__(self, name, fallback):
+        super().__init__(name)
+        self.fallback = fallback
+        self._enabled_by_script = False
+
+    def _enable(self, on_start=None):
+        try:
+            return self._enable_native()
+        except Exception as e:
+            _log.warning("Native enable of %s failed (%s), using the script", self.name, e)
+            self._enabled_by_script = True
+            return self.fallback._enable(on_start)
+
+    def _disable(self):
+        if self._enabled_by_script:
+            # whatever the script started, only its counterpart knows how to stop it
+            self._enabled_by_script = False
+            return self.fallback._disable()
+        try:
+            return self._disable_native()
+        except Exception as e:
+            _log.warning("Native disable of %s failed (%s), using the script", self.name, e)
+            return self.fallback._disable()
+
+    def _enable_native(self):
+        raise NotImplementedError
+
+    def _disable_native(self):
+        raise NotImplementedError
+
+
+class SystemBus:
+    """A single system D-Bus connection (jeepney), shared by the native backends."""
+
+    def __init__(self):
+        self._conn = hal.open_system_bus()
+        self._lock = threading.Lock()
+
+    def call(self, msg, timeout=5.0):
+        """Sends a method call and returns the reply body, raises DBusErrorResponse on errors."""
+        from jeepney.wrappers import unwrap_msg
+        with self._lock:
+            return unwrap_msg(self._conn.send_and_get_reply(msg, timeout=timeout))
+
+    def get_property(self, address, name):
+        from jeepney import Properties
+        (_, value), = self.call(Properties(address).get(name))
+        return value
+
+    def set_property(self, address, name, signature, value):
+        from jeepney import Properties
+        self.call(Properties(address).set(name, signature, value))
+
+    def close(self):
+        self._conn.close()
+
+
+class WarmStandby:
+    """
+    Decides which capabilities stay running while another one plays. A
+    backend that supports it asks admit() when it is disabled; if admitted
+    it only pauses its source (MPRIS, AVRCP) instead of stopping it, so
+    switching back is a Play call instead of a daemon start.
+
+    Sources stay warm while all warm ones together use at most
+    `max_memory_mb` and each of them at most `max_cpu_percent` of a core
+    while it waits. The limits are checked on every admit() (i.e. on every
+    switch), a source that got too expensive is stopped then.
+    """
+
+    def __init__(self, max_memory_mb=150, max_cpu_percent=2.0):
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.max_cpu_percent = max_cpu_percent
+        self.cooled = 0
+        self._warm = {}          # backend -> (monotonic time, CPU seconds) when it went warm
+        self._lock = threading.Lock()  # the capabilities are disabled in parallel
+
+    def admit(self, backend):
+        """True if `backend` may stay warm. Stops warm backends that exceed the limits."""
+        with self._lock:
+            memory = self._check()
+            usage = backend.standby_usage()
+            if usage is None or memory + usage[0] > self.max_memory_bytes:
+                _log.info("%s not kept warm (%s MiB warm, limit %d MiB)", backend.name,
+                          "?" if usage is None else round((memory + usage[0]) / 1024 / 1024),
+                          self.max_memory_bytes // 1024 // 1024)
+                return False
+            self._warm[backend] = (time.monotonic(), usage[1])
+            return True
+
+    def leave(self, backend):
+        with self._lock:
+            self._warm.pop(backend, None)
+
+    @property
+    def backends(self):
+        return list(self._warm)
+
+    def _check(self):
+        """Cools down the warm backends over the CPU limit, returns the memory of the others."""
+        memory = 0
+        now = time.monotonic()
+        for backend, (since, cpu_seconds) in list(self._warm.items()):
+            usage = backend.standby_usage()
+            cpu_percent = (usage[1] - cpu_seconds) / max(now - since, 1e-3) * 100 if usage else 0
+            if usage is None or cpu_percent > self.max_cpu_percent:
+                _log.info("%s uses %.1f%% CPU in standby, stopping it", backend.name, cpu_percent)
+                del self._warm[backend]
+                self.cooled += 1
+                backend.cool_down()
+            else:
+                memory += usage[0]
+        return memory
+
+
+class MprisPlayer:
+    """Pause/Play of an MPRIS player on the system bus, found by its bus name prefix."""
+
+    def __init__(self, bus, name):
+        """
+        Args:
+            name (str): e.g. "spotifyd", matches org.mpris.MediaPlayer2.spotifyd and
+                        org.mpris.MediaPlayer2.spotifyd.instance1234.
+        """
+        self.bus = bus
+        self.prefix = f"org.mpris.MediaPlayer2.{name}"
+
+    def _address(self):
+        from jeepney import DBusAddress, new_method_call
+        from jeepney.bus_messages import message_bus
+        names, = self.bus.call(new_method_call(message_bus, "ListNames"))
+        for name in names:
+            if name == self.prefix or name.startswith(self.prefix + "."):
+                return DBusAddress("/org/mpris/MediaPlayer2", bus_name=name,
+                                   interface="org.mpris.MediaPlayer2.Player")
+        return None
+
+    def pause(self):
+        """
+        Pauses the player. Returns True if it was playing, None if there is
+        no such player on the bus.
+        """
+        from jeepney import new_method_call
+        address = self._address()
+        if address is None:
+            return None
+        playing = self.bus.get_property(address, "PlaybackStatus") == "Playing"
+        self.bus.call(new_method_call(address, "Pause"))
+        return playing
+
+    def play(self):
+        from jeepney import new_method_call
+        address = self._address()
+        if address is not None:
+            self.bus.call(new_method_call(address, "Play"))
+
+
+class SystemdUnitBackend(NativeBackend):
+    """
+    Starts/stops a systemd unit through org.freedesktop.systemd1 instead of
+    `sudo systemctl`. With a WarmStandby and an MPRIS player name, disabling
+    pauses the player and keeps the unit running if the standby admits it.
+    """
+
+    def __init__(self, name, fallback, bus, unit, timeout_s=10.0, standby=None, mpris_name=None):
+        from jeepney import DBusAddress
+        super().__init__(name, fallback)
+        self.bus = bus
+        self.unit = unit
+        self.timeout_s = timeout_s
+        self.standby = standby
+        self.player = MprisPlayer(bus, mpris_name) if mpris_name else None
+        self._resume = False
+        self._manager = DBusAddress("/org/freedesktop/systemd1",
+                                    bus_name="org.freedesktop.systemd1",
+                                    interface="org.freedesktop.systemd1.Manager")
+
+    def _unit_address(self, interface="org.freedesktop.systemd1.Unit"):
+        from jeepney import DBusAddress, new_method_call
+        path, = self.bus.call(new_method_call(self._manager, "LoadUnit", "s", (self.unit,)))
+        return DBusAddress(path, bus_name="org.freedesktop.systemd1", interface=interface)
+
+    def _unit_state(self):
+        return self.bus.get_property(self._unit_address(), "ActiveState")
+
+    def _wait_for_state(self, transitional):
+        # StartUnit/StopUnit only queue a job, wait until it has settled
+        deadline = time.monotonic() + self.timeout_s
+        state = self._unit_state()
+        while state == transitional and time.monotonic() < deadline:
+            time.sleep(0.02)
+            state = self._unit_state()
+        return state
+
+    def _enable_native(self):
+        from jeepney import new_method_call
+        if self.warm:
+            self.warm = False
+            self.standby.leave(self)
+            if self._unit_state() == "active":
+                if self._resume:
+                    self.player.play()
+                return "active"
+        self.bus.call(new_method_call(self._manager, "StartUnit", "ss", (self.unit, "replace")))
+        state = self._wait_for_state("activating")
+        if state != "active":
+            # e.g. "failed" or "inactive", NativeBackend falls back to the script
+            raise RuntimeError(f"{self.unit} is {state} after StartUnit")
+        return state
+
+    def _disable_native(self):
+        if self.standby and self.player and self._unit_state() == "active" and self.standby.admit(self):
+            try:
+                playing = self.player.pause()
+            except Exception:
+                playing = None
+            if playing is not None:
+                self._resume = playing
+                self.warm = True
+                return "warm"
+            self.standby.leave(self)  # no MPRIS on the system bus, the unit has to stop
+        return self._stop_unit()
+
+    def _stop_unit(self):
+        from jeepney import new_method_call
+        self.bus.call(new_method_call(self._manager, "StopUnit", "ss", (self.unit, "replace")))
+        return self._wait_for_state("deactivating")
+
+    def standby_usage(self):
+        """Memory and CPU time of the unit's cgroup, of its main process without accounting."""
+        service = self._unit_address("org.freedesktop.systemd1.Service")
+        memory = self.bus.get_property(service, "MemoryCurrent")
+        cpu_ns = self.bus.get_property(service, "CPUUsageNSec")
+        if memory < 2 ** 64 - 1 and cpu_ns < 2 ** 64 - 1:
+            return memory, cpu_ns / 1e9
+        return process_usage(self.bus.get_property(service, "MainPID"))
+
+    def cool_down(self):
+        """Stops the unit that was kept warm."""
+        self.warm = False
+        self._stop_unit()
+
+    def stop(self):
+        if self.warm:
+            self.standby.leave(self)
+            self.cool_down()
+
+    def status(self):
+        return not self.warm and self._unit_state() == "active"
+
+
+class BluezBackend(NativeBackend):
+    """
+    Sets the adapter properties through org.bluez instead of feeding
+    bluetoothctl, and runs the pairing agent as a child process that is
+    stopped again on disable.
+
+    With a WarmStandby, disabling keeps the adapter powered and the phone
+    connected: the phone's players are paused over AVRCP (which ends the
+    A2DP stream) and the adapter stops being discoverable. Enabling resumes
+    the players that were playing.
+    """
+
+    def __init__(self, name, fallback, bus, alias="Rossis Röhren Radio", adapter="hci0",
+                 discoverable_timeout_s=300, agent_args=None, standby=None):
+        from jeepney import DBusAddress
+        super().__init__(name, fallback)
+        self.bus = bus
+        self.alias = alias
+        self.discoverable_timeout_s = discoverable_timeout_s
+        self.agent_args = agent_args
+        self.standby = standby
+        self._adapter_path = f"/org/bluez/{adapter}"
+        self._adapter = DBusAddress(self._adapter_path, bus_name="org.bluez",
+                                    interface="org.bluez.Adapter1")
+        self._agent = None
+        self._paused_players = []
+
+    def _players(self):
+        """Object paths and status of the AVRCP players of the devices on this adapter."""
+        from jeepney import DBusAddress, new_method_call
+        manager = DBusAddress("/", bus_name="org.bluez", interface="org.freedesktop.DBus.ObjectManager")
+        objects, = self.bus.call(new_method_call(manager, "GetManagedObjects"))
+        players = []
+        for path, interfaces in objects.items():
+            player = interfaces.get("org.bluez.MediaPlayer1")
+            if player is not None and path.startswith(self._adapter_path + "/"):
+                players.append((path, player.get("Status", ("s", ""))[1]))
+        return players
+
+    def _player_call(self, path, method):
+        from jeepney import DBusAddress, new_method_call
+        self.bus.call(new_method_call(DBusAddress(path, bus_name="org.bluez",
+                                                  interface="org.bluez.MediaPlayer1"), method))
+
+    def _enable_native(self):
+        if self.warm:
+            self.warm = False
+            self.standby.leave(self)
+            self.bus.set_property(self._adapter, "Discoverable", "b", True)
+            self.bus.set_property(self._adapter, "Pairable", "b", True)
+            for path in self._paused_players:
+                try:
+                    self._player_call(path, "Play")
+                except Exception as e:
+                    _log.warning("bluetooth player %s not resumed: %s", path, e)
+            self._paused_players = []
+            return
+        self.bus.set_property(self._adapter, "Alias", "s", self.alias)
+        self.bus.set_property(self._adapter, "Powered", "b", True)
+        self.bus.set_property(self._adapter, "DiscoverableTimeout", "u", self.discoverable_timeout_s)
+        self.bus.set_property(self._adapter, "Discoverable", "b", True)
+        self.bus.set_property(self._adapter, "Pairable", "b", True)
+        if self.agent_args and (self._agent is None or self._agent.poll() is not None):
+            self._agent = hal.popen(self.agent_args, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, start_new_session=True)
+            self._adopt(self._agent)
+
+    def _disable_native(self):
+        if self.standby and self.bus.get_property(self._adapter, "Powered") and self.standby.admit(self):
+            try:
+                self.bus.set_property(self._adapter, "Discoverable", "b", False)
+                self.bus.set_property(self._adapter, "Pairable", "b", False)
+                self._paused_players = []
+                for path, status in self._players():
+                    if status == "playing":
+                        self._player_call(path, "Pause")
+                        self._paused_players.append(path)
+                self.warm = True
+                return
+            except Exception as e:
+                _log.warning("bluetooth not paused (%s), powering off", e)
+                self.standby.leave(self)
+        self._power_off()
+
+    def _power_off(self):
+        self.bus.set_property(self._adapter, "Alias", "s", self.alias)
+        self.bus.set_property(self._adapter, "Discoverable", "b", False)
+        self.bus.set_property(self._adapter, "Pairable", "b", False)
+        self.bus.set_property(self._adapter, "Powered", "b", False)
+        if self._agent:
+            stop_process_group(self._agent)
+            self._agent = None
+
+    def standby_usage(self):
+        """What staying warm costs in this process tree: the pairing agent."""
+        if self._agent is None or self._agent.poll() is not None:
+            return 0, 0.0
+        return process_usage(self._agent.pid) or (0, 0.0)
+
+    def cool_down(self):
+        self.warm = False
+        self._paused_players = []
+        self._power_off()
+
+    def stop(self):
+        if self.warm:
+            self.standby.leave(self)
+            self.cool_down()
+
+    def status(self):
+        return not self.warm and bool(self.bus.get_property(self._adapter, "Powered"))
+
+
+class AudioBridge:
+    """
+    Capture -> playback bridge. Uses the in-process AudioPassthrough engine
+    if pyalsaaudio is installed, an `arecord | aplay` pipeline otherwise.
+    """
+
+    def __init__(self, capture_device, playback_device="default", rate=44100, channels=2,
+                 period_frames=256, periods=4):
+        self.capture_device = capture_device
+        self.playback_device = playback_device
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self.periods = periods
+        self.native = hal.pcm_available()
+        self._engine = None
+        self._pipeline = []
+        self.last_stats = None
+
+    def start(self):
+        if self.running:
+            return
+        if self.native:
+            import passthrough
+            self._engine = passthrough.alsa_passthrough(
+                self.capture_device, self.playback_device, self.rate, self.channels,
+                self.period_frames, self.periods)
+            self._engine.start()
+        else:
+            fmt = ["-f", "S16_LE", "-r", str(self.rate), "-c", str(self.channels)]
+            self._pipeline = spawn_pipeline(
+                ["arecord", "-D", self.capture_device] + fmt,
+                ["aplay", "-D", self.playback_device] + fmt,
+            )
+
+    def stop(self):
+        if self._engine:
+            self.last_stats = self._engine.stats()
+            print(f"Passthrough {self.capture_device} -> {self.playback_device}: {self.last_stats}")
+            self._engine.stop()
+            self._engine = None
+        if self._pipeline:
+            stop_process_group(self._pipeline[0])  # takes the whole pipeline down
+            for proc in self._pipeline[1:]:
+                proc.wait(timeout=2.0)
+            self._pipeline = []
+
+    @property
+    def processes(self):
+        """The Popen objects of the pipeline, empty with the in-process engine."""
+        return list(self._pipeline)
+
+    @property
+    def running(self):
+        if self._engine:
+            return self._engine.running
+        return bool(self._pipeline) and all(proc.poll() is None for proc in self._pipeline)
+
+
+class AuxBackend(NativeBackend):
+    """Aux in -> speakers through an AudioBridge instead of the arecord | aplay script and pkill."""
+
+    def __init__(self, name, fallback, capture_device="plughw:3,0", playback_device="plughw:2,0"):
+        super().__init__(name, fallback)
+        self.bridge = AudioBridge(capture_device, playback_device)
+        if not self.bridge.native:
+            raise ImportError("pyalsaaudio is not installed")
+
+    def _enable_native(self):
+        self.bridge.start()
+        self._adopt(*self.bridge.processes)
+
+    def _disable_native(self):
+        self.bridge.stop()
+
+    def status(self):
+        return self.bridge.running
+
+
+class RadioBackend(NativeBackend):
+    """
+    Tunes the TEA5767 with the radio module in this process (instead of a new
+    python3 interpreter) and runs the audio bridge from the USB input with an
+    AudioBridge.
+
+    While the radio is off, a BandScanner fills the station index in the
+    background. Enabling tunes to the last station from the index (or the
+    strongest one, or `frequency` if nothing was scanned yet).
+    """
+
+    def __init__(self, name, fallback, frequency=None, capture_device="hw:1,0", scan=True):
+        super().__init__(name, fallback)
+        hal.check_i2c()  # needs smbus2, the factory falls back to the scripts without it
+        import radio
+        self.radio = radio
+        self.frequency = frequency
+        self.bridge = AudioBridge(capture_device)
+        self.index = radio.StationIndex.load()
+        self.scanner = None
+        self._scan = scan
+
+    def start(self):
+        if self._scan:
+            try:
+                self.scanner = self.radio.BandScanner(self.radio.get_tuner(), self.index)
+                self.scanner.start()
+            except OSError as e:
+                print(f"No band scan, tuner not available: {e}")
+
+    def stop(self):
+        if self.scanner:
+            self.scanner.stop()
+            self.scanner = None
+
+    def tune(self, station):
+        """Tunes to a Station of the index (presets, next/previous), one I2C write."""
+        if station is not None:
+            self.radio.tune_station(station, self.index)
+
+    def _enable_native(self):
+        if self.scanner:
+            self.scanner.pause()
+        try:
+            frequency = self.frequency or self.index.best_frequency()
+            self.radio.set_frequency(frequency)
+            self.index.last_mhz = frequency
+            self.bridge.start()
+            self._adopt(*self.bridge.processes)
+        except Exception:
+            # undo the partial enable, the fallback script tunes and bridges on its own.
+            # The scanner stays paused while the radio plays, _disable() resumes it.
+            self.bridge.stop()
+            try:
+                self.radio.turn_off()
+            except Exception as e:
+                _log.warning("radio not muted after the failed enable: %s", e)
+            raise
+
+    def _disable(self):
+        try:
+            return super()._disable()
+        finally:
+            # also after the script, if the native enable fell back to it
+            if self.scanner:
+                self.scanner.resume()
+
+    def _disable_native(self):
+        try:
+            self.radio.turn_off()
+        finally:
+            # the bridge goes away even if the tuner didn't answer, the script mutes it again
+            self.bridge.stop()
+
+    def status(self):
+        return self.bridge.running
+
+
+class CdBackend(NativeBackend):
+    """
+    Plays the CD with the cd module: a CdPlayer in this process if PCM is
+    available, otherwise cvlc through a VlcRemote. Both start at the track
+    where the disc was stopped last time. The TOC cache lives as long as the
+    backend, the disc is only read again after a media change. With a rip
+    cache (cd.RIP_CACHE_MAX_MB) discs that were played before come from
+    storage.
+    """
+
+    def __init__(self, name, fallback, device="/dev/sr0", playback_device="default"):
+        super().__init__(name, fallback)
+        import cd
+        self.cd = cd
+        self.device = device
+        self.playback_device = playback_device
+        self.cache = cd.TocCache.load()
+        self.rip_cache = cd.RipCache() if cd.RIP_CACHE_MAX_MB else None
+        self.player = None
+
+    def next(self):
+        """Next track, instantly if it was read ahead."""
+        if self.player:
+            self.player.next()
+
+    def previous(self):
+        if self.player:
+            self.player.previous()
+
+    def _enable_native(self):
+        drive = hal.open_cdrom(self.device)
+        if hal.pcm_available():
+            try:
+                player = self.cd.CdPlayer(
+                    drive, lambda: hal.open_playback(self.playback_device, period_frames=1024), self.cache,
+                    rip_cache=self.rip_cache)
+            except Exception:
+                drive.close()
+                raise
+            try:
+                player.start()
+                player.play()
+            except Exception:
+                player.close()  # threads and drive, before the script wants the disc
+                raise
+            self.player = player
+        else:
+            try:
+                track = self.cache.last_track(self.cache.toc(drive))
+            finally:
+                drive.close()
+            player = self.cd.VlcRemote(self.device)
+            player.start(track)  # stops cvlc again if it fails
+            self.player = player
+            self._adopt(self.player.proc)
+
+    def _disable_native(self):
+        player, self.player = self.player, None
+        if isinstance(player, self.cd.CdPlayer):
+            stats = player.stats()
+            player.close()
+            print(f"CD: {stats}")
+        elif player:
+            player.stop()
+
+    def status(self):
+        if isinstance(self.player, self.cd.CdPlayer):
+            return self.player.playing
+        return bool(self.player and self.player.running)
+
+
+def spawn_pipeline(*commands):
+    """Starts `cmd1 | cmd2 | ...` without a shell, all processes share one new process group."""
+    procs = []
+    stdin = None
+    for i, args in enumerate(commands):
+        last = i == len(commands) - 1
+        group = {"start_new_session": True} if not procs else {"process_group": procs[0].pid}
+        proc = hal.popen(args, stdin=stdin,
+                         stdout=subprocess.DEVNULL if last else subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, **group)
+        if stdin is not None:
+            stdin.close()  # the next process owns it now
+        stdin = proc.stdout
+        procs.append(proc)
+    return procs
+
+
+def stop_process_group(proc, timeout_s=2.0):
+    """SIGTERM to the process group of `proc`, SIGKILL if it doesn't exit in time."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=timeout_s)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def create_backends(registry, names, native=True, standby=None, supervisor=None):
+    """
+    Builds one backend per capability name. With native=True the in-process
+    backends are used where available, everything else (and everything
+    whose dependencies are missing) uses the scripts. With a WarmStandby
+    spotifyd and bluetooth are paused instead of stopped where it admits them.
+    With a Supervisor every backend (and its script fallback) hands its
+    child processes over to it.
+
+    Args:
+        registry (scripts.CapabilityRegistry): The scripts of the capabilities folder.
+
+    Returns:
+        dict[str, CapabilityBackend]
+    """
+    directory = registry.directory
+    backends = {name: ScriptBackend(name, registry) for name in names}
+    for backend in backends.values():
+        backend.supervisor = supervisor
+    if not native:
+        return backends
+
+    bus = None
+    try:
+        bus = SystemBus()
+    except (ImportError, OSError) as e:
+        print(f"No system D-Bus connection ({e}), spotifyd and bluetooth use the scripts")
+
+    factories = {
+        "radio": lambda fallback: RadioBackend("radio", fallback),
+        "aux": lambda fallback: AuxBackend("aux", fallback),
+        "cd": lambda fallback: CdBackend("cd", fallback),
+    }
+    if bus:
+        factories["spotifyd"] = lambda fallback: SystemdUnitBackend(
+            "spotifyd", fallback, bus, "spotifyd.service", standby=standby, mpris_name="spotifyd")
+        factories["bluetooth"] = lambda fallback: BluezBackend(
+            "bluetooth", fallback, bus,
+            agent_args=["sudo", "bt-agent", "-c", "DisplayYesNo",
+                        "-p", str(directory / "bluetooth" / "pins.txt")],
+            standby=standby)
+
+    for name, factory in factories.items():
+        if name in backends:
+            try:
+                backends[name] = factory(backends[name])
+                backends[name].supervisor = supervisor
+            except ImportError as e:
+                print(f"Native {name} backend not available ({e}), using the scripts")
+    return backends
@@ -0,0 +1,911 @@
+"""
+Audio CD playback in this process, without a player daemon.
+
+The table of contents is read from the disc once (two ioctls per track)
+and kept until the drive reports a media change. TocCache stores it by
+freedb disc ID together with the last played track. A disc that is
+inserted again is recognized by its track numbers and lead-out (two
+ioctls), its TOC comes from the cache and it resumes where it was left.
+
+CdPlayer reads the audio ahead into memory in one-second chunks
+(CDROMREADAUDIO): the current track, the next READ_AHEAD_TRACKS tracks and
+the previous one, up to `max_buffer_bytes`. When everything it wants is in
+memory it stops the drive, so the disc spins down while the buffered audio
+plays; next/previous within the buffered tracks only move a position. A
+track that doesn't fit (completely) is read through a window that is
+refilled in bursts when half of it has been played.
+
+With a RipCache everything read from the disc is also appended to a raw
+audio file per track, and once the read-ahead is done the player rips the
+rest of the disc before it stops the drive. Reads are served from those
+files where they exist, so a disc that was played before starts right away
+and the drive only fills the gaps. The cache is bounded by size and drops
+the least recently played discs.
+
+Without in-process PCM (pyalsaaudio missing) VlcRemote plays the disc with
+cvlc and keeps one connection to its rc socket open for the commands.
+
+Usage (from the src folder):
+    python3 cd.py toc
+    python3 cd.py play [track]
+"""
+
+import ctypes
+import errno
+import fcntl
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import hal
+import ringlog
+
+_log = ringlog.get("cd")
+
+# linux/cdrom.h
+CDROMSTOP = 0x5308
+CDROMREADTOCHDR = 0x5305
+CDROMREADTOCENTRY = 0x5306
+CDROMREADAUDIO = 0x530e
+CDROM_MEDIA_CHANGED = 0x5325
+CDROM_DRIVE_STATUS = 0x5326
+CDROM_LOCKDOOR = 0x5329
+CDSL_CURRENT = 0x7fffffff
+CDS_DISC_OK = 4
+CDROM_LBA = 0x01
+CDROM_LEADOUT = 0xAA
+CDROM_DATA_TRACK = 0x04
+
+FRAME_BYTES = 2352          # one CD frame of 16 bit stereo audio at 44.1 kHz
+FRAMES_PER_SECOND = 75
+BYTES_PER_SECOND = FRAME_BYTES * FRAMES_PER_SECOND
+
+READ_AHEAD_TRACKS = 2
+MIN_WINDOW_BYTES = 30 * BYTES_PER_SECOND  # the smallest part of a track that is read ahead
+PREVIOUS_RESTART_S = 3.0    # previous() after this much of a track restarts it
+TOC_CACHE_PATH = os.path.expanduser("~/.cache/rossis_roehren_radio/cd-sim.json" if hal.SIMULATED
+                                    else "~/.cache/rossis_roehren_radio/cd.json")
+RIP_CACHE_DIR = os.path.expanduser("~/.cache/rossis_roehren_radio/rip-sim" if hal.SIMULATED
+                                   else "~/.cache/rossis_roehren_radio/rip")
+RIP_CACHE_MAX_MB = 4096     # 0 turns ripping off, about 10 MiB per minute of audio
+VLC_SOCKET = "/tmp/vlc.sock"
+
+
+class Toc:
+    """Table of contents: start LBA of every track and of the lead-out."""
+
+    def __init__(self, first_track, starts, leadout, audio):
+        """
+        Args:
+            first_track (int): Number of the first track (almost always 1).
+            starts (list[int]): Start LBA of every track, in order.
+            leadout (int): LBA of the lead-out, the end of the last track.
+            audio (list[bool]): False for data tracks.
+        """
+        self.first_track = first_track
+        self.starts = list(starts)
+        self.leadout = leadout
+        self.audio = list(audio)
+
+    @property
+    def tracks(self):
+        """Numbers of the audio tracks."""
+        return [self.first_track + i for i, audio in enumerate(self.audio) if audio]
+
+    def frames(self, track):
+        """(start LBA, number of frames) of `track`."""
+        i = track - self.first_track
+        end = self.starts[i + 1] if i + 1 < len(self.starts) else self.leadout
+        return self.starts[i], end - self.starts[i]
+
+    def track_bytes(self, track):
+        return self.frames(track)[1] * FRAME_BYTES
+
+    def next_track(self, track):
+        tracks = self.tracks
+        later = [t for t in tracks if t > track]
+        return later[0] if later else None
+
+    def previous_track(self, track):
+        earlier = [t for t in self.tracks if t < track]
+        return earlier[-1] if earlier else None
+
+    @property
+    def disc_id(self):
+        """The freedb/CDDB disc ID, e.g. "7f0a5c09"."""
+        def digit_sum(n):
+            return sum(int(digit) for digit in str(n))
+
+        # CDDB counts in seconds from MSF 00:02:00, the LBA starts after those 150 frames
+        seconds = [(lba + 150) // FRAMES_PER_SECOND for lba in self.starts]
+        checksum = sum(digit_sum(s) for s in seconds) % 0xff
+        length = (self.leadout + 150) // FRAMES_PER_SECOND - seconds[0]
+        return f"{checksum << 24 | length << 8 | len(self.starts):08x}"
+
+    def to_json(self):
+        return {"first": self.first_track, "starts": self.starts, "leadout": self.leadout,
+                "audio": [int(audio) for audio in self.audio]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["first"], data["starts"], data["leadout"], [bool(a) for a in data["audio"]])
+
+    def __repr__(self):
+        return f"Toc({self.disc_id}, {len(self.tracks)} audio tracks, {self.leadout // FRAMES_PER_SECOND} s)"
+
+
+_TOC_HEADER = struct.Struct("BB")            # struct cdrom_tochdr
+_TOC_ENTRY = struct.Struct("BBBxiBxxx")     # struct cdrom_tocentry, the address as LBA
+
+
+class _ReadAudio(ctypes.Structure):
+    # struct cdrom_read_audio, the union cdrom_addr as LBA
+    _fields_ = [("lba", ctypes.c_int), ("addr_format", ctypes.c_ubyte),
+                ("nframes", ctypes.c_int), ("buf", ctypes.c_void_p)]
+
+
+class CdromDrive:
+    """A CD drive driven with the Linux CDROM ioctls (see hal.open_cdrom())."""
+
+    def __init__(self, device="/dev/sr0"):
+        self.device = device
+        # O_NONBLOCK: opening works without a disc and doesn't wait for the tray
+        self.fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+        try:
+            # the kernel locks the tray while the device is open, keep the eject button working
+            fcntl.ioctl(self.fd, CDROM_LOCKDOOR, 0)
+        except OSError:
+            pass
+
+    def disc_ready(self):
+        return fcntl.ioctl(self.fd, CDROM_DRIVE_STATUS, CDSL_CURRENT) == CDS_DISC_OK
+
+    def media_changed(self):
+        """True if the disc was changed since the last call (doesn't spin the disc up)."""
+        return fcntl.ioctl(self.fd, CDROM_MEDIA_CHANGED, CDSL_CURRENT) == 1
+
+    def read_toc_summary(self):
+        """(first track, last track, lead-out LBA), enough to recognize a disc with two ioctls."""
+        first, last = _TOC_HEADER.unpack(fcntl.ioctl(self.fd, CDROMREADTOCHDR, bytes(_TOC_HEADER.size)))
+        entry = fcntl.ioctl(self.fd, CDROMREADTOCENTRY, _TOC_ENTRY.pack(CDROM_LEADOUT, 0, CDROM_LBA, 0, 0))
+        return first, last, _TOC_ENTRY.unpack(entry)[3]
+
+    def read_toc(self):
+        first, last = _TOC_HEADER.unpack(fcntl.ioctl(self.fd, CDROMREADTOCHDR, bytes(_TOC_HEADER.size)))
+        starts, audio = [], []
+        leadout = None
+        for track in list(range(first, last + 1)) + [CDROM_LEADOUT]:
+            entry = fcntl.ioctl(self.fd, CDROMREADTOCENTRY, _TOC_ENTRY.pack(track, 0, CDROM_LBA, 0, 0))
+            _, adr_ctrl, _, lba, _ = _TOC_ENTRY.unpack(entry)
+            if track == CDROM_LEADOUT:
+                leadout = lba
+            else:
+                starts.append(lba)
+                audio.append(not (adr_ctrl >> 4) & CDROM_DATA_TRACK)
+        return Toc(first, starts, leadout, audio)
+
+    def read_audio(self, lba, frames, view):
+        """Reads `frames` raw audio frames starting at `lba` into `view` (a writable memoryview)."""
+        target = (ctypes.c_char * (frames * FRAME_BYTES)).from_buffer(view)
+        try:
+            request = _ReadAudio(lba, CDROM_LBA, frames, ctypes.addressof(target))
+            fcntl.ioctl(self.fd, CDROMREADAUDIO, request)
+        finally:
+            del target
+
+    def stop(self):
+        """Stops the motor, the next read spins the disc up again."""
+        fcntl.ioctl(self.fd, CDROMSTOP)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class TocCache:
+    """
+    Tables of contents and the last played track per disc ID, stored as
+    compact JSON like the station index.
+    """
+
+    def __init__(self, path=TOC_CACHE_PATH, max_discs=100):
+        self.path = path
+        self.max_discs = max_discs
+        self.discs = {}          # disc ID -> {"toc": ..., "track": ..., "used": ...}
+        self.current = None      # Toc of the disc in the drive
+        self.reads = 0           # TOCs read from a disc
+        self.hits = 0            # TOCs of a known disc taken from the cache
+
+    @classmethod
+    def load(cls, path=TOC_CACHE_PATH, **kwargs):
+        cache = cls(path, **kwargs)
+        try:
+            with open(path) as f:
+                cache.discs = json.load(f)["discs"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring broken CD cache {path}: {e}")
+        return cache
+
+    def save(self):
+        if len(self.discs) > self.max_discs:
+            keep = sorted(self.discs, key=lambda disc_id: self.discs[disc_id]["used"])[-self.max_discs:]
+            self.discs = {disc_id: self.discs[disc_id] for disc_id in keep}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"discs": self.discs}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def toc(self, drive):
+        """
+        The Toc of the disc in `drive`. Until the drive reports a media
+        change the current one is returned. A disc that was seen before is
+        recognized by its track numbers and lead-out and its Toc comes from
+        the cache, only a new disc is read track by track.
+        """
+        if self.current is not None and not drive.media_changed():
+            return self.current
+        toc = self._cached(*drive.read_toc_summary())
+        if toc is None:
+            toc = drive.read_toc()
+            self.reads += 1
+        else:
+            self.hits += 1
+        entry = self.discs.get(toc.disc_id)
+        if entry is None:
+            entry = self.discs[toc.disc_id] = {"toc": toc.to_json(), "track": None}
+        entry["used"] = int(time.time())
+        self.current = toc
+        return toc
+
+    def _cached(self, first, last, leadout):
+        """The stored Toc with these track numbers and lead-out, None if there is none."""
+        for entry in self.discs.values():
+            data = entry["toc"]
+            if (data["first"], data["first"] + len(data["starts"]) - 1, data["leadout"]) == (first, last, leadout):
+                return Toc.from_json(data)
+        return None
+
+    def last_track(self, toc):
+        entry = self.discs.get(toc.disc_id)
+        track = entry and entry.get("track")
+        return track if track in toc.tracks else None
+
+    def remember(self, toc, track):
+        """Stores the track to resume with and saves the cache."""
+        entry = self.discs.setdefault(toc.disc_id, {"toc": toc.to_json()})
+        entry["track"] = track
+        entry["used"] = int(time.time())
+        self.save()
+
+
+class RipCache:
+    """
+    Ripped tracks as raw CD audio, `<directory>/<disc ID>/<track>.cdda`.
+    A file can be partial, it is only ever appended to, so its length is
+    how much of the track was ripped. Whole discs are evicted, the least
+    recently played first (the modification time of their directory).
+    """
+
+    def __init__(self, directory=RIP_CACHE_DIR, max_bytes=RIP_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._sizes = {}         # (disc ID, track) -> bytes ripped
+        self._used = {}          # disc ID -> time it was last played
+        self.total_bytes = 0
+        self.evicted = 0
+        try:
+            for disc in os.scandir(directory):
+                if not disc.is_dir():
+                    continue
+                self._used[disc.name] = disc.stat().st_mtime
+                for entry in os.scandir(disc.path):
+                    track, ext = os.path.splitext(entry.name)
+                    if ext == ".cdda" and track.isdigit():
+                        self._sizes[(disc.name, int(track))] = self._frame_aligned(entry)
+        except FileNotFoundError:
+            pass
+        self.total_bytes = sum(self._sizes.values())
+
+    @staticmethod
+    def _frame_aligned(entry):
+        """Size of a track file, a frame that was cut off (power loss while ripping) is removed."""
+        size = entry.stat().st_size
+        if size % FRAME_BYTES:
+            size -= size % FRAME_BYTES
+            os.truncate(entry.path, size)
+        return size
+
+    def _path(self, disc_id, track):
+        return os.path.join(self.directory, disc_id, f"{track:02d}.cdda")
+
+    def ripped_bytes(self, disc_id, track):
+        return self._sizes.get((disc_id, track), 0)
+
+    def complete(self, toc):
+        return all(self.ripped_bytes(toc.disc_id, track) >= toc.track_bytes(track) for track in toc.tracks)
+
+    def touch(self, disc_id):
+        """Marks the disc as just played, it is evicted last."""
+        path = os.path.join(self.directory, disc_id)
+        os.makedirs(path, exist_ok=True)
+        os.utime(path)
+        self._used[disc_id] = time.time()
+
+    def read(self, disc_id, track, offset, view):
+        """Reads ripped audio of `track` from byte `offset` into `view`. Returns the bytes read."""
+        with open(self._path(disc_id, track), "rb", buffering=0) as f:
+            f.seek(offset)
+            return f.readinto(view)
+
+    def append(self, disc_id, track, offset, data):
+        """
+        Adds audio that was read from the disc if it continues the track
+        file. Other discs are evicted if the cache gets too large.
+
+        Returns:
+            bool: False if the data wasn't stored (not contiguous or no room).
+        """
+        if offset != self.ripped_bytes(disc_id, track):
+            return False
+        if self.total_bytes + len(data) > self.max_bytes and not self._evict(len(data), keep=disc_id):
+            return False
+        with open(self._path(disc_id, track), "ab") as f:
+            f.write(data)
+        self._sizes[(disc_id, track)] = offset + len(data)
+        self.total_bytes += len(data)
+        return True
+
+    def _evict(self, needed, keep):
+        for disc_id in sorted(self._used, key=self._used.get):
+            if self.total_bytes + needed <= self.max_bytes:
+                break
+            if disc_id == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, disc_id), ignore_errors=True)
+            for key in [key for key in self._sizes if key[0] == disc_id]:
+                self.total_bytes -= self._sizes.pop(key)
+            del self._used[disc_id]
+            self.evicted += 1
+            _log.info("rip cache: evicted disc %s", disc_id)
+        return self.total_bytes + needed <= self.max_bytes
+
+
+class TrackBuffer:
+    """
+    Audio of one track in memory. `data` holds the whole track, or for a
+    track larger than the budget a window that is used as a ring: byte
+    `offset` of the track is at `offset % len(data)`.
+    """
+
+    __slots__ = ("track", "size", "data", "filled", "epoch", "refilling")
+
+    def __init__(self, track, size, capacity):
+        self.track = track
+        self.size = size
+        capacity = max(FRAME_BYTES * FRAMES_PER_SECOND, capacity // FRAME_BYTES * FRAME_BYTES)
+        self.data = bytearray(min(size, capacity))
+        self.filled = 0          # track bytes read so far
+        self.epoch = 0           # incremented by reset(), a read started before is discarded
+        self.refilling = False   # a burst is running, it goes on until the window is full
+
+    @property
+    def complete(self):
+        return self.filled >= self.size
+
+    @property
+    def windowed(self):
+        return len(self.data) < self.size
+
+    def holds(self, offset):
+        """True if byte `offset` of the track is (or will be) in the buffer without a reset."""
+        return offset >= self.filled - len(self.data)
+
+    def reset(self, offset):
+        self.filled = offset // FRAME_BYTES * FRAME_BYTES
+        self.epoch += 1
+        self.refilling = False
+
+
+class CdPlayer:
+    """Plays the audio tracks of a CD from read-ahead buffers, see the module docstring."""
+
+    def __init__(self, drive, open_output, cache=None, max_buffer_bytes=160 * 1024 * 1024,
+                 read_ahead_tracks=READ_AHEAD_TRACKS, read_frames=FRAMES_PER_SECOND,
+                 period_frames=1024, rip_cache=None):
+        """
+        Args:
+            drive: A CdromDrive (or the simulated one from hal.open_cdrom()).
+            open_output (function): Returns a playback device (write(), close()),
+                                    called when playback starts.
+            cache (TocCache): Where the TOC and the last track are kept.
+            max_buffer_bytes (int): Memory for the read-ahead (10 MiB are about a minute).
+            read_ahead_tracks (int): Tracks after the current one that are read ahead.
+            read_frames (int): CD frames per read.
+            period_frames (int): Audio frames per write to the output.
+            rip_cache (RipCache): Where tracks are ripped to and read from, None
+                                  to always read the disc.
+        """
+        self.drive = drive
+        self.open_output = open_output
+        self.cache = cache or TocCache()
+        self.max_buffer_bytes = max_buffer_bytes
+        self.read_ahead_tracks = read_ahead_tracks
+        self.read_frames = read_frames
+        self.chunk_bytes = period_frames * 4
+        self.toc = self.cache.toc(drive)
+        self.rip_cache = rip_cache
+        self._ripping = rip_cache is not None
+        if rip_cache:
+            rip_cache.touch(self.toc.disc_id)
+        self._scratch = bytearray(read_frames * FRAME_BYTES)  # for ripping what isn't buffered
+
+        self.track = None
+        self.position = 0        # bytes of the current track that were handed to the output
+        self.playing = False
+        self.paused = False
+        self._buffers = {}       # track -> TrackBuffer
+        self._generation = 0     # incremented on every jump, a write started before doesn't move position
+        self._lock = threading.Lock()
+        self._data = threading.Condition(self._lock)   # the playback thread waits here
+        self._work = threading.Condition(self._lock)   # the reader waits here
+        self._spun_down = True
+        self._closed = False
+        self._threads = []
+
+        self.bytes_read = 0
+        self.bytes_from_cache = 0
+        self.read_errors = 0
+        self.spin_downs = 0
+        self.underruns = 0
+
+    def start(self):
+        for target, name in ((self._read_loop, "cd-read"), (self._play_loop, "cd-play")):
+            thread = threading.Thread(target=target, daemon=True, name=name)
+            thread.start()
+            self._threads.append(thread)
+
+    def play(self, track=None):
+        """Plays `track`, the last played track of this disc (or the first) if None."""
+        tracks = self.toc.tracks
+        if not tracks:
+            raise OSError(errno.ENOMEDIUM, "no audio tracks on the disc")
+        if track not in tracks:
+            track = self.cache.last_track(self.toc) or tracks[0]
+        with self._lock:
+            self.playing = True
+            self.paused = False
+            self._jump(track, 0)
+        return track
+
+    def next(self):
+        """Jumps to the next track, instantly if it was read ahead. Returns the track, None at the end."""
+        with self._lock:
+            track = self.toc.next_track(self.track) if self.track is not None else None
+            if track is not None:
+                self._jump(track, 0)
+            return track
+
+    def previous(self):
+        """Restarts the track, or jumps to the previous one within the first PREVIOUS_RESTART_S."""
+        with self._lock:
+            if self.track is None:
+                return None
+            track = self.track
+            if self.position < PREVIOUS_RESTART_S * BYTES_PER_SECOND:
+                track = self.toc.previous_track(self.track) or self.track
+            self._jump(track, 0)
+            return track
+
+    def pause(self):
+        with self._lock:
+            self.paused = not self.paused
+            self._data.notify_all()
+            return self.paused
+
+    def stop(self):
+        """Stops playback and remembers the track, the buffers are kept."""
+        with self._lock:
+            self.playing = False
+            self._data.notify_all()
+            track = self.track
+        if track is not None:
+            try:
+                self.cache.remember(self.toc, track)
+            except OSError as e:
+                _log.warning("CD cache not saved: %s", e)
+
+    def close(self):
+        """Stops playback and both threads, releases the buffers and the drive."""
+        self.stop()
+        with self._lock:
+            self._closed = True
+            self._data.notify_all()
+            self._work.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._buffers = {}
+        if not self._spun_down:
+            self._spin_down()
+        self.drive.close()
+
+    @property
+    def buffered_tracks(self):
+        with self._lock:
+            return sorted(track for track, buffer in self._buffers.items() if buffer.complete)
+
+    def stats(self):
+        with self._lock:
+            buffered = sum(len(buffer.data) for buffer in self._buffers.values())
+        return {"track": self.track, "buffered_mb": round(buffered / 1024 / 1024, 1),
+                "read_mb": round(self.bytes_read / 1024 / 1024, 1),
+                "cache_mb": round(self.bytes_from_cache / 1024 / 1024, 1), "read_errors": self.read_errors,
+                "spin_downs": self.spin_downs, "underruns": self.underruns}
+
+    # --- under the lock ---
+    def _jump(self, track, position):
+        self.track = track
+        self.position = position
+        self._generation += 1
+        buffer = self._buffers.get(track)
+        if buffer is not None and not buffer.holds(position):
+            buffer.reset(position)  # a window that has moved on, read again from here
+        self._data.notify_all()
+        self._work.notify_all()
+
+    def _wanted(self):
+        """Tracks that should be in memory, most important first."""
+        tracks = self.toc.tracks
+        if self.track not in tracks:
+            return []
+        i = tracks.index(self.track)
+        wanted = tracks[i:i + 1 + self.read_ahead_tracks]
+        if i > 0:
+            wanted.append(tracks[i - 1])
+        return wanted
+
+    def _next_read(self):
+        """
+        The next job of the reader, None if there's nothing to do:
+        ("allocate", track), ("read", buffer, first byte, frames) or
+        ("rip", track, first byte, frames).
+        """
+        if self._closed or not self.playing:
+            return None
+        wanted = self._wanted()
+        used = 0
+        for track in wanted:
+            buffer = self._buffers.get(track)
+            if buffer is None:
+                if track != self.track and self.max_buffer_bytes - used < MIN_WINDOW_BYTES:
+                    break  # no room left for the read-ahead
+                return "allocate", track
+            used += len(buffer.data)
+            if buffer.complete:
+                continue
+            start = buffer.filled
+            capacity = len(buffer.data)
+            played = self.position if track == self.track else 0
+            room = capacity - (start - played)
+            if buffer.windowed and not buffer.refilling and room < min(capacity // 2, buffer.size - start):
+                continue  # the window is refilled in bursts, the drive can sleep in between
+            frames = min(self.read_frames, (buffer.size - start) // FRAME_BYTES,
+                         room // FRAME_BYTES, (capacity - start % capacity) // FRAME_BYTES)
+            if frames > 0:
+                buffer.refilling = True
+                return "read", buffer, start, frames
+            buffer.refilling = False
+        return self._next_rip()
+
+    def _next_rip(self):
+        """Rips the rest of the disc (from the current track on) after the read-ahead."""
+        if not self._ripping:
+            return None
+        tracks = self.toc.tracks
+        i = tracks.index(self.track)
+        for track in tracks[i:] + tracks[:i]:
+            start = self.rip_cache.ripped_bytes(self.toc.disc_id, track)
+            remaining = (self.toc.track_bytes(track) - start) // FRAME_BYTES
+            if remaining > 0:
+                return "rip", track, start, min(self.read_frames, remaining)
+        return None
+
+    def _make_room(self, track):
+        """
+        Drops buffers that aren't wanted, then those less wanted than `track`,
+        until it fits. Returns the capacity for its buffer, less than the
+        track for a window.
+        """
+        wanted = self._wanted()
+        size = self.toc.track_bytes(track)
+        if size > self.max_buffer_bytes:
+            size = self.max_buffer_bytes // 2  # a window, the other half stays for the read-ahead
+        less_wanted = wanted[wanted.index(track) + 1:] if track in wanted else []
+        candidates = ([t for t in self._buffers if t not in wanted]
+                      + [t for t in reversed(less_wanted) if t in self._buffers])
+        used = sum(len(buffer.data) for buffer in self._buffers.values())
+        for old in candidates:
+            if used + size <= self.max_buffer_bytes:
+                break
+            used -= len(self._buffers.pop(old).data)
+        return min(size, self.max_buffer_bytes - used)
+
+    # --- threads ---
+    def _read_loop(self):
+        while True:
+            with self._lock:
+                job = self._next_read()
+                if job is None and self._spun_down:
+                    self._work.wait_for(lambda: self._closed or self._next_read() is not None)
+                    job = self._next_read()
+                if self._closed:
+                    return
+                if job is not None and job[0] == "allocate":
+                    track = job[1]
+                    size = self.toc.track_bytes(track)
+                    capacity = self._make_room(track)
+            if job is None:
+                self._spin_down()
+                continue
+            if job[0] == "allocate":
+                # allocating (and zeroing) a track takes a while, not under the lock
+                buffer = TrackBuffer(track, size, capacity)
+                with self._lock:
+                    if track in self._wanted():
+                        self._buffers[track] = buffer
+            elif job[0] == "read":
+                self._read(*job[1:])
+            else:
+                self._rip(*job[1:])
+
+    def _read(self, buffer, start, frames):
+        epoch = buffer.epoch
+        offset = start % len(buffer.data)
+        size = frames * FRAME_BYTES
+        with memoryview(buffer.data) as view:
+            target = view[offset:offset + size]
+            if not self._read_ripped(buffer.track, start, target):
+                if not self._read_disc(buffer.track, start, frames, target):
+                    return
+                self._store(buffer.track, start, target)
+        with self._lock:
+            if buffer.epoch == epoch:
+                buffer.filled = start + frames * FRAME_BYTES
+                if buffer.track == self.track:
+                    self._data.notify_all()
+
+    def _rip(self, track, start, frames):
+        with memoryview(self._scratch) as view:
+            target = view[:frames * FRAME_BYTES]
+            if self._read_disc(track, start, frames, target) and not self._store(track, start, target):
+                self._ripping = False  # the cache is full with this disc alone
+                _log.info("rip cache full, disc %s only partly ripped", self.toc.disc_id)
+
+    def _read_ripped(self, track, start, target):
+        if not self.rip_cache or self.rip_cache.ripped_bytes(self.toc.disc_id, track) < start + len(target):
+            return False
+        try:
+            if self.rip_cache.read(self.toc.disc_id, track, start, target) == len(target):
+                self.bytes_from_cache += len(target)
+                return True
+        except OSError as e:
+            _log.warning("rip cache not readable, reading the disc: %s", e)
+        return False
+
+    def _read_disc(self, track, start, frames, target):
+        """Reads from the drive with retries. Returns False if the disc is gone."""
+        lba = self.toc.frames(track)[0] + start // FRAME_BYTES
+        for attempt in range(3):
+            try:
+                self.drive.read_audio(lba, frames, target)
+                break
+            except OSError as e:
+                if e.errno in (errno.ENOMEDIUM, errno.ENXIO):
+                    _log.warning("disc removed, CD playback stopped")
+                    with self._lock:
+                        self.playing = False
+                        self._data.notify_all()
+                    self._spun_down = True
+                    return False
+                self.read_errors += 1
+                if attempt == 2:
+                    # a scratch: play silence instead of getting stuck
+                    _log.warning("unreadable frames %d-%d of track %d: %s", start // FRAME_BYTES,
+                                 start // FRAME_BYTES + frames, track, e)
+                    target[:] = bytes(len(target))
+        self._spun_down = False
+        self.bytes_read += len(target)
+        return True
+
+    def _store(self, track, start, data):
+        if not self._ripping:
+            return False
+        try:
+            return self.rip_cache.append(self.toc.disc_id, track, start, data)
+        except OSError as e:
+            _log.warning("ripping stopped: %s", e)
+            self._ripping = False
+            return False
+
+    def _spin_down(self):
+        try:
+            self.drive.stop()
+            self.spin_downs += 1
+            _log.debug("read ahead done (%s MiB buffered), drive stopped", self.stats()["buffered_mb"])
+        except OSError as e:
+            _log.warning("CDROMSTOP failed: %s", e)
+        self._spun_down = True
+
+    def _playable(self):
+        if self._closed or not self.playing or self.paused:
+            return False
+        buffer = self._buffers.get(self.track)
+        return buffer is not None and (buffer.filled > self.position or self.position >= buffer.size)
+
+    def _play_loop(self):
+        output = None
+        while True:
+            with self._lock:
+                if not self._playable():
+                    if output is not None and not self.playing:
+                        output.close()
+                        output = None
+                    if self.playing and not self.paused:
+                        self.underruns += 1 if self.position else 0
+                    self._data.wait_for(lambda: self._closed or self._playable())
+                    if self._closed:
+                        break
+                buffer = self._buffers[self.track]
+                if self.position >= buffer.size:
+                    track = self.toc.next_track(self.track)
+                    if track is None:
+                        self.playing = False
+                        self.track = self.toc.tracks[0]  # the next play() starts from the beginning
+                    else:
+                        self._jump(track, 0)  # gapless
+                    continue
+                start = self.position
+                capacity = len(buffer.data)
+                end = min(buffer.filled, start + self.chunk_bytes, start - start % capacity + capacity)
+                chunk = bytes(buffer.data[start % capacity:start % capacity + end - start])
+                generation = self._generation
+            if output is None:
+                output = self.open_output()
+            output.write(chunk)
+            with self._lock:
+                if generation == self._generation:
+                    self.position = end
+                    if buffer.windowed and buffer.filled - end <= len(buffer.data) // 2:
+                        self._work.notify_all()  # half of the window played, time for the next burst
+        if output is not None:
+            output.close()
+
+
+class VlcRemote:
+    """
+    cvlc playing the disc, controlled through one persistent connection to
+    its rc socket (instead of an `nc -U` per command).
+    """
+
+    def __init__(self, device="/dev/sr0", socket_path=VLC_SOCKET, caching_ms=20000):
+        """
+        Args:
+            caching_ms (int): VLC's disc read-ahead.
+        """
+        self.device = device
+        self.socket_path = socket_path
+        self.caching_ms = caching_ms
+        self.proc = None
+        self._sock = None
+
+    def start(self, track=None, timeout_s=5.0):
+        args = ["cvlc", "--intf", "rc", "--rc-unix", self.socket_path, "--rc-fake-tty",
+                f"--disc-caching={self.caching_ms}", f"cdda://{self.device}"]
+        if track:
+            args.append(f"--cdda-track={track}")
+        self.proc = hal.popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, start_new_session=True)
+        deadline = time.monotonic() + timeout_s
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
+            try:
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise OSError(f"vlc rc socket {self.socket_path} not available")
+                time.sleep(0.05)
+        sock.setblocking(False)
+        self._sock = sock
+
+    def command(self, command):
+        """Sends one rc command, answers are read and dropped."""
+        if self._sock is None:
+            raise OSError("vlc is not running")
+        self._drain()
+        self._sock.sendall(f"{command}\n".encode())
+
+    def _drain(self):
+        try:
+            while self._sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def next(self):
+        self.command("next")
+
+    def previous(self):
+        self.command("prev")
+
+    def pause(self):
+        self.command("pause")
+
+    def stop(self):
+        if self._sock is not None:
+            try:
+                self.command("shutdown")
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        if self.proc is not None:
+            try:
+                self.proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.proc = None
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ("toc", "play"):
+        print("Usage: python3 cd.py toc | play [track]")
+        sys.exit(1)
+
+    cache = TocCache.load()
+    drive = hal.open_cdrom()
+    toc = cache.toc(drive)
+    if sys.argv[1] == "toc":
+        print(toc)
+        for track in toc.tracks:
+            lba, frames = toc.frames(track)
+            print(f"{track:2d}  lba {lba:6d}  {frames // FRAMES_PER_SECOND // 60:2d}:{frames // FRAMES_PER_SECOND % 60:02d}")
+        drive.close()
+    else:
+        player = CdPlayer(drive, lambda: hal.open_playback("default", period_frames=1024), cache,
+                          rip_cache=RipCache() if RIP_CACHE_MAX_MB else None)
+        player.start()
+        print("Track", player.play(int(sys.argv[2]) if len(sys.argv) > 2 else None))
+        print("n = next, p = previous, space = pause, q = quit (each followed by Enter)")
+        try:
+            for line in sys.stdin:
+                key = line.rstrip("\n")[:1]
+                if key == "q":
+                    break
+                elif key == "n":
+                    print("Track", player.next())
+                elif key == "p":
+                    print("Track", player.previous())
+                elif key == " ":
+                    print("paused" if player.pause() else "playing")
+                print(player.stats())
+        except KeyboardInterrupt:
+            pass
+        player.close()
@@ -0,0 +1,280 @@
+import array
+import hashlib
+import math
+import mmap
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+from passthrough import SAMPLE_BYTES
+
+CUE_CACHE_DIR = os.path.expanduser("~/.cache/rossis_roehren_radio/cues")
+
+
+def decode_to_pcm(source, target, rate=44100, channels=2):
+    """Decodes any file ffmpeg understands into raw S16_LE PCM at `target`."""
+    tmp = f"{target}.tmp"
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", str(source),
+                    "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(rate), "-ac", str(channels), tmp],
+                   check=True, stdin=subprocess.DEVNULL, capture_output=True)
+    os.replace(tmp, target)
+
+
+class CueCache:
+    """
+    Decoded sound files on disk, so a cue is decoded (with ffmpeg) only once.
+
+    The cache file name contains a hash of the source path, size and mtime and
+    of the output format, a changed source file is decoded again. Cached files
+    are memory-mapped, nothing is read before it's played.
+    """
+
+    def __init__(self, directory=CUE_CACHE_DIR, rate=44100, channels=2):
+        self.directory = directory
+        self.rate = rate
+        self.channels = channels
+
+    def path_for(self, source):
+        st = os.stat(source)
+        key = f"{os.path.abspath(source)}:{st.st_size}:{st.st_mtime_ns}:{self.rate}:{self.channels}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.directory, f"{name}-{digest}.s16le")
+
+    def load(self, source):
+        """
+        Returns the decoded PCM of `source` as a read-only mmap (decoding it first
+        if it isn't cached yet).
+
+        Raises:
+            OSError: If the source doesn't exist or ffmpeg isn't installed.
+            subprocess.CalledProcessError: If ffmpeg can't decode the file.
+        """
+        path = self.path_for(source)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            start = time.monotonic()
+            decode_to_pcm(source, path, self.rate, self.channels)
+            print(f"Decoded {source} in {time.monotonic() - start:.2f}s")
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def tone(segments, rate=44100, channels=2, amplitude=0.3, fade_ms=5):
+    """
+    Builds a short synthetic cue.
+
+    Args:
+        segments (list[tuple[float, float]]): (frequency in Hz, duration in ms), 0 Hz is a pause.
+        amplitude (float): Peak level relative to full scale.
+        fade_ms (float): Fade in/out of every segment, avoids clicks.
+
+    Returns:
+        bytes: S16_LE PCM.
+    """
+    samples = array.array("h")
+    peak = int(32767 * amplitude)
+    fade = max(1, int(rate * fade_ms / 1000))
+    for freq, duration_ms in segments:
+        count = int(rate * duration_ms / 1000)
+        for i in range(count):
+            gain = min(1.0, i / fade, (count - i) / fade)
+            value = int(peak * gain * math.sin(2 * math.pi * freq * i / rate)) if freq else 0
+            samples.extend([value] * channels)
+    return samples.tobytes()
+
+
+# short feedback sounds, generated at startup (a few ms of CPU)
+SYNTHETIC_CUES = {
+    "mode_switch": [(880, 40), (0, 20), (1320, 50)],
+    "volume_limit": [(330, 35), (0, 25), (330, 35)],
+}
+
+
+class CuePlayer:
+    """
+    Plays short sounds (intro, feedback cues) from memory.
+
+    All cues are PCM in the output format, held as bytes or mmaps. A worker
+    thread writes them period by period to an output that stays open between
+    cues, so a cue starts without opening a device or starting a process. The
+    output is closed after `hold_s` seconds without a cue, or by release(),
+    so the capabilities can have the sound card.
+
+    A new cue interrupts the one that is playing.
+    """
+
+    def __init__(self, open_output, period_frames=512, hold_s=2.0, on_start=None, history=64):
+        """
+        Args:
+            open_output (function): Returns a new output, e.g. AlsaPlayback or
+                                    NullPlayback (write(), close(), rate, channels).
+            period_frames (int): Frames per write.
+            hold_s (float): How long the output is kept open after the last cue.
+            on_start (function): Called with the cue name once its first period
+                                 was written to the output.
+            history (int): Number of start latency samples kept.
+        """
+        self.open_output = open_output
+        self.period_frames = period_frames
+        self.hold_s = hold_s
+        self.on_start = on_start
+
+        self.cues = {}
+        self._cond = threading.Condition()
+        self._pending = None
+        self._playing = None
+        self._release = False
+        self._release_deadline = 0.0
+        self._output = None
+        self._running = False
+        self._thread = None
+
+        self.played = 0
+        self.interrupted = 0
+        self.opens = 0
+        self.start_latencies_ms = deque(maxlen=history)
+
+    def add(self, name, pcm):
+        """Registers a cue, `pcm` is S16_LE in the output format (bytes or mmap)."""
+        self.cues[name] = pcm
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._play_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the worker, a playing cue is cut off. Closes the output and mmaps."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for pcm in self.cues.values():
+            if isinstance(pcm, mmap.mmap):
+                pcm.close()
+        self.cues = {}
+
+    def play(self, name):
+        """Queues cue `name`, returns immediately. Unknown names are ignored."""
+        if name not in self.cues:
+            return
+        with self._cond:
+            self._pending = (name, time.monotonic_ns())
+            self._cond.notify_all()
+
+    def release(self, timeout_s=0.3):
+        """
+        Lets the playing cue finish, cuts it off after `timeout_s`, and closes
+        the output. Returns once the output is closed.
+        """
+        with self._cond:
+            self._release = True
+            self._release_deadline = time.monotonic() + timeout_s
+            self._cond.notify_all()
+            # one more period may have to be written before the cut is noticed
+            return self._cond.wait_for(lambda: (self._output is None and self._pending is None and
+                                                self._playing is None) or not self._running,
+                                       timeout_s + 0.5)
+
+    def wait_idle(self, timeout_s=None):
+        """Waits until no cue is pending or playing."""
+        with self._cond:
+            return self._cond.wait_for(lambda: (self._pending is None and self._playing is None)
+                                       or not self._running, timeout_s)
+
+    def _play_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._release or not self._running,
+                                    self.hold_s if self._output else None)
+                if not self._running:
+                    break
+                if not self._pending:
+                    # released, or nothing to play for hold_s
+                    self._close_output()
+                    continue
+                (name, queued_ns), self._pending = self._pending, None
+                self._playing = name
+            try:
+                self._play(name, queued_ns)
+            except Exception as e:
+                print(f"Playing cue {name} failed: {e}")
+                with self._cond:
+                    self._close_output()
+            with self._cond:
+                self._playing = None
+                self._cond.notify_all()
+        with self._cond:
+            self._close_output()
+
+    def _play(self, name, queued_ns):
+        if self._output is None:
+            self._output = self.open_output()
+            self.opens += 1
+        output = self._output
+        pcm = memoryview(self.cues[name])
+        period_bytes = self.period_frames * output.channels * SAMPLE_BYTES
+        for offset in range(0, len(pcm), period_bytes):
+            if (self._pending or not self._running or
+                    (self._release and time.monotonic() > self._release_deadline)):
+                self.interrupted += 1
+                return
+            chunk = pcm[offset:offset + period_bytes]
+            if len(chunk) < period_bytes:
+                chunk = bytes(chunk) + bytes(period_bytes - len(chunk))
+            output.write(chunk)
+            if offset == 0:
+                self.start_latencies_ms.append((time.monotonic_ns() - queued_ns) / 1e6)
+                if self.on_start:
+                    self.on_start(name)
+        self.played += 1
+
+    def _close_output(self):
+        # called with self._cond held
+        self._release = False
+        if self._output is not None:
+            try:
+                self._output.close()
+            except Exception as e:
+                print(f"Closing the cue output failed: {e}")
+            self._output = None
+        self._cond.notify_all()
+
+
+def alsa_cue_player(device="default", rate=44100, channels=2, period_frames=512, periods=4, **kwargs):
+    """A CuePlayer on an ALSA playback device (needs pyalsaaudio), with the synthetic cues added."""
+    import hal
+    if not hal.pcm_available():
+        raise ImportError("pyalsaaudio is not installed")  # fail here, not on the first cue
+    player = CuePlayer(lambda: hal.open_playback(device, rate, channels, period_frames, periods),
+                       period_frames=period_frames, **kwargs)
+    for name, segments in SYNTHETIC_CUES.items():
+        player.add(name, tone(segments, rate, channels))
+    return player
+
+
+if __name__ == "__main__":
+    import sys
+
+    player = alsa_cue_player()
+    if len(sys.argv) > 1:
+        player.add("file", CueCache().load(sys.argv[1]))
+    player.start()
+    try:
+        for name in list(player.cues):
+            print("playing", name)
+            player.play(name)
+            time.sleep(0.05)
+            player.wait_idle()
+            time.sleep(0.3)
+    finally:
+        player.stop()
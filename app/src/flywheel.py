@@ -1,11 +1,131 @@
 # KI - wird schon tun was es soll
  
-import gpiod
 import threading
 import time
 from datetime import timedelta
-from gpiod.line import Direction, Bias, Edge
-from gpiod import LineSettings
+from hal import Direction, Bias, Edge, Value, LineSettings, EdgeEvent, request_lines
+from reactor import Wakeup
+
+# Quadrature decoding: state = (A sensed << 1) | B sensed, index = (previous << 2) | current.
+# Turning "A -> B" runs through 00 -> 10 -> 11 -> 01 -> 00, the other way backwards.
+# 0 means no change or an impossible jump (both sensors changed at once).
+QUADRATURE_STEPS = [
+    0, -1, 1, 0,
+    1, 0, 0, -1,
+    -1, 0, 0, 1,
+    0, 1, -1, 0,
+]
+
+class GlitchFilter:
+    """
+    Rejects implausible flywheel edges before they are decoded.
+
+    Switching the aux/USB port or power can induce short spikes on the hall
+    sensor lines. Every edge is checked in O(1):
+    - a minimum interval between two edges on the same line,
+    - outlier rejection: once a few intervals were seen, an interval much
+      shorter than the expected one would mean an impossible acceleration of
+      the wheel. The intervals are kept per line and edge polarity, i.e. they
+      are full periods of the magnet, so the duty cycle of a narrow magnet
+      (long gap, short pulse) doesn't look like an outlier in quadrature
+      mode. The expected interval is the rolling (exponentially smoothed)
+      one, or the last one if that was shorter, so a wheel that speeds up
+      isn't compared against the slower past. The allowed speed-up grows
+      with the interval, a slow wheel can gain a lot within one long period,
+    - suppression windows: for a while after suppress() (e.g. right after a
+      capability was switched) all edges are dropped.
+
+    All timestamps are CLOCK_MONOTONIC nanoseconds, like gpiod edge events.
+    """
+
+    def __init__(self, min_interval_s=0.005, outlier_ratio=0.2, smoothing=0.3,
+                 warmup_edges=3, reset_after_s=1.0, speedup_per_s=2.0):
+        """
+        Args:
+            min_interval_s (float): Edges closer than this on one line are dropped.
+            outlier_ratio (float): Drop intervals shorter than this fraction of the
+                                   expected interval. 0 disables the outlier check.
+            smoothing (float): Weight of a new interval in the rolling interval.
+            warmup_edges (int): Accepted intervals needed before outliers are checked.
+            reset_after_s (float): A longer pause resets the rolling model.
+            speedup_per_s (float): On top of outlier_ratio, the edge rate may get
+                                   1 + speedup_per_s * interval (in s) times faster.
+        """
+        self.min_interval_ns = int(min_interval_s * 1_000_000_000)
+        self.outlier_ratio = outlier_ratio
+        self.smoothing = smoothing
+        self.warmup_edges = warmup_edges
+        self.reset_after_ns = int(reset_after_s * 1_000_000_000)
+        self.speedup_per_ns = speedup_per_s / 1_000_000_000
+
+        self._last_ns = {}        # line -> timestamp of the last accepted edge
+        # (line, edge) -> [timestamp of the last accepted edge of that polarity, its interval,
+        #                  rolling interval, accepted intervals since the last reset]
+        self._models = {}
+        self._suppress_until_ns = 0
+
+        self.accepted = 0
+        self.rejected_min_interval = 0
+        self.rejected_outlier = 0
+        self.rejected_suppressed = 0
+
+    @property
+    def min_interval_s(self):
+        return self.min_interval_ns / 1_000_000_000.0
+
+    def accept(self, line, timestamp_ns, edge=None):
+        """
+        Returns True if the edge looks real. Updates the model with accepted edges only.
+
+        Args:
+            edge: Polarity of the edge (e.g. EdgeEvent.Type), None if a line
+                  only reports one polarity.
+        """
+        if timestamp_ns < self._suppress_until_ns:
+            self.rejected_suppressed += 1
+            return False
+
+        last_ns = self._last_ns.get(line)
+        if last_ns is not None and timestamp_ns - last_ns < self.min_interval_ns:
+            self.rejected_min_interval += 1
+            return False
+
+        model = self._models.get((line, edge))
+        if model is None:
+            self._models[(line, edge)] = [timestamp_ns, 0, 0, 0]
+        else:
+            edge_last_ns, last_interval, rolling, samples = model
+            interval = timestamp_ns - edge_last_ns
+            if interval > self.reset_after_ns:
+                model[3] = 0
+            else:
+                if samples >= self.warmup_edges:
+                    expected = min(rolling, last_interval)
+                    if interval < expected * self.outlier_ratio / (1 + self.speedup_per_ns * expected):
+                        self.rejected_outlier += 1
+                        return False
+                model[1] = interval
+                model[2] = interval if not samples else rolling + self.smoothing * (interval - rolling)
+                model[3] = samples + 1
+            model[0] = timestamp_ns
+
+        self._last_ns[line] = timestamp_ns
+        self.accepted += 1
+        return True
+
+    def suppress(self, duration_s):
+        """Drops all edges for the next `duration_s` seconds."""
+        self._suppress_until_ns = max(self._suppress_until_ns,
+                                      time.monotonic_ns() + int(duration_s * 1_000_000_000))
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected_min_interval": self.rejected_min_interval,
+            "rejected_outlier": self.rejected_outlier,
+            "rejected_suppressed": self.rejected_suppressed,
+        }
+
 
 class WheelControl:
     """
@@ -14,10 +134,20 @@ class WheelControl:
     
     It uses gpiod's edge detection and runs in a background thread, triggering a 
     callback function upon detecting a full sequence.
+
+    Two decoding modes:
+    - "pair": falling edges only, one reading per A -> B (or B -> A) pair,
+      reported when the second sensor fires.
+    - "quadrature": rising and falling edges of both sensors drive a
+      quadrature state machine. Every valid transition is reported right away
+      as one step with its direction (up to 4 steps per magnet), the speed
+      is a running estimate over the recent steps.
     """
     
     def __init__(self, pin_a, pin_b, callback, distance_m=0.02, timeout_s=1.0, 
-                 chip_name="/dev/gpiochip0", consumer="rotary_encoder"):
+                 chip_name="/dev/gpiochip0", consumer="rotary_encoder",
+                 mode="pair", magnets=1, circumference_m=None, speed_smoothing=0.5,
+                 glitch_filter=None, debounce_ms=0):
         """
         Initializes the Rotary Encoder monitor.
 
@@ -26,61 +156,97 @@ class WheelControl:
             pin_b (int): The GPIO pin number for the second sensor (e.g., "right").
             callback (function): A function to call when a full rotation is detected.
                                  It will be called with: 
-                                 callback(direction: str, speed_kmh: float)
-                                 - direction: "clockwise" or "counter-clockwise"
+                                 callback(direction: int, speed_kmh: float, timestamp_ns: int)
+                                 - direction: 1 (A -> B) or -1 (B -> A)
                                  - speed_kmh: Calculated speed in km/h.
+                                 - timestamp_ns: Kernel timestamp of the edge that
+                                   completed the measurement.
             distance_m (float): The distance between the two sensors in meters.
             timeout_s (float): Time in seconds to wait for the second sensor before
                                resetting the measurement.
             chip_name (str): The GPIO chip device path.
             consumer (str): A name for the consumer of the GPIO lines.
+            mode (str): "pair" (default) or "quadrature".
+            magnets (int): Magnets per revolution, used with circumference_m.
+            circumference_m (float): Circumference at the magnets. If set, a
+                               quadrature step is circumference / (4 * magnets),
+                               otherwise distance_m.
+            speed_smoothing (float): Weight of the newest step in the running speed
+                               estimate (1.0 = no smoothing).
+            glitch_filter (GlitchFilter): Filter every edge passes before decoding,
+                               a default GlitchFilter if not given.
+            debounce_ms (int): Kernel debounce period for both lines (0 = off).
         """
         if not callable(callback):
             raise TypeError("The provided callback must be a callable function.")
+        if mode not in ("pair", "quadrature"):
+            raise ValueError(f"Unknown wheel mode '{mode}', use 'pair' or 'quadrature'.")
             
         self.pin_a = pin_a
         self.pin_b = pin_b
         self.callback = callback
         self.distance_m = distance_m
-        self.timeout_td = timedelta(seconds=timeout_s)
+        self.timeout_s = timeout_s
+        self.timeout_ns = int(timeout_s * 1_000_000_000)
         self.chip_name = chip_name
         self.consumer = consumer
+        self.mode = mode
+        self.magnets = magnets
+        self.step_m = circumference_m / (4 * magnets) if circumference_m else distance_m
+        self.speed_smoothing = speed_smoothing
+        self.filter = glitch_filter if glitch_filter is not None else GlitchFilter()
+        self.debounce_period = timedelta(milliseconds=debounce_ms)
+        # callbacks per magnet passing both sensors, to scale per-callback effects
+        self.resolution = 4 if mode == "quadrature" else 1
         
         # Internal state
         self.lines = None
-        self.chip = None
         self.first_event_pin = None
         self.first_event_time_ns = 0
+
+        # quadrature state
+        self.quad_state = 0
+        self.last_step_ns = None
+        self.last_step_direction = 0
+        self.speed_mps = 0.0
+        self.invalid_transitions = 0
+
+        # edges read per line and monitor loop wakeups, read by the metrics
+        self.edge_counts = {pin_a: 0, pin_b: 0}
+        self.wakeups = 0
         
         # Threading control
         self._monitor_thread = None
         self._running = False
+        self._wakeup = Wakeup()
         
         self._setup_gpio()
 
     def _setup_gpio(self):
-        """Configures and requests the GPIO lines using gpiod."""
+        """Configures and requests the GPIO lines (through the hal package)."""
         try:
-            self.chip = gpiod.Chip(self.chip_name)
-            
             settings = LineSettings(
                 direction=Direction.INPUT,
                 bias=Bias.PULL_UP,
-                edge_detection=Edge.FALLING
+                edge_detection=Edge.BOTH if self.mode == "quadrature" else Edge.FALLING,
+                debounce_period=self.debounce_period
             )
             
-            self.lines = gpiod.request_lines(
-                path=self.chip_name,
+            self.lines = request_lines(
+                self.chip_name,
                 consumer=self.consumer,
                 config={
                     self.pin_a: settings,
                     self.pin_b: settings
                 }
             )
-            print("Encoder GPIO setup successful.")
+            if self.mode == "quadrature":
+                # a sensor that sees a magnet pulls its line low
+                a, b = self.lines.get_values([self.pin_a, self.pin_b])
+                self.quad_state = ((a is Value.INACTIVE) << 1) | (b is Value.INACTIVE)
+            print(f"Encoder GPIO setup successful ({self.mode} mode).")
         except Exception as e:
             print(f"Error setting up GPIO: {e}")
-            if self.chip: self.chip.close()
             raise
 
     def start(self):
@@ -88,84 +254,156 @@ class WheelControl:
         if self._running:
             print("Monitoring is already active.")
             return
-            
+        if self._wakeup is None:
+            raise RuntimeError("WheelControl was stopped, its GPIO lines are released")
+
         self._running = True
+        self._wakeup.clear()
         self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self._monitor_thread.start()
         print("Encoder monitoring started.")
 
     def stop(self):
         """Stops the monitoring thread and releases GPIO resources."""
-        if not self._running:
-            return
-            
+        if self._wakeup is None:
+            return  # already stopped (e.g. __exit__ after an explicit stop())
+
         self._running = False
+        # interrupts the edge wait, the lines are only released once the
+        # thread can't use them anymore
+        self._wakeup.set()
         if self._monitor_thread and self._monitor_thread.is_alive():
-            # The thread might be waiting on an edge, but we can just let it exit
-            # as the _running flag will be false on the next loop.
-            # joining with a small timeout is fine.
-            self._monitor_thread.join(timeout=0.1)
-            
+            self._monitor_thread.join()
+        self._monitor_thread = None
+
+        # also reached in reactor mode, where no thread was started
+
         if self.lines:
             self.lines.release()
             self.lines = None
-        if self.chip:
-            self.chip.close()
-            self.chip = None
+        if self._wakeup:
+            self._wakeup.close()
+            self._wakeup = None
         print("Encoder monitoring stopped and resources released.")
 
     def _monitor_loop(self):
         """The core loop that runs in a thread to watch for edge events."""
         while self._running:
-            # Wait for an edge event with a timeout
-            if self.lines.wait_edge_events(self.timeout_td):
-                events = self.lines.read_edge_events()
-                
-                for event in events:
-                    current_pin = event.line_offset
-                    current_time_ns = event.timestamp_ns
-                    
-                    # This is the FIRST event in a new measurement
-                    if self.first_event_pin is None:
-                        self.first_event_pin = current_pin
-                        self.first_event_time_ns = current_time_ns
-                    
-                    # This is the SECOND event from the OTHER sensor
-                    elif current_pin != self.first_event_pin:
-                        time_delta_ns = current_time_ns - self.first_event_time_ns
-                        time_delta_s = time_delta_ns / 1_000_000_000.0
-
-                        # sometimes some weird shit happens when doing sth with aux or usb port
-                        # (or power)
-                        MIN_PLAUSIBLE_TIME_S = 0.005 
-                        if time_delta_s < MIN_PLAUSIBLE_TIME_S:
-                            self.first_event_pin = None 
-                            continue
-                        elif time_delta_ns > 0:
-                            speed_mps = self.distance_m / time_delta_s
-                            speed_kmh = speed_mps * 3.6
-
-                            direction = "unknown"
-                            # Assuming A is "left" and B is "right"
-                            if self.first_event_pin == self.pin_a and current_pin == self.pin_b:
-                                direction = 1 # Or "forward", "right", etc.
-                            elif self.first_event_pin == self.pin_b and current_pin == self.pin_a:
-                                direction = -1 # Or "backward", "left", etc.
-                            
-                            # Trigger the user's callback function
-                            try:
-                                self.callback(direction, speed_kmh)
-                            except Exception as e:
-                                print(f"Error in user callback: {e}")
-                        
-                        # Reset for the next measurement
-                        self.first_event_pin = None
+            self.wakeups += 1
+            # Wait for an edge event (or a stop request) with a timeout
+            if self._wakeup.wait(self.lines.fd, self.timeout_s):
+                for event in self.lines.read_edge_events():
+                    self.handle_event(event)
             else:
-                # wait_edge_events timed out. If we were waiting for a second
+                # The wait timed out. If we were waiting for a second
                 # event, reset the measurement.
                 if self.first_event_pin is not None:
                     # print("Measurement timed out, resetting.")
                     self.first_event_pin = None
+                self.last_step_ns = None
+
+    def handle_event(self, event):
+        """Processes a single edge event, called by the monitor loop or a GpioReactor."""
+        self.edge_counts[event.line_offset] += 1
+        edge = event.event_type if self.mode == "quadrature" else None
+        if not self.filter.accept(event.line_offset, event.timestamp_ns, edge):
+            return
+        if self.mode == "quadrature":
+            self._handle_quadrature_event(event)
+        else:
+            self._handle_pair_event(event)
+
+    def _handle_quadrature_event(self, event):
+        sensed = event.event_type is EdgeEvent.Type.FALLING_EDGE
+        if event.line_offset == self.pin_a:
+            state = (self.quad_state & 0b01) | (sensed << 1)
+        else:
+            state = (self.quad_state & 0b10) | sensed
+
+        if state == self.quad_state:
+            return  # repeated edge, nothing moved
+        direction = QUADRATURE_STEPS[(self.quad_state << 2) | state]
+        self.quad_state = state
+        if direction == 0:
+            # both sensors changed between two events, we lost one
+            self.invalid_transitions += 1
+            self.last_step_ns = None
+            return
+
+        now_ns = event.timestamp_ns
+        if (self.last_step_ns is None or direction != self.last_step_direction or
+                now_ns - self.last_step_ns > self.timeout_ns):
+            # first step after a pause or a direction change, no interval to measure yet:
+            # assume it took the whole timeout
+            step_speed = self.step_m / (self.timeout_ns / 1_000_000_000.0)
+            self.speed_mps = step_speed
+        else:
+            dt_s = max(now_ns - self.last_step_ns, 1) / 1_000_000_000.0
+            step_speed = self.step_m / dt_s
+            self.speed_mps += self.speed_smoothing * (step_speed - self.speed_mps)
+        self.last_step_ns = now_ns
+        self.last_step_direction = direction
+
+        try:
+            self.callback(direction, self.speed_mps * 3.6, now_ns)
+        except Exception as e:
+            print(f"Error in user callback: {e}")
+
+    def _handle_pair_event(self, event):
+        current_pin = event.line_offset
+        current_time_ns = event.timestamp_ns
+
+        # Without our own wait timeout (reactor mode) a stale first event is
+        # only noticed when the next one arrives.
+        if (self.first_event_pin is not None and
+                current_time_ns - self.first_event_time_ns > self.timeout_ns):
+            self.first_event_pin = None
+
+        # This is the FIRST event in a new measurement
+        if self.first_event_pin is None:
+            self.first_event_pin = current_pin
+            self.first_event_time_ns = current_time_ns
+
+        # This is the SECOND event from the OTHER sensor
+        elif current_pin != self.first_event_pin:
+            time_delta_ns = current_time_ns - self.first_event_time_ns
+            time_delta_s = time_delta_ns / 1_000_000_000.0
+
+            # sometimes some weird shit happens when doing sth with aux or usb port
+            # (or power), see GlitchFilter
+            if time_delta_s < self.filter.min_interval_s:
+                self.first_event_pin = None 
+                return
+            elif time_delta_ns > 0:
+                speed_mps = self.distance_m / time_delta_s
+                speed_kmh = speed_mps * 3.6
+
+                direction = "unknown"
+                # Assuming A is "left" and B is "right"
+                if self.first_event_pin == self.pin_a and current_pin == self.pin_b:
+                    direction = 1 # Or "forward", "right", etc.
+                elif self.first_event_pin == self.pin_b and current_pin == self.pin_a:
+                    direction = -1 # Or "backward", "left", etc.
+                
+                # Trigger the user's callback function
+                try:
+                    self.callback(direction, speed_kmh, current_time_ns)
+                except Exception as e:
+                    print(f"Error in user callback: {e}")
+            
+            # Reset for the next measurement
+            self.first_event_pin = None
+
+    # --- GpioReactor source interface (see reactor.py) ---
+    def attach(self, reactor):
+        """Lets a GpioReactor deliver the edge events instead of the own thread."""
+        reactor.add_source(self)
+
+    def fileno(self):
+        return self.lines.fd
+
+    def read_events(self):
+        return self.lines.read_edge_events()
 
     # --- Context Manager Support for easy and safe usage ---
     def __enter__(self):
@@ -178,12 +416,13 @@ class WheelControl:
 # --- Example Usage ---
 if __name__ == "__main__":
     # Configuration
+    MODE = "pair"  # or "quadrature"
     SENSOR_A_PIN = 2  # Sensor for "left" or "A"
     SENSOR_B_PIN = 3  # Sensor for "right" or "B"
     SENSOR_DISTANCE_M = 0.02  # 5 cm distance
 
     # Define the callback function that the class will call
-    def handle_rotation(direction, speed_kmh):
+    def handle_rotation(direction, speed_kmh, timestamp_ns):
         """This function gets called by the RotaryEncoder class."""
         print("-" * 30)
         print(f"Direction Detected: {direction}")
@@ -196,7 +435,7 @@ if __name__ == "__main__":
     try:
         # Using the class as a context manager is the recommended way.
         # It automatically handles starting and stopping.
-        with WheelControl(SENSOR_A_PIN, SENSOR_B_PIN, handle_rotation, SENSOR_DISTANCE_M):
+        with WheelControl(SENSOR_A_PIN, SENSOR_B_PIN, handle_rotation, SENSOR_DISTANCE_M, mode=MODE):
             # The main thread can now do other things, or just wait.
             # The encoder monitoring happens in the background.
             while True:
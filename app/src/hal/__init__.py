@@ -0,0 +1,143 @@
+"""
+Hardware abstraction layer: everything that touches GPIO, I2C, ALSA, D-Bus
+or starts processes goes through here.
+
+The backend is chosen once, by the RRR_HAL environment variable, before the
+first import:
+- "real" (default): gpiod, smbus2, pyalsaaudio, jeepney, the CDROM ioctls
+  and subprocess.
+- "sim": simulated GPIO lines with edge injection (sim_gpio), a fake TEA5767
+  (sim_radio), a fake mixer and capture device (sim_audio), a CD drive with
+  a fake disc (sim_cdrom) and a process runner that replaces every command
+  with `sleep` (sim_process). The whole
+  MainController runs on a plain Linux box this way:
+
+      RRR_HAL=sim python main.py
+
+The optional dependencies of the real backend are imported on first use, so
+a missing package only disables the part that needs it.
+"""
+
+import os
+import subprocess
+
+BACKEND = os.environ.get("RRR_HAL", "real")
+if BACKEND not in ("real", "sim"):
+    raise ImportError(f"Unknown RRR_HAL backend '{BACKEND}', use 'real' or 'sim'.")
+SIMULATED = BACKEND == "sim"
+
+# --- GPIO ---
+if SIMULATED:
+    from hal.sim_gpio import Direction, Bias, Edge, Value, EdgeEvent, LineSettings, request_lines
+else:
+    try:
+        from gpiod import EdgeEvent, LineSettings, request_lines
+        from gpiod.line import Direction, Bias, Edge, Value
+    except ImportError:
+        pass  # importing the GPIO names from hal fails, everything else works
+
+
+# --- I2C ---
+def check_i2c():
+    """Raises ImportError if there is no I2C backend (smbus2 missing)."""
+    if not SIMULATED:
+        import smbus2  # noqa: F401
+
+
+def open_i2c_bus(bus, address=0x60):
+    """Opens I2C bus number `bus`. `address` is only used to place the simulated tuner."""
+    if SIMULATED:
+        from hal import sim_radio
+        return sim_radio.open_bus(bus, address)
+    import smbus2
+    return smbus2.SMBus(bus)
+
+
+def i2c_write(address, data):
+    """A write transfer for i2c_rdwr()."""
+    if SIMULATED:
+        from hal.sim_radio import SimI2CMsg
+        return SimI2CMsg.write(address, data)
+    import smbus2
+    return smbus2.i2c_msg.write(address, data)
+
+
+def i2c_read(address, length):
+    """A read transfer for i2c_rdwr(), bytes(msg) is the data afterwards."""
+    if SIMULATED:
+        from hal.sim_radio import SimI2CMsg
+        return SimI2CMsg.read(address, length)
+    import smbus2
+    return smbus2.i2c_msg.read(address, length)
+
+
+# --- audio ---
+def open_mixer(control_name='Master'):
+    """The simulated mixer; the real backends are chosen by volume.open_volume_control()."""
+    if not SIMULATED:
+        raise RuntimeError("open_mixer() is only available with RRR_HAL=sim")
+    from hal import sim_audio
+    return sim_audio.mixer(control_name)
+
+
+def pcm_available():
+    """True if PCM devices can be opened in-process (pyalsaaudio installed or simulated)."""
+    if SIMULATED:
+        return True
+    try:
+        import alsaaudio  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def open_capture(device, rate=44100, channels=2, period_frames=256, periods=4):
+    if SIMULATED:
+        from hal.sim_audio import SimCapture
+        return SimCapture(device, rate, channels, period_frames, periods)
+    from passthrough import AlsaCapture
+    return AlsaCapture(device, rate, channels, period_frames, periods)
+
+
+def open_playback(device, rate=44100, channels=2, period_frames=256, periods=4):
+    if SIMULATED:
+        from passthrough import NullPlayback
+        return NullPlayback(None, rate, channels, period_frames, periods)
+    from passthrough import AlsaPlayback
+    return AlsaPlayback(device, rate, channels, period_frames, periods)
+
+
+# --- CD drive ---
+def open_cdrom(device="/dev/sr0"):
+    """A cd.CdromDrive, raises OSError if there is no drive."""
+    if SIMULATED:
+        from hal import sim_cdrom
+        return sim_cdrom.open_drive(device)
+    from cd import CdromDrive
+    return CdromDrive(device)
+
+
+# --- D-Bus ---
+def open_system_bus():
+    """A blocking jeepney connection to the system bus. Not available in the simulation."""
+    if SIMULATED:
+        raise OSError("no system D-Bus in the simulation")
+    from jeepney.io.blocking import open_dbus_connection
+    return open_dbus_connection(bus="SYSTEM")
+
+
+# --- processes ---
+def popen(args, **kwargs):
+    """subprocess.Popen, the simulation runs `sleep` instead (see sim_process)."""
+    if SIMULATED:
+        from hal.sim_process import runner
+        return runner.popen(args, **kwargs)
+    return subprocess.Popen(args, **kwargs)
+
+
+def run(args, **kwargs):
+    """subprocess.run, the simulation runs `sleep` instead (see sim_process)."""
+    if SIMULATED:
+        from hal.sim_process import runner
+        return runner.run(args, **kwargs)
+    return subprocess.run(args, **kwargs)
@@ -0,0 +1,58 @@
+"""
+Prints the flywheel sensor edges, to check the wiring, or records them into
+a trace file (see hal/trace.py) for tuning the wheel offline.
+
+Printing is slow, fast bursts are better recorded: the recorder keeps every
+edge with its kernel timestamp and only prints a line per flush.
+
+Usage (from the src folder):
+    python -m hal.probe [--pins 2 3] [--both]
+    python -m hal.probe --record wheel.rre [--pins 7 8] [--both]
+"""
+
+import argparse
+import signal
+
+from hal import Direction, Bias, Edge, LineSettings, request_lines
+from hal.trace import EdgeRecorder
+
+CHIP_NAME = "/dev/gpiochip0"
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--pins", type=int, nargs="+", default=[2, 3])
+parser.add_argument("--both", action="store_true", help="rising and falling edges")
+parser.add_argument("--record", metavar="FILE", help="append the edges to this trace file")
+parser.add_argument("--flush", type=float, default=1.0, help="seconds between writes to the trace")
+args = parser.parse_args()
+
+settings = LineSettings(
+    direction=Direction.INPUT,
+    bias=Bias.PULL_UP,
+    edge_detection=Edge.BOTH if args.both else Edge.FALLING
+    )
+
+line = request_lines(
+    CHIP_NAME,
+    consumer="hal",
+    config={pin: settings for pin in args.pins}
+)
+
+try:
+    if args.record:
+        with EdgeRecorder(args.record, flush_interval_s=args.flush) as recorder:
+            signal.signal(signal.SIGINT, lambda sig, frame: recorder.stop())
+            signal.signal(signal.SIGTERM, lambda sig, frame: recorder.stop())
+            print(f"Aufnahme nach {args.record}... (CTRL+C zum Beenden)")
+            recorder.drain(line, on_flush=lambda r: print(
+                f"{r.recorded} Flanken, größter Block {r.max_batch}"))
+        print(f"Beendet, {recorder.recorded} Flanken gespeichert.")
+    else:
+        print("Warte auf Magnet... (CTRL+C zum Beenden)")
+        while True:
+            for event in line.read_edge_events():
+                print(event.line_offset, event.event_type.name, event.timestamp_ns)
+except KeyboardInterrupt:
+    print("Beendet.")
+
+finally:
+    line.release()
@@ -0,0 +1,110 @@
+"""
+Simulated mixer and capture device.
+
+SimMixer has the interface of the VolumeControl backends and keeps the
+level in memory. An optional write latency stands in for the cost of the
+real mixer (e.g. an amixer fork). SimCapture delivers silence in real time,
+period by period, like a sound card; the playback side is
+passthrough.NullPlayback.
+"""
+
+import errno
+import threading
+import time
+
+from passthrough import SAMPLE_BYTES
+
+
+class SimMixer:
+    """In-memory mixer control with the VolumeControl interface."""
+
+    def __init__(self, control_name='Master', level=50, write_latency_s=0.0):
+        self.control_name = control_name
+        self.write_latency_s = write_latency_s
+        self._lock = threading.Lock()
+        self._level = level
+        self.initial_volume = level
+        self.writes = 0
+
+    def get_volume(self) -> int:
+        return self._level
+
+    @property
+    def last_level(self) -> int:
+        return self._level
+
+    def set_volume(self, level: int):
+        if not 0 <= level <= 100:
+            raise ValueError("Volume level must be between 0 and 100.")
+        self._write(level)
+
+    def change_volume(self, step: int):
+        if step < 0:
+            self.decrease_volume(-step)
+        else:
+            self.increase_volume(step)
+
+    def increase_volume(self, amount: int):
+        if amount < 0:
+            raise ValueError("Amount to increase must be positive.")
+        with self._lock:
+            self._write_locked(min(100, self._level + amount))
+
+    def decrease_volume(self, amount: int):
+        if amount < 0:
+            raise ValueError("Amount to decrease must be positive.")
+        with self._lock:
+            self._write_locked(max(0, self._level - amount))
+
+    def _write(self, level):
+        with self._lock:
+            self._write_locked(level)
+
+    def _write_locked(self, level):
+        if self.write_latency_s:
+            time.sleep(self.write_latency_s)
+        self._level = level
+        self.writes += 1
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"SimMixer(control_name='{self.control_name}', level={self._level})"
+
+
+_mixers = {}
+_mixers_lock = threading.Lock()
+
+
+def mixer(control_name='Master'):
+    """The SimMixer for `control_name`, shared like the real mixer control."""
+    with _mixers_lock:
+        if control_name not in _mixers:
+            _mixers[control_name] = SimMixer(control_name)
+        return _mixers[control_name]
+
+
+class SimCapture:
+    """Capture device stand-in: one period of silence every period time."""
+
+    def __init__(self, device=None, rate=44100, channels=2, period_frames=256, periods=4):
+        self.device = device
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self._period = bytes(period_frames * channels * SAMPLE_BYTES)
+        self._next = time.monotonic()
+
+    def read(self):
+        self._next += self.period_frames / self.rate
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.period_frames / self.rate:
+            self._next = time.monotonic()
+            return -errno.EPIPE, b""
+        return self.period_frames, self._period
+
+    def close(self):
+        pass
@@ -0,0 +1,126 @@
+"""
+A simulated CD drive with the interface of cd.CdromDrive.
+
+The fake disc has audio tracks of the given lengths. Reads take as long as
+on a real drive: a spin-up after CDROMSTOP (or at the start), a seek when
+the read doesn't continue the last one and the transfer at `speed` times
+real time. Every byte of a track's audio is the track number, so a test can
+tell which track was played. The drive per device path is shared, like the
+simulated GPIO chips, so a benchmark can look at its counters.
+"""
+
+import errno
+import threading
+import time
+
+from cd import FRAME_BYTES, FRAMES_PER_SECOND, Toc
+
+# track lengths in seconds
+DEFAULT_TRACKS_S = [185, 242, 203, 317, 156, 268, 221, 199, 274, 233]
+
+_drives = {}
+_drives_lock = threading.Lock()
+
+
+class SimCdrom:
+    def __init__(self, device, tracks_s=DEFAULT_TRACKS_S, speed=8.0, spin_up_s=1.0, seek_s=0.08):
+        """
+        Args:
+            tracks_s (list[float]): Length of every track, an empty list is an empty drive.
+            speed (float): Transfer rate in multiples of real time ("8x").
+            spin_up_s (float): Time until the first read after a stop returns.
+            seek_s (float): Added to a read that doesn't continue the previous one.
+        """
+        self.device = device
+        self.speed = speed
+        self.spin_up_s = spin_up_s
+        self.seek_s = seek_s
+        self.spinning = False
+        self.reads = 0
+        self.toc_reads = 0
+        self.summary_reads = 0
+        self.spin_ups = 0
+        self.stops = 0
+        self.open_count = 0
+        self._next_lba = None
+        self._patterns = {}
+        self.insert(tracks_s)
+
+    def insert(self, tracks_s):
+        """Changes the disc."""
+        starts = []
+        lba = 0
+        for seconds in tracks_s:
+            starts.append(lba)
+            lba += int(seconds * FRAMES_PER_SECOND)
+        self._toc = Toc(1, starts, lba, [True] * len(starts)) if starts else None
+        self._changed = True
+        self.spinning = False
+
+    def disc_ready(self):
+        return self._toc is not None
+
+    def media_changed(self):
+        changed, self._changed = self._changed, False
+        return changed
+
+    def read_toc_summary(self):
+        # the drive answers from the TOC it read when the disc was inserted
+        self._check_disc()
+        self.summary_reads += 1
+        return self._toc.first_track, self._toc.first_track + len(self._toc.starts) - 1, self._toc.leadout
+
+    def read_toc(self):
+        self._check_disc()
+        self._spin_up()
+        self.toc_reads += 1
+        time.sleep(0.01)
+        self._changed = False
+        return self._toc
+
+    def read_audio(self, lba, frames, view):
+        self._check_disc()
+        self._spin_up()
+        if lba != self._next_lba:
+            time.sleep(self.seek_s)
+        time.sleep(frames / FRAMES_PER_SECOND / self.speed)
+        self._next_lba = lba + frames
+        self.reads += 1
+        track = max(i for i, start in enumerate(self._toc.starts) if start <= lba) + self._toc.first_track
+        size = frames * FRAME_BYTES
+        pattern = self._patterns.get((track, size))
+        if pattern is None:
+            pattern = self._patterns[(track, size)] = bytes([track]) * size
+        view[:size] = pattern
+
+    def stop(self):
+        self.spinning = False
+        self._next_lba = None
+        self.stops += 1
+
+    def close(self):
+        self.open_count = max(0, self.open_count - 1)
+
+    def _check_disc(self):
+        if self._toc is None:
+            raise OSError(errno.ENOMEDIUM, "No medium found", self.device)
+
+    def _spin_up(self):
+        if not self.spinning:
+            time.sleep(self.spin_up_s)
+            self.spin_ups += 1
+            self.spinning = True
+
+
+def drive(device="/dev/sr0"):
+    """The simulated drive at `device`, created on first use."""
+    with _drives_lock:
+        if device not in _drives:
+            _drives[device] = SimCdrom(device)
+        return _drives[device]
+
+
+def open_drive(device="/dev/sr0"):
+    cdrom = drive(device)
+    cdrom.open_count += 1
+    return cdrom
@@ -0,0 +1,260 @@
+"""
+Simulated GPIO lines with the parts of the gpiod v2 API the radio uses.
+
+Every chip path has one SimChip with the physical level of its lines (all
+inputs are pulled up, so they start high). Tests and benchmarks change the
+levels with `chip(path).set_level()` (or press/release), with an optional
+timestamp. A SimLineRequest turns the changes of its lines into EdgeEvents
+according to its LineSettings and makes its `fd` readable while events are
+queued, so it works with select/epoll (GpioReactor, Wakeup) like the real one.
+A debounce period delays the events like the kernel does.
+"""
+
+import errno
+import os
+import select
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from enum import Enum
+
+
+class Direction(Enum):
+    AS_IS = 1
+    INPUT = 2
+    OUTPUT = 3
+
+
+class Bias(Enum):
+    AS_IS = 1
+    UNKNOWN = 2
+    DISABLED = 3
+    PULL_UP = 4
+    PULL_DOWN = 5
+
+
+class Edge(Enum):
+    NONE = 1
+    RISING = 2
+    FALLING = 3
+    BOTH = 4
+
+
+class Value(Enum):
+    INACTIVE = 0
+    ACTIVE = 1
+
+
+@dataclass
+class LineSettings:
+    direction: Direction = Direction.AS_IS
+    edge_detection: Edge = Edge.NONE
+    bias: Bias = Bias.AS_IS
+    active_low: bool = False
+    debounce_period: timedelta = timedelta()
+    output_value: Value = Value.INACTIVE
+
+
+@dataclass
+class EdgeEvent:
+    class Type(Enum):
+        RISING_EDGE = 1
+        FALLING_EDGE = 2
+
+    event_type: "EdgeEvent.Type"
+    timestamp_ns: int
+    line_offset: int
+    global_seqno: int
+    line_seqno: int
+
+
+class SimChip:
+    """The simulated lines of one chip path. All methods are thread safe."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._levels = {}      # offset -> physical level (0/1), pulled up by default
+        self._requests = {}    # offset -> SimLineRequest holding it
+        self._seqno = 0
+
+    def level(self, offset):
+        with self._lock:
+            return self._levels.get(offset, 1)
+
+    def set_level(self, offset, level, timestamp_ns=None):
+        """
+        Drives the physical level of a line (0 = low, 1 = high). Queues an edge
+        event on the request holding the line, if its edge detection wants it.
+        Returns the event, None if nothing was queued (or not yet, while a
+        debounce period runs).
+        """
+        level = 1 if level else 0
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with self._lock:
+            if self._levels.get(offset, 1) == level:
+                return None
+            self._levels[offset] = level
+            request = self._requests.get(offset)
+            if request is None:
+                return None
+            self._seqno += 1
+            return request._edge(offset, level, timestamp_ns, self._seqno)
+
+    def press(self, offset, timestamp_ns=None):
+        """A button to ground: pulls the line low."""
+        return self.set_level(offset, 0, timestamp_ns)
+
+    def release(self, offset, timestamp_ns=None):
+        return self.set_level(offset, 1, timestamp_ns)
+
+    def _attach(self, request):
+        with self._lock:
+            busy = [offset for offset in request.offsets if offset in self._requests]
+            if busy:
+                raise OSError(errno.EBUSY, f"lines {busy} of {self.path} are already requested")
+            for offset in request.offsets:
+                self._requests[offset] = request
+
+    def _detach(self, request):
+        with self._lock:
+            for offset in request.offsets:
+                if self._requests.get(offset) is request:
+                    del self._requests[offset]
+
+
+_chips = {}
+_chips_lock = threading.Lock()
+
+
+def chip(path):
+    """The SimChip for `path`, created on first use."""
+    with _chips_lock:
+        if path not in _chips:
+            _chips[path] = SimChip(path)
+        return _chips[path]
+
+
+class SimLineRequest:
+    """Stand-in for gpiod.LineRequest."""
+
+    def __init__(self, sim_chip, consumer, config):
+        self.chip = sim_chip
+        self.consumer = consumer
+        self._settings = {}
+        for offsets, settings in config.items():
+            for offset in offsets if isinstance(offsets, (tuple, list)) else (offsets,):
+                self._settings[offset] = settings
+        self.offsets = list(self._settings)
+
+        self._events = []
+        self._reported = {offset: sim_chip.level(offset) for offset in self.offsets}
+        self._debounce_timers = {}
+        self._line_seqno = {}
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        sim_chip._attach(self)
+
+    @property
+    def fd(self):
+        return self._read_fd
+
+    def _edge(self, offset, level, timestamp_ns, seqno):
+        # called by the chip with its lock held
+        debounce_s = self._settings[offset].debounce_period.total_seconds()
+        if not debounce_s:
+            return self._report(offset, level, timestamp_ns, seqno)
+        # like the kernel: report the level once it was stable for the debounce
+        # period, with the time of the last change
+        timer = self._debounce_timers.get(offset)
+        if timer:
+            timer.cancel()
+        timer = threading.Timer(debounce_s, self._debounced, (offset, timestamp_ns, seqno))
+        timer.daemon = True
+        self._debounce_timers[offset] = timer
+        timer.start()
+        return None
+
+    def _debounced(self, offset, timestamp_ns, seqno):
+        with self.chip._lock:
+            if self._read_fd is None or self._debounce_timers.get(offset) is not threading.current_thread():
+                return  # released or a newer change is pending
+            del self._debounce_timers[offset]
+            self._report(offset, self.chip._levels.get(offset, 1), timestamp_ns, seqno)
+
+    def _report(self, offset, level, timestamp_ns, seqno):
+        if self._reported.get(offset, 1) == level:
+            return None  # bounced back to the level reported last
+        self._reported[offset] = level
+
+        settings = self._settings[offset]
+        active = bool(level) != settings.active_low
+        event_type = EdgeEvent.Type.RISING_EDGE if active else EdgeEvent.Type.FALLING_EDGE
+        wanted = {Edge.BOTH: True,
+                  Edge.RISING: active,
+                  Edge.FALLING: not active}.get(settings.edge_detection, False)
+        if not wanted:
+            return None
+
+        self._line_seqno[offset] = self._line_seqno.get(offset, 0) + 1
+        event = EdgeEvent(event_type, timestamp_ns, offset, seqno, self._line_seqno[offset])
+        if not self._events:
+            os.write(self._write_fd, b"\0")
+        self._events.append(event)
+        return event
+
+    def get_value(self, offset):
+        return self.get_values([offset])[0]
+
+    def get_values(self, lines=None):
+        result = []
+        for offset in lines if lines is not None else self.offsets:
+            active = bool(self.chip.level(offset)) != self._settings[offset].active_low
+            result.append(Value.ACTIVE if active else Value.INACTIVE)
+        return result
+
+    def wait_edge_events(self, timeout=None):
+        if isinstance(timeout, timedelta):
+            timeout = timeout.total_seconds()
+        readable, _, _ = select.select([self._read_fd], [], [], timeout)
+        return bool(readable)
+
+    def read_edge_events(self, max_events=None):
+        """Returns the queued events, blocks until there is one (like gpiod)."""
+        while True:
+            with self.chip._lock:
+                if self._events:
+                    count = len(self._events) if max_events is None else max_events
+                    events, self._events = self._events[:count], self._events[count:]
+                    if not self._events:
+                        try:
+                            os.read(self._read_fd, 1)
+                        except BlockingIOError:
+                            pass
+                    return events
+            self.wait_edge_events()
+
+    def release(self):
+        if self._read_fd is None:
+            return
+        self.chip._detach(self)
+        with self.chip._lock:
+            for timer in self._debounce_timers.values():
+                timer.cancel()
+            self._debounce_timers.clear()
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+        self._read_fd = self._write_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def request_lines(path, consumer=None, config=None, **kwargs):
+    """Same signature as gpiod.request_lines (the extra gpiod options are ignored)."""
+    return SimLineRequest(chip(path), consumer, config or {})
@@ -0,0 +1,57 @@
+"""
+Simulated process runner for the capability scripts and helper programs.
+
+Every command is replaced by a real `sleep` process with the same Popen
+arguments (pipes, process group, ...), so waiting, communicate() and killpg
+behave exactly like with the real scripts, but nothing on the machine is
+touched. Scripts take a short, configurable time; long running helpers
+(arecord, aplay, bt-agent, ...) run until they are killed.
+"""
+
+import os
+import subprocess
+import threading
+from collections import deque
+
+LONG_RUNNING_S = 3600
+
+
+class SimRunner:
+    def __init__(self, script_durations=None, default_script_s=0.05, history=256):
+        """
+        Args:
+            script_durations (dict[str, float]): Script file name -> run time in seconds,
+                                                 e.g. {"enable_spotifyd.sh": 0.4}.
+            default_script_s (float): Run time of every other script.
+            history (int): Number of commands kept in `commands`.
+        """
+        self.script_durations = dict(script_durations or {})
+        self.default_script_s = default_script_s
+        self.commands = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def duration(self, args):
+        args = [str(arg) for arg in args]
+        scripts = [arg for arg in args if arg.endswith(".sh")]
+        if scripts:
+            name = os.path.basename(scripts[0])
+            return self.script_durations.get(name, self.default_script_s)
+        return LONG_RUNNING_S
+
+    def _command(self, args):
+        if isinstance(args, str):
+            args = args.split()
+        with self._lock:
+            self.commands.append(list(args))
+        return ["sleep", f"{self.duration(args):.3f}"]
+
+    def popen(self, args, **kwargs):
+        kwargs.pop("shell", None)
+        return subprocess.Popen(self._command(args), **kwargs)
+
+    def run(self, args, **kwargs):
+        kwargs.pop("shell", None)
+        return subprocess.run(self._command(args), **kwargs)
+
+
+runner = SimRunner()
@@ -0,0 +1,192 @@
+"""
+A simulated I2C bus with a fake TEA5767 FM tuner on it.
+
+The fake chip decodes the 5 control bytes like the real one (PLL with high
+side injection, mute, standby, search mode with stop level) and answers reads
+with the 5 status bytes. Reception comes from a list of stations: the level
+falls off with the distance to the nearest station, stations with a high
+level are stereo. Tuning and searching take some (simulated) time, the ready
+flag is only set afterwards.
+"""
+
+import threading
+import time
+
+I2C_M_RD = 0x0001
+
+BAND_MIN_MHZ = 87.5
+BAND_MAX_MHZ = 108.0
+
+# frequency (MHz) -> peak level (ADC, 0-15)
+DEFAULT_STATIONS = {
+    88.6: 13,
+    91.2: 9,
+    95.0: 12,
+    98.5: 14,
+    101.3: 8,
+    104.6: 11,
+    106.4: 10,
+}
+
+
+class SimI2CMsg:
+    """Stand-in for smbus2.i2c_msg: one read or write transfer."""
+
+    def __init__(self, addr, flags, data):
+        self.addr = addr
+        self.flags = flags
+        self.buf = bytearray(data)
+
+    @classmethod
+    def write(cls, address, buf):
+        return cls(address, 0, buf)
+
+    @classmethod
+    def read(cls, address, length):
+        return cls(address, I2C_M_RD, bytes(length))
+
+    @property
+    def len(self):
+        return len(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
+
+    def __iter__(self):
+        return iter(self.buf)
+
+    def __bytes__(self):
+        return bytes(self.buf)
+
+
+class FakeTEA5767:
+    """Register model of the TEA5767 (high side injection, 32.768 kHz crystal)."""
+
+    STOP_LEVELS = {0: 5, 1: 5, 2: 7, 3: 10}   # search stop level bits -> minimum ADC level
+
+    def __init__(self, stations=None, tune_time_s=0.02, search_step_s=0.002, noise_level=2):
+        """
+        Args:
+            stations (dict[float, int]): Frequency in MHz -> peak level (0-15).
+            tune_time_s (float): Time until the ready flag is set after tuning.
+            search_step_s (float): Search time per 100 kHz step.
+            noise_level (int): Level where there is no station.
+        """
+        self.stations = dict(DEFAULT_STATIONS if stations is None else stations)
+        self.tune_time_s = tune_time_s
+        self.search_step_s = search_step_s
+        self.noise_level = noise_level
+
+        self._lock = threading.Lock()
+        self.control = bytearray(5)
+        self.pll = 0
+        self.muted = True
+        self.standby = False
+        self.band_limit = False
+        self._ready_at = 0.0
+
+        self.writes = 0
+        self.reads = 0
+
+    @staticmethod
+    def _pll_to_frequency(pll):
+        return (pll * 32768 / 4 - 225_000) / 1_000_000
+
+    @staticmethod
+    def _frequency_to_pll(freq_mhz):
+        return round(4 * (freq_mhz * 1_000_000 + 225_000) / 32768)
+
+    @property
+    def frequency_mhz(self):
+        return round(self._pll_to_frequency(self.pll), 2)
+
+    def level_at(self, freq_mhz):
+        level = self.noise_level
+        for station, peak in self.stations.items():
+            level = max(level, peak - round(abs(freq_mhz - station) * 60))
+        return max(0, min(15, level))
+
+    def write(self, data):
+        if len(data) != 5:
+            raise OSError(f"TEA5767 expects 5 control bytes, got {len(data)}")
+        with self._lock:
+            self.writes += 1
+            self.control[:] = data
+            self.muted = bool(data[0] & 0x80)
+            self.standby = bool(data[3] & 0x40)
+            self.pll = ((data[0] & 0x3F) << 8) | data[1]
+            self.band_limit = False
+            if data[0] & 0x40:
+                self._search(up=bool(data[2] & 0x80), min_level=self.STOP_LEVELS[(data[2] >> 5) & 0x03])
+            else:
+                self._ready_at = time.monotonic() + self.tune_time_s
+
+    def _search(self, up, min_level):
+        freq = self.frequency_mhz
+        step = 0.1 if up else -0.1
+        steps = 0
+        while True:
+            if not BAND_MIN_MHZ <= freq <= BAND_MAX_MHZ:
+                self.band_limit = True
+                freq = BAND_MAX_MHZ if up else BAND_MIN_MHZ
+                break
+            if self.level_at(freq) >= min_level:
+                break
+            freq = round(freq + step, 2)
+            steps += 1
+        self.pll = self._frequency_to_pll(freq)
+        self._ready_at = time.monotonic() + self.tune_time_s + steps * self.search_step_s
+
+    def read(self, length):
+        with self._lock:
+            self.reads += 1
+            ready = time.monotonic() >= self._ready_at
+            level = 0 if self.standby else self.level_at(self.frequency_mhz)
+            stereo = ready and level >= 10
+            status = bytes([
+                (ready << 7) | (self.band_limit << 6) | ((self.pll >> 8) & 0x3F),
+                self.pll & 0xFF,
+                (stereo << 7) | 0x37,   # IF counter in the valid window
+                level << 4,
+                0x00,
+            ])
+        return status[:length]
+
+
+class SimI2CBus:
+    """Stand-in for smbus2.SMBus, routes i2c_rdwr transfers to fake devices by address."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.closed = False
+
+    def i2c_rdwr(self, *msgs):
+        if self.closed:
+            raise OSError("I2C bus is closed")
+        for msg in msgs:
+            device = self.devices.get(msg.addr)
+            if device is None:
+                raise OSError(121, f"Remote I/O error (no device at 0x{msg.addr:02x})")
+            if msg.flags & I2C_M_RD:
+                msg.buf[:] = device.read(len(msg.buf))
+            else:
+                device.write(bytes(msg.buf))
+
+    def close(self):
+        self.closed = True
+
+
+_tuners = {}
+_tuners_lock = threading.Lock()
+
+
+def tuner(bus=1):
+    """The FakeTEA5767 on bus `bus`, shared by every opened SimI2CBus (like the real chip)."""
+    with _tuners_lock:
+        if bus not in _tuners:
+            _tuners[bus] = FakeTEA5767()
+        return _tuners[bus]
+
+
+def open_bus(bus=1, address=0x60):
+    return SimI2CBus({address: tuner(bus)})
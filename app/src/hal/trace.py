@@ -0,0 +1,291 @@
+"""
+Binary traces of GPIO edges: record, read and replay.
+
+An EdgeRecorder drains a line request in batches into a preallocated
+buffer and appends it to the trace file every `flush_interval_s` (or when
+the buffer is full), so bursts faster than a terminal can print are kept
+with their kernel timestamps. A TraceReader maps a trace file into memory,
+replay() feeds it into anything with a handle_event(event) method
+(WheelControl, ButtonControl) at the original or an accelerated speed.
+
+File format (little endian): a 24 byte header
+    magic b"RRRE", version (u16), record size (u16),
+    CLOCK_MONOTONIC and CLOCK_REALTIME at creation (i64 ns each)
+followed by 12 byte records
+    timestamp_ns (i64), line offset (u16), edge type (u8, 1 = rising,
+    2 = falling), padding (u8).
+Appending to an existing trace keeps its header. A record that was cut off
+(e.g. power loss during a write) is ignored by the reader.
+
+Usage (from the src folder):
+    python -m hal.trace info trace.rre
+    RRR_HAL=sim python -m hal.trace replay trace.rre --wheel 7 8 [--speed 10]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+import hal
+from hal import EdgeEvent
+from reactor import Wakeup
+
+MAGIC = b"RRRE"
+VERSION = 1
+HEADER = struct.Struct("<4sHHqq")
+RECORD = struct.Struct("<qHBx")
+
+_TYPE_CODES = {EdgeEvent.Type.RISING_EDGE: 1, EdgeEvent.Type.FALLING_EDGE: 2}
+_TYPES = {code: event_type for event_type, code in _TYPE_CODES.items()}
+
+# the attributes of a gpiod EdgeEvent that the controls use
+TraceEvent = namedtuple("TraceEvent", "event_type timestamp_ns line_offset global_seqno line_seqno")
+
+
+class EdgeRecorder:
+    """Appends edge events to a trace file through an in-memory buffer."""
+
+    def __init__(self, path, capacity=4096, flush_interval_s=1.0):
+        """
+        Args:
+            path (str): Trace file, created if it doesn't exist, appended to otherwise.
+            capacity (int): Records buffered between two writes.
+            flush_interval_s (float): Maximum time a record stays in the buffer.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval_s = flush_interval_s
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._stopped = False
+        self._wakeup = Wakeup()
+
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644)
+        if os.fstat(self.fd).st_size == 0:
+            os.write(self.fd, HEADER.pack(MAGIC, VERSION, RECORD.size,
+                                          time.monotonic_ns(), time.time_ns()))
+        else:
+            _check_header(path)
+
+        self.recorded = 0
+        self.flushes = 0
+        self.max_batch = 0
+
+    def add(self, events):
+        """Buffers a batch of edge events, writes the buffer out when it is full."""
+        self.max_batch = max(self.max_batch, len(events))
+        for event in events:
+            if self._count == self.capacity:
+                self.flush()
+            RECORD.pack_into(self._buffer, self._count * RECORD.size, event.timestamp_ns,
+                             event.line_offset, _TYPE_CODES[event.event_type])
+            self._count += 1
+        self.recorded += len(events)
+
+    def flush(self):
+        """Appends the buffered records to the file."""
+        if self._count:
+            with memoryview(self._buffer) as view:
+                os.write(self.fd, view[:self._count * RECORD.size])
+            self._count = 0
+            self.flushes += 1
+        self._last_flush = time.monotonic()
+
+    def drain(self, lines, on_flush=None):
+        """
+        Records the edges of `lines` (a line request) until stop() is called.
+
+        Args:
+            on_flush (function): Called with the recorder after every periodic flush.
+        """
+        while not self._stopped:
+            timeout_s = self._last_flush + self.flush_interval_s - time.monotonic()
+            if self._wakeup.wait(lines.fd, max(0.0, timeout_s)):
+                self.add(lines.read_edge_events())
+            if time.monotonic() - self._last_flush >= self.flush_interval_s:
+                self.flush()
+                if on_flush:
+                    on_flush(self)
+        self.flush()
+
+    def stop(self):
+        """Ends drain(). Safe to call from a signal handler or another thread."""
+        self._stopped = True
+        self._wakeup.set()
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.flush()
+        os.close(self.fd)
+        self.fd = None
+        self._wakeup.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TraceReader:
+    """Read-only, memory-mapped access to the records of a trace file."""
+
+    def __init__(self, path):
+        self.path = path
+        _, _, _, self.monotonic_ns, self.realtime_ns = _check_header(path)
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._count = (size - HEADER.size) // RECORD.size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._count else None
+
+    def __len__(self):
+        return self._count
+
+    def records(self, start=0, stop=None):
+        """Yields (timestamp_ns, line_offset, type_code) tuples."""
+        stop = self._count if stop is None else min(stop, self._count)
+        if start >= stop:
+            return
+        with memoryview(self._map) as view:
+            yield from RECORD.iter_unpack(view[HEADER.size + start * RECORD.size:
+                                               HEADER.size + stop * RECORD.size])
+
+    def events(self, start=0, stop=None):
+        """Yields the records as edge events (see TraceEvent)."""
+        for seqno, (timestamp_ns, offset, code) in enumerate(self.records(start, stop), start + 1):
+            yield TraceEvent(_TYPES[code], timestamp_ns, offset, seqno, 0)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def replay(reader, handlers, speed=1.0):
+    """
+    Feeds a trace into the controls that would have received its edges.
+
+    The timestamps are moved to the current CLOCK_MONOTONIC time but keep
+    their spacing, so speeds, intervals and timeouts come out as recorded
+    even when the replay is accelerated.
+
+    Args:
+        reader (TraceReader): The trace.
+        handlers (dict): Line offset -> object with handle_event(event), e.g. a
+                         WheelControl for both of its pins. Other lines are skipped.
+        speed (float): 1.0 = original timing, 10.0 = ten times faster,
+                       0 = as fast as possible.
+
+    Returns:
+        int: Number of events that were handed to a handler.
+    """
+    replayed = 0
+    shift_ns = None
+    start = time.monotonic()
+    for event in reader.events():
+        if shift_ns is None:
+            shift_ns = time.monotonic_ns() - event.timestamp_ns
+            first_ns = event.timestamp_ns
+        handler = handlers.get(event.line_offset)
+        if handler is None:
+            continue
+        if speed > 0:
+            delay = start + (event.timestamp_ns - first_ns) / 1e9 / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        handler.handle_event(event._replace(timestamp_ns=event.timestamp_ns + shift_ns))
+        replayed += 1
+    return replayed
+
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not an edge trace (too short)")
+    header = HEADER.unpack(data)
+    magic, version, record_size = header[:3]
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not an edge trace of version {VERSION}")
+    return header
+
+
+def _print_info(reader):
+    counts = {}
+    min_interval_ns = {}
+    last_ns = {}
+    first_ns = end_ns = None
+    for timestamp_ns, offset, _ in reader.records():
+        first_ns = timestamp_ns if first_ns is None else first_ns
+        end_ns = timestamp_ns
+        counts[offset] = counts.get(offset, 0) + 1
+        if offset in last_ns:
+            interval = timestamp_ns - last_ns[offset]
+            min_interval_ns[offset] = min(interval, min_interval_ns.get(offset, interval))
+        last_ns[offset] = timestamp_ns
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(reader.realtime_ns / 1e9))
+    print(f"{reader.path}: {len(reader)} edges, started {started}")
+    if first_ns is not None:
+        print(f"duration {(end_ns - first_ns) / 1e9:.3f} s")
+    for offset in sorted(counts):
+        shortest = min_interval_ns.get(offset)
+        print(f"  line {offset}: {counts[offset]} edges"
+              + (f", shortest interval {shortest / 1e6:.3f} ms" if shortest is not None else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="summary of a trace")
+    info.add_argument("trace")
+    play = commands.add_parser("replay", help="feed a trace into WheelControl/ButtonControl")
+    play.add_argument("trace")
+    play.add_argument("--speed", type=float, default=1.0, help="0 = as fast as possible")
+    play.add_argument("--wheel", type=int, nargs=2, metavar=("PIN_A", "PIN_B"))
+    play.add_argument("--wheel-mode", default="pair", choices=("pair", "quadrature"))
+    play.add_argument("--distance", type=float, default=0.08, help="distance of the wheel sensors in m")
+    play.add_argument("--buttons", type=int, nargs="+", metavar="PIN")
+    args = parser.parse_args()
+
+    with TraceReader(args.trace) as reader:
+        if args.command == "info":
+            _print_info(reader)
+        else:
+            if not hal.SIMULATED:
+                parser.error("replay needs RRR_HAL=sim, the controls must not take the real lines")
+            from flywheel import WheelControl
+            from buttons import ButtonControl
+
+            handlers = {}
+            wheel = buttons = None
+            if args.wheel:
+                wheel = WheelControl(*args.wheel, lambda direction, speed_kmh, timestamp_ns:
+                                     print(f"wheel {direction:+d} {speed_kmh:6.2f} km/h"),
+                                     distance_m=args.distance, mode=args.wheel_mode)
+                handlers.update(dict.fromkeys(args.wheel, wheel))
+            if args.buttons:
+                buttons = ButtonControl(args.buttons, lambda pin, state, timestamp_ns:
+                                        print(f"button {pin} {'released' if state else 'pressed'}"))
+                handlers.update(dict.fromkeys(args.buttons, buttons))
+            if not handlers:
+                parser.error("nothing to replay into, use --wheel and/or --buttons")
+
+            start = time.monotonic()
+            count = replay(reader, handlers, args.speed)
+            print(f"replayed {count} edges in {time.monotonic() - start:.3f} s")
+            if wheel:
+                print("glitch filter:", wheel.filter.stats())
+                wheel.stop()
+            if buttons:
+                buttons.close()
@@ -1,13 +1,21 @@
 import os
 from pathlib import Path
-from playsound import playsound
-import subprocess
 import time
 import signal
-from volume import VolumeControl
+import threading
+import resource
 from buttons import ButtonControl
-from flywheel import WheelControl
+from flywheel import WheelControl, GlitchFilter
+from reactor import GpioReactor
+from supervisor import Supervisor
+import hal
+from metrics import REGISTRY, CALLBACK_SECONDS, MetricsServer
+import ringlog
 import math
+from concurrent.futures import ThreadPoolExecutor
+
+# fallback origin for the startup timeline if /proc/self/stat can't be read
+_MODULE_LOADED_S = time.clock_gettime(time.CLOCK_BOOTTIME)
 
 CHIP_NAME = "/dev/gpiochip0"
 
@@ -22,6 +30,201 @@ BUTTON_CONFIG = {
 }
 
 FLYWHEEL_PINS = [7, 8]  # change order to reverse the effect
+# "pair": one reading per magnet after both sensors fired, "quadrature": a step
+# on every edge of both sensors (finer and earlier, see WheelControl)
+WHEEL_MODE = "pair"
+WHEEL_DEBOUNCE_MS = 1
+# flywheel edges are ignored for a moment after a capability was enabled or
+# disabled (the aux/USB port and power changes produce spikes on the sensor lines)
+WHEEL_SUPPRESS_ON_SWITCH = True
+WHEEL_SUPPRESS_AFTER_SWITCH_S = 0.3
+
+# A mode switch waits this long for the supervised processes of the capabilities
+# that were just disabled (they hold the audio device) before enabling the next.
+RELEASE_TIMEOUT_S = 2.0
+CAPABILITIES_DIR = Path(__file__).resolve().parent.parent / "capabilities"
+# use D-Bus / in-process implementations where available, scripts otherwise
+USE_NATIVE_CAPABILITIES = True
+# persistent bash processes that run the capability scripts (0 = a new bash per script)
+SHELL_WORKERS = 2
+# Keep spotifyd and bluetooth running when another capability is selected,
+# paused over MPRIS/AVRCP, so switching back doesn't restart them. They are
+# stopped as before if the warm ones together would need more memory, or
+# one of them uses more CPU while it waits, than these limits.
+WARM_STANDBY = True
+WARM_STANDBY_MAX_MEMORY_MB = 150
+WARM_STANDBY_MAX_CPU_PERCENT = 2.0
+SWITCH_LATENCY_BUDGET_S = 1.5
+
+# Wait for buttons and flywheel in one epoll loop on the main thread instead of
+# one thread per component plus a sleeping main loop.
+USE_GPIO_REACTOR = True
+
+# upper limit for mixer writes caused by the flywheel, bursts in between are merged
+VOLUME_MAX_RATE_HZ = 25
+
+# Time from SIGTERM/SIGINT to exit. A shutdown that takes longer (e.g. a hanging
+# disable script) ends with a hard exit, the next start disables everything anyway.
+SHUTDOWN_TIMEOUT_S = 3.0
+
+INTRO_SOUND = Path(__file__).resolve().parent.parent / "misc" / "radio_intro.mp3"
+# used if pyalsaaudio isn't available for the cue player
+INTRO_SCRIPT = Path(__file__).resolve().parent.parent / "misc" / "play_radio_intro.sh"
+# Intro and feedback cues are played from memory by a CuePlayer on this device.
+# It is released before a capability is enabled.
+CUE_DEVICE = "default"
+CUE_ON_MODE_SWITCH = True
+CUE_ON_VOLUME_LIMIT = True
+
+# Prometheus text format on http://<address>/metrics, "unix:/path" for a Unix
+# socket, None to turn it off
+METRICS_ADDRESS = "127.0.0.1:9101"
+
+# Runtime messages go through a ring buffer (see ringlog.py), a background
+# thread prints everything at or above LOG_OUTPUT_LEVEL. The ring keeps the
+# lower levels too: `kill -USR1 <pid>` dumps the recent history to LOG_DUMP_DIR.
+LOG_OUTPUT_LEVEL = ringlog.INFO
+# category -> (lowest level that is kept, keep every n-th message below WARNING)
+LOG_CATEGORIES = {
+    "wheel": (ringlog.DEBUG, 1),
+    "buttons": (ringlog.DEBUG, 1),
+    "volume": (ringlog.DEBUG, 1),
+    "capabilities": (ringlog.DEBUG, 1),
+    "controller": (ringlog.DEBUG, 1),
+    "radio": (ringlog.DEBUG, 1),
+    "cd": (ringlog.DEBUG, 1),
+    "supervisor": (ringlog.DEBUG, 1),
+    "scripts": (ringlog.DEBUG, 1),
+    "reactor": (ringlog.DEBUG, 1),
+}
+LOG_DUMP_DIR = "/tmp"
+
+_log = ringlog.get("controller")
+_button_log = ringlog.get("buttons")
+_wheel_log = ringlog.get("wheel")
+
+_BUTTON_CALLBACK_SECONDS = CALLBACK_SECONDS.labels("button")
+_ROTATION_CALLBACK_SECONDS = CALLBACK_SECONDS.labels("rotation")
+
+
+class StartupTimeline:
+    """
+    Named points of the startup in milliseconds since the process was
+    started, so the interpreter start and the imports are included.
+
+    The two numbers that matter are "first_responsive_button" (GPIO events
+    are read and presses get queued) and "first_sound" (the first period
+    of the intro was written to the sound card, or the intro script was
+    started without the cue player).
+    """
+
+    def __init__(self):
+        self.origin_s = _process_start_s()
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """Records `name` at the current time, only the first call per name counts."""
+        elapsed_ms = (time.clock_gettime(time.CLOCK_BOOTTIME) - self.origin_s) * 1000
+        with self._lock:
+            self.marks.setdefault(name, elapsed_ms)
+
+    def summary(self) -> str:
+        with self._lock:
+            marks = sorted(self.marks.items(), key=lambda item: item[1])
+        return ", ".join(f"{name}={ms:.0f}ms" for name, ms in marks)
+
+class TransitionScheduler:
+    """
+    Owns all capability changes, so the GPIO callbacks only have to record the
+    newest button state and can go back to reading events.
+
+    A worker thread always works towards the most recently requested mode.
+    Targets that were superseded while a transition was running are skipped,
+    and an enable script that is still running for a target that is no
+    longer wanted gets killed (together with its process group). The
+    capability it belonged to stays marked as active, so the next transition
+    disables it properly.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._cond = threading.Condition()
+        self._target = None          # pin, or None if no button is pressed
+        self._target_ns = None
+        self._generation = 0         # bumped on every request()
+        self._inflight = None        # (pin, Popen) of the running enable script
+        self._running = False
+        self._thread = None
+        self.iterations = 0          # worker loop wakeups, for the metrics
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the worker, an enable script that is still running gets killed."""
+        with self._cond:
+            self._running = False
+            self._generation += 1
+            self._kill_inflight(keep_pin=None)
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def request(self, pin, timestamp_ns=None):
+        """Sets the new target mode (None = nothing selected). Never blocks."""
+        with self._cond:
+            self._target = pin
+            self._target_ns = timestamp_ns
+            self._generation += 1
+            self._kill_inflight(keep_pin=pin)
+            self._cond.notify()
+
+    @property
+    def target(self):
+        return self._target
+
+    def superseded(self, generation):
+        return generation != self._generation or not self._running
+
+    def track_enable(self, pin, proc):
+        """Called by the controller when an enable script was started (or finished: proc=None)."""
+        with self._cond:
+            self._inflight = (pin, proc) if proc else None
+            # the target may have changed between the superseded() check and the start
+            self._kill_inflight(keep_pin=self._target if self._running else None)
+
+    def _kill_inflight(self, keep_pin):
+        if self._inflight and self._inflight[0] != keep_pin:
+            pin, proc = self._inflight
+            _log.info("Aborting enable of %s, mode changed", BUTTON_CONFIG[pin])
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            self._inflight = None
+
+    def _worker_loop(self):
+        handled = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._generation != handled or not self._running)
+                self.iterations += 1
+                if not self._running:
+                    return
+                handled = self._generation
+                pin, timestamp_ns = self._target, self._target_ns
+
+            try:
+                self.controller._apply_mode(pin, timestamp_ns, lambda: self.superseded(handled))
+            except Exception as e:
+                _log.error("Error while switching to %s: %s", BUTTON_CONFIG.get(pin), e)
+
 
 class MainController:
     def __init__(self):
@@ -29,10 +232,28 @@ class MainController:
         Initializes all hardware-controlling sub-components.
         """
         print("Initializing main controller...")
+        ringlog.LOG.output_level = LOG_OUTPUT_LEVEL
+        for name, (level, sample) in LOG_CATEGORIES.items():
+            ringlog.LOG.category(name, level, sample)
+        self.timeline = StartupTimeline()
+        self.timeline.mark("imports")
         consumer_name = "Rossis Röhren Radio" 
 
-        self.vc = VolumeControl(control_name="Master") # Assumes this class needs no manual cleanup
-        print("Current volume:", self.vc.get_volume())
+        # Mixer and capability backends (D-Bus, I2C, ALSA) are set up on the
+        # pool while this thread requests the GPIO lines. run() starts reading
+        # buttons before they are ready, presses are queued until then.
+        self.vc = None
+        self.volume_actuator = None
+        self.capabilities = {}
+        self.scripts = None
+        self.cues = None
+        # owns every long-running child process of the capabilities
+        self.supervisor = Supervisor()
+        self._capability_pool = ThreadPoolExecutor(max_workers=len(BUTTON_CONFIG), thread_name_prefix="capability")
+        self._volume_init = self._capability_pool.submit(self._init_volume)
+        self._capabilities_init = self._capability_pool.submit(self._init_capabilities)
+        self._cues_init = self._capability_pool.submit(self._init_cues)
+        self._startup_thread = None
 
         self.wc = WheelControl(
             FLYWHEEL_PINS[0], 
@@ -40,7 +261,10 @@ class MainController:
             self.rotation_callback, 
             chip_name=CHIP_NAME, 
             consumer=consumer_name,
-            distance_m=0.08
+            distance_m=0.08,
+            mode=WHEEL_MODE,
+            glitch_filter=GlitchFilter(min_interval_s=0.005),
+            debounce_ms=WHEEL_DEBOUNCE_MS
         )
         
         self.bc = ButtonControl(
@@ -50,37 +274,185 @@ class MainController:
             consumer=consumer_name
         )
         
+        self.reactor = GpioReactor() if USE_GPIO_REACTOR else None
+        self.timeline.mark("gpio_requested")
+
+        # pins whose capability was enabled and not disabled since
+        self.active_capabilities = set()
+        self.last_switch_timings = None
+        self.transitions = TransitionScheduler(self)
+
         self._running = True
+        self._stopped = threading.Event()
+        self._stop_requested_ns = None
+        self.last_shutdown_timings = None
+        self.metrics_server = None
+        REGISTRY.add_collector(self._collect_metrics)
         self.current_mode = 9
         self.volume_speed = math.pi / 2.0
         self.max_volume_step = 13.13
         print("Controller initialized.")
 
-    def button_callback(self, pin, state):
+    def _init_volume(self):
+        from volume import open_volume_control, VolumeActuator
+        self.vc = open_volume_control(control_name="Master")
+        on_limit = (lambda level: self._play_cue("volume_limit")) if CUE_ON_VOLUME_LIMIT else None
+        self.volume_actuator = VolumeActuator(self.vc, max_rate_hz=VOLUME_MAX_RATE_HZ, on_limit=on_limit)
+        print("Current volume:", self.vc.initial_volume)
+
+    def _init_cues(self):
+        try:
+            from cues import alsa_cue_player, CueCache
+            cues = alsa_cue_player(CUE_DEVICE, on_start=self._cue_started)
+        except ImportError as e:
+            print(f"No cue player ({e}), the intro uses the script")
+            return
+        if INTRO_SOUND.exists():
+            try:
+                # decoded with ffmpeg on the first boot only, memory-mapped afterwards
+                cues.add("intro", CueCache().load(INTRO_SOUND))
+            except Exception as e:
+                print(f"Intro could not be loaded: {e}")
+        cues.start()
+        self.cues = cues
+
+    def _cue_started(self, name):
+        if name == "intro":
+            self.timeline.mark("first_sound")
+
+    def _play_cue(self, name):
+        if self.cues:
+            self.cues.play(name)
+
+    def _init_capabilities(self):
+        from capabilities import WarmStandby, create_backends
+        from scripts import CapabilityRegistry
+        # scanned once, inotify tells it about new or removed scripts
+        # RRR_SUPERVISED: the supervisor stops what the scripts start, they skip their pkill
+        self.scripts = CapabilityRegistry(CAPABILITIES_DIR, workers=SHELL_WORKERS,
+                                          env={"RRR_SUPERVISED": "1"})
+        standby = WarmStandby(WARM_STANDBY_MAX_MEMORY_MB, WARM_STANDBY_MAX_CPU_PERCENT) if WARM_STANDBY else None
+        self.capabilities = create_backends(self.scripts, set(BUTTON_CONFIG.values()),
+                                            native=USE_NATIVE_CAPABILITIES, standby=standby,
+                                            supervisor=self.supervisor)
+        print("Capability backends:", ", ".join(f"{b.name}={b.kind}" for b in self.capabilities.values()))
+
+    def _finish_startup(self):
+        """
+        Runs in the background once the buttons are monitored: plays the intro,
+        waits for the mixer and the backends, disables whatever a previous run
+        left enabled and then lets the TransitionScheduler apply queued presses.
+        """
+        intro = self._capability_pool.submit(self.play_intro)
+        if METRICS_ADDRESS:
+            try:
+                self.metrics_server = MetricsServer(REGISTRY, METRICS_ADDRESS)
+                self.metrics_server.start()
+            except OSError as e:
+                print(f"Metrics not available on {METRICS_ADDRESS}: {e}")
+        try:
+            self._volume_init.result()
+            self.volume_actuator.start()
+            self.timeline.mark("volume_ready")
+
+            self._capabilities_init.result()
+            for backend in self.capabilities.values():
+                backend.start()
+            # we don't know what is still running from before
+            self._disable_all_capabilities(force=True)
+            self.timeline.mark("startup_cleanup")
+            if self._running:
+                self.transitions.start()
+                self.timeline.mark("first_mode_switch")
+            intro.result()
+        except Exception as e:
+            print(f"Startup failed: {e}")
+            self.stop()
+            return
+        print("Startup timeline:", self.timeline.summary())
+
+    def button_callback(self, pin, state, timestamp_ns=None):
         """Callback for button state changes."""
-        print(state, pin, BUTTON_CONFIG[pin])
+        start = time.perf_counter()
+        _button_log.info("%s %s", BUTTON_CONFIG[pin], "released" if state else "pressed")
         if state == 0:
-            self._disable_all_capabilities(exception=[pin])  # to be safe
-            time.sleep(1)
-            self._enable_capability(pin)
-        else:
+            self.transitions.request(pin, timestamp_ns)
+        elif pin == self.transitions.target:
+            # a release of another button (e.g. arriving late) doesn't change the mode
+            self.transitions.request(None, timestamp_ns)
+        _BUTTON_CALLBACK_SECONDS.observe(time.perf_counter() - start)
+
+    def _apply_mode(self, pin, timestamp_ns=None, superseded=lambda: False):
+        """Brings the capabilities to the given mode, runs on the TransitionScheduler thread."""
+        if pin is None:
             self._disable_all_capabilities()
+        elif self.active_capabilities != {pin}:
+            self._switch_to(pin, timestamp_ns, superseded)
+
+    def _switch_to(self, pin, timestamp_ns=None, superseded=lambda: False):
+        """Disables whatever is active, waits for the audio device and enables `pin`."""
+        start_ns = time.monotonic_ns()
+        since_ns = timestamp_ns if timestamp_ns is not None else start_ns
+        cpu_before = _cpu_seconds()
+
+        disabled = self._disable_all_capabilities(exception=[pin])
+        teardown_ns = time.monotonic_ns()
+        released = self._wait_until_released(disabled, superseded)
+        if CUE_ON_MODE_SWITCH:
+            self._play_cue("mode_switch")
+        if self.cues:
+            self.cues.release()  # the capability may need the sound card
+        ready_ns = time.monotonic_ns()
+        if superseded():
+            _log.info("Switch to %s superseded, skipping enable", BUTTON_CONFIG[pin])
+            return
+        self._enable_capability(pin)
+        done_ns = time.monotonic_ns()
 
-    def rotation_callback(self, direction, speed_kmh):
-        """Callback for wheel rotation events."""
-        change = self.volume_speed * direction * speed_kmh
+        self.last_switch_timings = {
+            "capability": BUTTON_CONFIG[pin],
+            "queued_ms": (start_ns - since_ns) / 1e6,
+            "teardown_ms": (teardown_ns - start_ns) / 1e6,
+            "release_ms": (ready_ns - teardown_ns) / 1e6,
+            "enable_ms": (done_ns - ready_ns) / 1e6,
+            "total_ms": (done_ns - since_ns) / 1e6,
+            "cpu_ms": (_cpu_seconds() - cpu_before) * 1000,
+            "backend": self.capabilities[BUTTON_CONFIG[pin]].kind,
+            "aborted": superseded(),
+        }
+        _log.info("Switch timings: %s", ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                                  for k, v in self.last_switch_timings.items()))
+        if not released:
+            _log.warning("audio device still busy after %ss, enabled anyway", RELEASE_TIMEOUT_S)
+        if self.last_switch_timings["total_ms"] > SWITCH_LATENCY_BUDGET_S * 1000:
+            _log.warning("switch to %s exceeded the budget of %ss", BUTTON_CONFIG[pin], SWITCH_LATENCY_BUDGET_S)
+
+    def rotation_callback(self, direction, speed_kmh, timestamp_ns=None):
+        """Callback for wheel rotation events. Only queues the change, see VolumeActuator."""
+        start = time.perf_counter()
+        # in quadrature mode every magnet produces several smaller steps
+        change = self.volume_speed * direction * speed_kmh / self.wc.resolution
         change =  max(-self.max_volume_step, min(change, self.max_volume_step))
-        print(f"Wheel rotation in '{direction}' with speed: {speed_kmh:.2f} km/h and changing volume {change}")
-        self.vc.change_volume(int(change))
-        print(self.vc.get_volume())
+        _wheel_log.debug("rotation %+d at %.2f km/h, volume change %+.2f", direction, speed_kmh, change)
+        actuator = self.volume_actuator
+        if actuator is None:
+            return  # mixer not open yet
+        actuator.submit(change, timestamp_ns)
+        _ROTATION_CALLBACK_SECONDS.observe(time.perf_counter() - start)
 
     def stop(self):
         """
         A dedicated method to stop the main loop and trigger cleanup.
         This is much better than relying on __del__.
         """
+        if self._stop_requested_ns is not None:
+            return  # e.g. a second SIGTERM while cleaning up
         print("Stopping main loop...")
+        self._stop_requested_ns = time.monotonic_ns()
         self._running = False
+        self._stopped.set()
+        if self.reactor:
+            self.reactor.stop()
 
     def cleanup(self):
         """
@@ -88,10 +460,59 @@ class MainController:
         This is our reliable "destructor".
         """
         print("Cleaning up resources...")
+        start_ns = time.monotonic_ns()
+        since_ns = self._stop_requested_ns or start_ns
+
+        # 0. A startup that is still running finishes first (bounded by the
+        #    shutdown timer), so nothing gets started after the teardown.
+        if self._startup_thread:
+            self._startup_thread.join()
+        for init in (self._volume_init, self._capabilities_init, self._cues_init):
+            try:
+                init.result()
+            except Exception:
+                pass  # reported by _finish_startup or run()
+
+        # 1. Stop every thread before the resources it uses are released. All
+        #    of them wake up right away (Wakeup / Condition), nothing waits for
+        #    a timeout. A running enable script gets killed.
+        self.transitions.stop()
+        if self.reactor:
+            self.reactor.close()
         self.wc.stop()  # This stops its internal thread and releases GPIO
         self.bc.close() # This stops its thread and releases GPIO
-        self._disable_all_capabilities()
-        print("Cleanup complete.")
+        if self.volume_actuator:
+            self.volume_actuator.stop()
+        if self.cues:
+            self.cues.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        REGISTRY.remove_collector(self._collect_metrics)
+        threads_ns = time.monotonic_ns()
+
+        # 2. Tear down the capabilities (disable + backend stop) and the mixer in parallel
+        futures = [self._capability_pool.submit(self._teardown_capability, pin)
+                   for pin in BUTTON_CONFIG if BUTTON_CONFIG[pin] in self.capabilities]
+        if self.vc:
+            futures.append(self._capability_pool.submit(self.vc.close))
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error during cleanup: {e}")
+        self._capability_pool.shutdown()
+        if self.scripts:
+            self.scripts.close()
+        self.supervisor.close()  # kills what a backend left behind
+        done_ns = time.monotonic_ns()
+
+        self.last_shutdown_timings = {
+            "threads_ms": (threads_ns - start_ns) / 1e6,
+            "teardown_ms": (done_ns - threads_ns) / 1e6,
+            "total_ms": (done_ns - since_ns) / 1e6,
+        }
+        ringlog.LOG.flush()  # keep the order with the prints
+        print("Cleanup complete.", ", ".join(f"{k}={v:.1f}" for k, v in self.last_shutdown_timings.items()))
 
     def run(self):
         """
@@ -99,53 +520,173 @@ class MainController:
         This method will block until the application is told to stop.
         """
         print("Starting main controller execution...")
-        self.wc.start() # Start monitoring the wheel
-        self.bc.start_monitoring() # Start monitoring the buttons
-        
-        while self._running:
-            time.sleep(0.5)
-    
-    def _get_capabiliy_path(self, pin, mode="disable"):
-        val = BUTTON_CONFIG[pin]
-        file = Path(__file__).resolve().parent
-        script_path = Path(os.path.join(file, "..", "capabilities", val, f"{mode}_{val}.sh"))
-        if script_path.exists():
-            print("requested path: ", script_path)
-            return script_path.resolve()
-        return None
+        # GPIO first, everything else follows in the background
+        if self.reactor:
+            self.wc.attach(self.reactor)
+            self.reactor.add_source(self.supervisor)  # reaps the capabilities' children
+            if self.bc.mode == "edge":
+                self.bc.attach(self.reactor)
+            else:
+                self.bc.start_monitoring() # no edge detection, keep polling in a thread
+            if threading.current_thread() is threading.main_thread():
+                self.reactor.install_signal_wakeup()
+        else:
+            self.wc.start() # Start monitoring the wheel
+            self.bc.start_monitoring() # Start monitoring the buttons
+            self.supervisor.start()
+        self.timeline.mark("first_responsive_button")
+
+        self._startup_thread = threading.Thread(target=self._finish_startup, daemon=True)
+        self._startup_thread.start()
+
+        if not self._running:
+            return
+        if self.reactor:
+            self.reactor.run() # blocks until stop()
+        else:
+            self._stopped.wait() # set by stop(), also from a signal handler
     
-    def _run_script(self, script_path):
-        if script_path is not None:
-            result = subprocess.run(['/bin/bash', script_path.resolve()], capture_output=True, text=True)
-            return result
-        return None
-
-    def _disable_all_capabilities(self, exception=[]):
-        for pin in BUTTON_CONFIG.keys():
-           if pin not in exception:
-            self._disable_capability(pin)
-            
+    def _disable_all_capabilities(self, exception=[], only=None, force=False):
+        """
+        Disables the active capabilities (or all of them with force=True, e.g. at
+        startup where we don't know what is running) in parallel.
+
+        Returns:
+            list[int]: The pins that were disabled.
+        """
+        candidates = BUTTON_CONFIG.keys() if force else list(self.active_capabilities)
+        pins = [pin for pin in candidates
+                if pin not in exception and (only is None or pin in only)]
+        # list() waits for all of them and re-raises the first error
+        list(self._capability_pool.map(self._disable_capability, pins))
+        return pins
+
+    def _wait_until_released(self, pins, superseded=lambda: False):
+        """Waits until the supervised processes of the disabled capabilities are gone."""
+        # a capability in warm standby keeps its process but has released the device
+        names = {BUTTON_CONFIG[pin] for pin in pins if not self.capabilities[BUTTON_CONFIG[pin]].warm}
+        return self.supervisor.wait(names, RELEASE_TIMEOUT_S, superseded)
+
     def _enable_capability(self, pin):
-        self._run_script(self._get_capabiliy_path(pin, "enable"))
+        # tracked before the script runs, so a half enabled capability still gets disabled
+        self.active_capabilities.add(pin)
+        try:
+            self.capabilities[BUTTON_CONFIG[pin]].enable(
+                on_start=lambda proc: self.transitions.track_enable(pin, proc))
+        finally:
+            self.transitions.track_enable(pin, None)
+            self._suppress_wheel()
 
     def _disable_capability(self, pin):
-        self._run_script(self._get_capabiliy_path(pin, "disable"))
+        try:
+            self.capabilities[BUTTON_CONFIG[pin]].disable()
+        finally:
+            self._suppress_wheel()
+        self.active_capabilities.discard(pin)
+
+    def _suppress_wheel(self):
+        """Ignores the flywheel for a moment after the audio path or power was switched."""
+        if WHEEL_SUPPRESS_ON_SWITCH:
+            self.wc.filter.suppress(WHEEL_SUPPRESS_AFTER_SWITCH_S)
+
+    def _teardown_capability(self, pin):
+        backend = self.capabilities[BUTTON_CONFIG[pin]]
+        try:
+            if pin in self.active_capabilities:
+                self._disable_capability(pin)
+        finally:
+            backend.stop()
+
+    def _collect_metrics(self):
+        """The counters the components keep themselves, read on every scrape."""
+        edges = [({"line": pin, "name": BUTTON_CONFIG[pin]}, count) for pin, count in self.bc.edge_counts.items()]
+        edges += [({"line": pin, "name": "wheel"}, count) for pin, count in self.wc.edge_counts.items()]
+        yield "rrr_gpio_events_total", "counter", "Edge events read per GPIO line", edges
+
+        loops = {"buttons": self.bc.wakeups, "wheel": self.wc.wakeups, "transitions": self.transitions.iterations}
+        if self.reactor:
+            loops["reactor"] = self.reactor.wakeups
+        if self.volume_actuator:
+            loops["volume_writer"] = self.volume_actuator.writes
+        yield ("rrr_loop_iterations_total", "counter", "Wakeups of the event and worker loops",
+               [({"loop": name}, count) for name, count in loops.items()])
+
+        yield ("rrr_wheel_edges_filtered_total", "counter", "Wheel edges by glitch filter result",
+               [({"result": result}, count) for result, count in self.wc.filter.stats().items()])
+        if self.volume_actuator:
+            yield ("rrr_volume_events_total", "counter", "Wheel events submitted to the volume actuator",
+                   [({}, self.volume_actuator.events)])
+            yield ("rrr_volume_merged_events_total", "counter", "Wheel events merged into an earlier mixer write",
+                   [({}, self.volume_actuator.merged_events)])
+        yield ("rrr_active_capabilities", "gauge", "Capabilities that are currently enabled",
+               [({"capability": BUTTON_CONFIG[pin]}, 1) for pin in list(self.active_capabilities)])
+        yield ("rrr_warm_capabilities", "gauge", "Capabilities kept running in warm standby",
+               [({"capability": backend.name}, 1) for backend in self.capabilities.values() if backend.warm])
+        yield "rrr_process_cpu_seconds_total", "counter", "CPU time of the process and its reaped children", [({}, _cpu_seconds())]
+
+        if self.scripts:
+            yield ("rrr_script_exits_total", "counter", "Capability script runs by exit status",
+                   [({"script": script, "status": status}, count)
+                    for (script, status), count in list(self.scripts.exits.items())])
+
+        usage = self.supervisor.usage()
+        yield ("rrr_capability_processes", "gauge", "Running child processes per capability",
+               [({"capability": name}, entry["processes"]) for name, entry in usage.items()])
+        yield ("rrr_capability_resident_bytes", "gauge", "Resident memory of the child processes per capability",
+               [({"capability": name}, entry["rss_bytes"]) for name, entry in usage.items()])
+        yield ("rrr_capability_cpu_seconds_total", "counter", "CPU time of the child processes per capability",
+               [({"capability": name}, entry["cpu_seconds"]) for name, entry in usage.items()])
+        yield ("rrr_supervised_processes_total", "counter", "Child processes by what the supervisor did with them",
+               [({"event": "adopted"}, self.supervisor.adopted), ({"event": "reaped"}, self.supervisor.reaped),
+                ({"event": "killed"}, self.supervisor.killed)])
 
     def play_intro(self):
-        file = Path(__file__).resolve().parent
-        sound_path = Path(os.path.join(file, "..", "misc", "play_radio_intro.sh"))
-        print(sound_path)
-        if sound_path.exists():
-            print("playing")
-            subprocess.run(['/bin/bash', sound_path.resolve()], capture_output=True, text=True)
+        """Starts the intro, from memory if the cue player has it, else with the script."""
+        self._cues_init.result()
+        if self.cues and "intro" in self.cues.cues:
+            self.cues.play("intro")
+        elif INTRO_SCRIPT.exists():
+            print("playing", INTRO_SCRIPT)
+            hal.run(['/bin/bash', str(INTRO_SCRIPT)], capture_output=True, text=True)
+            self.timeline.mark("first_sound")
+
+def _cpu_seconds():
+    """CPU time of this process plus all reaped children (the scripts)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _process_start_s():
+    """Start of this process on the CLOCK_BOOTTIME scale (field 22 of /proc/self/stat)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return _MODULE_LOADED_S
+
+def _exit_after(timeout_s):
+    """Starts a timer that ends the process hard if it is still alive after `timeout_s`."""
+    def expire():
+        print(f"Shutdown took longer than {timeout_s}s, exiting hard")
+        os._exit(1)
+    timer = threading.Timer(timeout_s, expire)
+    timer.daemon = True
+    timer.start()
+    return timer
+
 
 if __name__ == "__main__":
     controller = None
+    shutdown_timer = None
     try:
         controller = MainController()
-        controller._disable_all_capabilities()
         def signal_handler(sig, frame):
+            global shutdown_timer
             print(f"\nCaught signal {sig}. Initiating shutdown...")
+            if shutdown_timer is None:
+                shutdown_timer = _exit_after(SHUTDOWN_TIMEOUT_S)
             if controller:
                 controller.stop()
 
@@ -153,14 +694,20 @@ if __name__ == "__main__":
         # and on `kill` (SIGTERM)
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
+        # the history of the ring buffer, e.g. right after a glitch
+        signal.signal(signal.SIGUSR1, lambda sig, frame: ringlog.LOG.request_dump(
+            os.path.join(LOG_DUMP_DIR, time.strftime("rossis_roehren_radio-%Y%m%d-%H%M%S.log"))))
 
-        controller.play_intro()
         controller.run()
 
     except Exception as e:
         print(f"\nAn unhandled error occurred in the main application: {e}")
     
     finally:
+        if shutdown_timer is None:
+            shutdown_timer = _exit_after(SHUTDOWN_TIMEOUT_S)
         if controller:
             controller.cleanup()
+        shutdown_timer.cancel()
+        ringlog.LOG.stop()
         print("Application has been shut down.")
\ No newline at end of file
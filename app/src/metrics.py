@@ -0,0 +1,242 @@
+"""
+Runtime metrics of the radio in the Prometheus text format, served over
+HTTP on localhost or on a Unix socket:
+
+    curl -s localhost:9101/metrics
+    curl -s --unix-socket /run/rossis_roehren_radio/metrics.sock http://radio/metrics
+
+Histograms have fixed buckets and are observed where the work happens (a
+bisect and an uncontended lock). Counters on the GPIO hot path are plain
+ints kept by the components themselves (WheelControl.edge_counts,
+GpioReactor.wakeups, ...), collector functions read them only when the
+metrics are scraped.
+"""
+
+import bisect
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from reactor import Wakeup
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram:
+    """A histogram with fixed bucket bounds, optionally with labels."""
+
+    def __init__(self, name, help, labels=(), buckets=(0.001, 0.01, 0.1, 1.0)):
+        """
+        Args:
+            name (str): Metric name, e.g. "rrr_i2c_transaction_duration_seconds".
+            help (str): One line description.
+            labels (tuple[str]): Label names, their values are passed to labels().
+            buckets (tuple[float]): Upper bounds of the buckets, ascending.
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.bounds = tuple(sorted(buckets))
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The histogram for these label values. Keep the result on hot paths."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} needs the labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(values, _HistogramChild(self.bounds))
+        return child
+
+    def observe(self, value, *label_values):
+        self.labels(*label_values).observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in list(self._children.items()):
+            counts, total, count = child.snapshot()
+            labels = dict(zip(self.label_names, values))
+            cumulative = 0
+            for bound, bucket in zip(self.bounds + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Histograms and collector functions that are rendered together."""
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=(0.001, 0.01, 0.1, 1.0)):
+        histogram = Histogram(name, help, labels, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def add_collector(self, collect):
+        """
+        Adds a function that is called on every scrape. It returns
+        (name, type, help, samples) tuples, type is "counter" or "gauge" and
+        samples is a list of (labels dict, value).
+        """
+        self._collectors.append(collect)
+
+    def remove_collector(self, collect):
+        self._collectors.remove(collect)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collect in list(self._collectors):
+            try:
+                families = list(collect())
+            except Exception as e:
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_labels(labels)} {value!r}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+CALLBACK_SECONDS = REGISTRY.histogram(
+    "rrr_callback_duration_seconds", "Duration of the button and wheel callbacks",
+    labels=("callback",), buckets=(0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.005, 0.02))
+CAPABILITY_SECONDS = REGISTRY.histogram(
+    "rrr_capability_action_duration_seconds", "Wall time of enabling/disabling a capability",
+    labels=("capability", "backend", "action"), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+SCRIPT_SECONDS = REGISTRY.histogram(
+    "rrr_script_duration_seconds", "Wall time of the capability scripts by how they were run",
+    labels=("script", "runner"), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+VOLUME_LATENCY_SECONDS = REGISTRY.histogram(
+    "rrr_volume_apply_latency_seconds", "Time from a wheel event to the mixer write",
+    buckets=(0.001, 0.005, 0.01, 0.02, 0.04, 0.08, 0.2))
+I2C_SECONDS = REGISTRY.histogram(
+    "rrr_i2c_transaction_duration_seconds", "Duration of the tuner I2C transfers",
+    labels=("op",), buckets=(0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.02))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    timeout = 5  # a client that doesn't send its request doesn't block the server
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per scrape is just noise
+
+    def address_string(self):
+        return str(self.client_address)  # a Unix socket has no host
+
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+    def server_bind(self):
+        try:
+            os.unlink(self.server_address)  # left over from a crash
+        except FileNotFoundError:
+            pass
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+class MetricsServer:
+    """
+    Answers scrapes in a background thread. The thread sleeps in a poll until
+    a client connects, there is no periodic wakeup.
+    """
+
+    def __init__(self, registry=REGISTRY, address="127.0.0.1:9101"):
+        """
+        Args:
+            registry (Registry): What is served.
+            address (str): "host:port" for HTTP over TCP or "unix:/path" for a Unix socket.
+        """
+        if address.startswith("unix:"):
+            self.server = _UnixHTTPServer(address[len("unix:"):], _Handler)
+        else:
+            host, port = address.rsplit(":", 1)
+            self.server = HTTPServer((host, int(port)), _Handler)
+        self.server.registry = registry
+        self.server.timeout = None
+        self.address = address
+        self._wakeup = Wakeup()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True, name="metrics")
+        self._thread.start()
+
+    def _serve(self):
+        while self._running:
+            if self._wakeup.wait(self.server.fileno()):
+                self.server.handle_request()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+        if isinstance(self.server, _UnixHTTPServer):
+            try:
+                os.unlink(self.server.server_address)
+            except FileNotFoundError:
+                pass
+        self._wakeup.close()
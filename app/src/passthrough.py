@@ -0,0 +1,337 @@
+import errno
+import threading
+import time
+from collections import deque
+
+# everything here is 16 bit little endian, interleaved
+SAMPLE_BYTES = 2
+
+
+class RingBuffer:
+    """
+    A preallocated byte ring between the capture and the playback thread.
+
+    Nothing is allocated while audio flows: write() copies into the ring,
+    read_into() copies out of it into a buffer owned by the reader. If the
+    writer is too fast the oldest data is dropped (overrun), so the latency
+    can't grow without bounds.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._cond = threading.Condition()
+        self._read_pos = 0      # total bytes read since start
+        self._write_pos = 0     # total bytes written since start
+        self._closed = False
+        self.overruns = 0
+
+    @property
+    def fill(self):
+        return self._write_pos - self._read_pos
+
+    @property
+    def write_pos(self):
+        return self._write_pos
+
+    def write(self, data):
+        """Appends `data` (bytes-like), drops the oldest bytes if it doesn't fit."""
+        n = len(data)
+        with self._cond:
+            if n > self.capacity:
+                data = memoryview(data)[n - self.capacity:]
+                n = self.capacity
+            if self.fill + n > self.capacity:
+                self._read_pos = self._write_pos + n - self.capacity
+                self.overruns += 1
+            start = self._write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self._view[start:start + first] = data[:first]
+            if first < n:
+                self._view[:n - first] = data[first:]
+            self._write_pos += n
+            self._cond.notify()
+
+    def read_into(self, out, timeout=None):
+        """
+        Waits until len(out) bytes are available and copies them into `out`.
+
+        Returns:
+            int: Position (total bytes read) after this read, or -1 on timeout/close.
+        """
+        n = len(out)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.fill >= n or self._closed, timeout) or self._closed:
+                return -1
+            start = self._read_pos % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self._view[start:start + first]
+            if first < n:
+                out[first:] = self._view[:n - first]
+            self._read_pos += n
+            return self._read_pos
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AlsaCapture:
+    """Capture PCM opened once through pyalsaaudio."""
+
+    def __init__(self, device, rate=44100, channels=2, period_frames=256, periods=4):
+        import alsaaudio
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self._pcm = alsaaudio.PCM(alsaaudio.PCM_CAPTURE, alsaaudio.PCM_NORMAL, device=device,
+                                  rate=rate, channels=channels, format=alsaaudio.PCM_FORMAT_S16_LE,
+                                  periodsize=period_frames, periods=periods)
+
+    def read(self):
+        """Blocks for one period. Returns (frames, data), frames is -EPIPE after an overrun."""
+        return self._pcm.read()
+
+    def close(self):
+        self._pcm.close()
+
+
+class AlsaPlayback:
+    """Playback PCM opened once through pyalsaaudio."""
+
+    def __init__(self, device, rate=44100, channels=2, period_frames=256, periods=4):
+        import alsaaudio
+        self.rate = rate
+        self.channels = channels
+        self.buffer_frames = period_frames * periods
+        self._pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, alsaaudio.PCM_NORMAL, device=device,
+                                  rate=rate, channels=channels, format=alsaaudio.PCM_FORMAT_S16_LE,
+                                  periodsize=period_frames, periods=periods)
+
+    def write(self, data):
+        """Blocks until there is room. Returns the frames written, -EPIPE after an underrun."""
+        return self._pcm.write(data)
+
+    def queued_frames(self):
+        """Frames written but not played yet."""
+        avail = self._pcm.avail()
+        return self.buffer_frames - avail if avail >= 0 else 0
+
+    def close(self):
+        self._pcm.close()
+
+
+class FileCapture:
+    """
+    Stand-in for a capture device: plays raw S16_LE data from a file (in a
+    loop) and delivers it period by period in real time, like a sound card.
+    """
+
+    def __init__(self, path, rate=44100, channels=2, period_frames=256, periods=4):
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self.period_bytes = period_frames * channels * SAMPLE_BYTES
+        with open(path, "rb") as f:
+            self._data = f.read() or bytes(self.period_bytes)
+        self._pos = 0
+        self._next = time.monotonic()
+
+    def read(self):
+        self._next += self.period_frames / self.rate
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.period_frames / self.rate:
+            # we were not called in time, a real card would have overrun
+            self._next = time.monotonic()
+            return -errno.EPIPE, b""
+
+        end = self._pos + self.period_bytes
+        chunk = self._data[self._pos:end]
+        if len(chunk) < self.period_bytes:
+            end = self.period_bytes - len(chunk)
+            chunk += self._data[:end]
+        self._pos = end % len(self._data)
+        return self.period_frames, chunk
+
+    def close(self):
+        pass
+
+
+class NullPlayback:
+    """
+    Stand-in for a playback device: consumes data in real time with a device
+    buffer of `period_frames * periods`, optionally appends it to a file.
+    Reports underruns like ALSA.
+    """
+
+    def __init__(self, path=None, rate=44100, channels=2, period_frames=256, periods=4):
+        self.rate = rate
+        self.channels = channels
+        self.buffer_frames = period_frames * periods
+        self._frame_bytes = channels * SAMPLE_BYTES
+        self._file = open(path, "wb") if path else None
+        self._queued_until = None  # time when everything written so far has been played
+
+    def queued_frames(self):
+        if self._queued_until is None:
+            return 0
+        return max(0, int((self._queued_until - time.monotonic()) * self.rate))
+
+    def write(self, data):
+        frames = len(data) // self._frame_bytes
+        now = time.monotonic()
+        underrun = self._queued_until is not None and self._queued_until < now
+        if self._queued_until is None or underrun:
+            self._queued_until = now
+
+        # block until the data fits into the device buffer
+        free_at = self._queued_until + frames / self.rate - self.buffer_frames / self.rate
+        if free_at > now:
+            time.sleep(free_at - now)
+        self._queued_until += frames / self.rate
+        if self._file:
+            self._file.write(data)
+        return -errno.EPIPE if underrun else frames
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+class AudioPassthrough:
+    """
+    Moves audio from a capture to a playback device inside this process,
+    replacing `arecord | aplay`.
+
+    One thread reads periods from the capture device into a preallocated
+    RingBuffer, a second one writes them to the playback device. Both devices
+    are opened by the caller and kept open. The engine measures the latency
+    from capture to output (time in the ring + what is queued in the playback
+    buffer) and counts xruns on both sides.
+    """
+
+    def __init__(self, source, sink, ring_periods=8, prefill_periods=1, history=512):
+        """
+        Args:
+            source: AlsaCapture or FileCapture (anything with read() and period_frames).
+            sink: AlsaPlayback or NullPlayback (anything with write() and queued_frames()).
+            ring_periods (int): Size of the ring buffer in periods.
+            prefill_periods (int): Periods of silence written to the playback device at
+                                   the start and after an underrun, to absorb jitter.
+            history (int): Number of latency samples kept for stats().
+        """
+        self.source = source
+        self.sink = sink
+        self.frame_bytes = source.channels * SAMPLE_BYTES
+        self.period_bytes = source.period_frames * self.frame_bytes
+        self.ring = RingBuffer(self.period_bytes * ring_periods)
+        self.prefill_periods = prefill_periods
+
+        self._stamps = deque()   # (ring position after the period, capture time)
+        self._running = False
+        self._threads = []
+
+        self.capture_xruns = 0
+        self.playback_xruns = 0
+        self.frames = 0
+        self.latencies_ms = deque(maxlen=history)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True),
+                         threading.Thread(target=self._playback_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stops both threads and closes the devices."""
+        self._running = False
+        self.ring.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.source.close()
+        self.sink.close()
+
+    @property
+    def running(self):
+        return self._running and all(thread.is_alive() for thread in self._threads)
+
+    def _capture_loop(self):
+        while self._running:
+            try:
+                frames, data = self.source.read()
+            except Exception as e:
+                print(f"Passthrough capture failed: {e}")
+                break
+            if frames < 0:
+                self.capture_xruns += 1
+                continue
+            if frames:
+                captured = time.monotonic()
+                self.ring.write(data)
+                self._stamps.append((self.ring.write_pos, captured))
+        self._running = False
+        self.ring.close()
+
+    def _playback_loop(self):
+        chunk = bytearray(self.period_bytes)
+        silence = bytes(self.period_bytes)
+        prime = True
+        while self._running:
+            position = self.ring.read_into(chunk, timeout=0.5)
+            if position < 0:
+                continue
+            try:
+                if prime:
+                    for _ in range(self.prefill_periods):
+                        self.sink.write(silence)
+                    prime = False
+                if self.sink.write(chunk) < 0:
+                    self.playback_xruns += 1
+                    prime = True
+            except Exception as e:
+                print(f"Passthrough playback failed: {e}")
+                break
+            self.frames += len(chunk) // self.frame_bytes
+
+            now = time.monotonic()
+            stamp = None
+            while self._stamps and self._stamps[0][0] <= position:
+                stamp = self._stamps.popleft()
+            if stamp:
+                queued_s = self.sink.queued_frames() / self.source.rate
+                self.latencies_ms.append((now - stamp[1] + queued_s) * 1000)
+        self._running = False
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+        return {
+            "frames": self.frames,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p99": percentile(0.99),
+            "capture_xruns": self.capture_xruns,
+            "playback_xruns": self.playback_xruns,
+            "ring_overruns": self.ring.overruns,
+        }
+
+
+def alsa_passthrough(capture_device, playback_device, rate=44100, channels=2,
+                     period_frames=256, periods=4, ring_periods=8, prefill_periods=1):
+    """Opens both ALSA devices (through the hal package) and returns a (not yet started) AudioPassthrough."""
+    import hal
+    source = hal.open_capture(capture_device, rate, channels, period_frames, periods)
+    try:
+        sink = hal.open_playback(playback_device, rate, channels, period_frames, periods)
+    except Exception:
+        source.close()
+        raise
+    return AudioPassthrough(source, sink, ring_periods=ring_periods, prefill_periods=prefill_periods)
@@ -1,6 +1,12 @@
-import smbus2
+import hal
 import sys
 import time
+import threading
+import json
+import os
+from collections import namedtuple
+import ringlog
+from metrics import I2C_SECONDS
 
 # I2C bus (use 1 for most Raspberry Pi models)
 I2C_BUS = 1
@@ -8,69 +14,534 @@ I2C_BUS = 1
 # TEA5767 I2C address
 TEA5767_ADDR = 0x60
 
+BAND_MIN_MHZ = 87.5
+BAND_MAX_MHZ = 108.0
+DEFAULT_FREQ_MHZ = 98.5
+
+# the simulated tuner has other stations, keep its index apart
+STATION_INDEX_PATH = os.path.expanduser("~/.cache/rossis_roehren_radio/stations-sim.json" if hal.SIMULATED
+                                        else "~/.cache/rossis_roehren_radio/stations.json")
+
+_log = ringlog.get("radio")
+
+_I2C_WRITE = I2C_SECONDS.labels("write")
+_I2C_READ = I2C_SECONDS.labels("read")
+
+# decoded read register, see TEA5767.read_status()
+TunerStatus = namedtuple("TunerStatus", "frequency_mhz ready band_limit stereo if_counter level")
+
+
+class TEA5767:
+    """
+    Driver for the TEA5767 FM tuner that keeps the I2C bus open.
+
+    The chip has no registers, every write sends all 5 control bytes and every
+    read returns 5 status bytes. A shadow copy of the last written control
+    bytes is kept, so mute/unmute/retune are a single write without reading
+    the chip first. All bus access is guarded by a lock, so one instance can be
+    shared between threads.
+    """
+
+    # byte 1
+    MUTE = 0x80
+    SEARCH_MODE = 0x40
+    # byte 3
+    SEARCH_UP = 0x80
+    SEARCH_STOP_LEVEL_MID = 0x40
+    SEARCH_STOP_LEVEL_LOW = 0x20
+    HIGH_SIDE_INJECTION = 0x10
+    # byte 4
+    STANDBY = 0x40
+    XTAL_32768 = 0x10
+
+    def __init__(self, bus=I2C_BUS, address=TEA5767_ADDR):
+        """
+        Args:
+            bus (int | smbus2.SMBus): I2C bus number or an already opened bus
+                                      (see hal.open_i2c_bus).
+            address (int): I2C address of the tuner.
+        """
+        self.address = address
+        self._bus = hal.open_i2c_bus(bus, address) if isinstance(bus, int) else bus
+        self._lock = threading.RLock()
+        # same settings the old set_frequency() used: search up, low stop level,
+        # high side injection, 32.768 kHz crystal
+        self._shadow = bytearray([0x00, 0x00,
+                                  self.SEARCH_UP | self.SEARCH_STOP_LEVEL_LOW | self.HIGH_SIDE_INJECTION,
+                                  self.XTAL_32768, 0x00])
+        self._shadow_valid = False
+
+    # --- conversions ---
+    @staticmethod
+    def frequency_to_pll(freq_mhz):
+        # high side injection: PLL = 4 * (f_RF + f_IF) / f_ref
+        return round(4 * (freq_mhz * 1_000_000 + 225_000) / 32768)
+
+    @staticmethod
+    def pll_to_frequency(pll):
+        return round((pll * 32768 / 4 - 225_000) / 1_000_000, 2)
+
+    # --- bus access ---
+    def _write(self):
+        start = time.perf_counter()
+        self._bus.i2c_rdwr(hal.i2c_write(self.address, bytes(self._shadow)))
+        _I2C_WRITE.observe(time.perf_counter() - start)
+
+    def _read(self):
+        msg = hal.i2c_read(self.address, 5)
+        start = time.perf_counter()
+        self._bus.i2c_rdwr(msg)
+        _I2C_READ.observe(time.perf_counter() - start)
+        return bytes(msg)
+
+    def _ensure_shadow(self):
+        """Takes over the current PLL from the chip if we haven't written it yet (e.g. CLI 'off')."""
+        if not self._shadow_valid:
+            status = self._read()
+            self._shadow[0] = (self._shadow[0] & 0xC0) | (status[0] & 0x3F)
+            self._shadow[1] = status[1]
+            self._shadow_valid = True
+
+    # --- control ---
+    def tune(self, freq_mhz, mute=False):
+        """Tunes to `freq_mhz` (and unmutes unless mute=True) with a single write."""
+        if not BAND_MIN_MHZ <= freq_mhz <= BAND_MAX_MHZ:
+            raise ValueError(f"Frequency must be between {BAND_MIN_MHZ} and {BAND_MAX_MHZ} MHz.")
+        pll = self.frequency_to_pll(freq_mhz)
+        with self._lock:
+            self._shadow[0] = (self.MUTE if mute else 0) | (pll >> 8)
+            self._shadow[1] = pll & 0xFF
+            self._shadow[3] &= ~self.STANDBY
+            self._write()
+            self._shadow_valid = True
+
+    def mute(self):
+        with self._lock:
+            self._ensure_shadow()
+            self._shadow[0] |= self.MUTE
+            self._write()
+
+    def unmute(self):
+        with self._lock:
+            self._ensure_shadow()
+            self._shadow[0] &= ~self.MUTE
+            self._write()
+
+    def standby(self, enabled=True):
+        """Standby keeps the tuner powered but switches off most of the chip."""
+        with self._lock:
+            self._ensure_shadow()
+            if enabled:
+                self._shadow[3] |= self.STANDBY
+            else:
+                self._shadow[3] &= ~self.STANDBY
+            self._write()
+
+    def search(self, up=True, stop_level=SEARCH_STOP_LEVEL_MID, timeout_s=2.0):
+        """
+        Lets the chip search for the next station (search mode bit) starting at
+        the current frequency, muted while searching.
+
+        Returns:
+            TunerStatus: Where the search stopped. band_limit is set if it hit
+            the end of the band without finding anything.
+        """
+        with self._lock:
+            self._ensure_shadow()
+            # start one step next to the current station, otherwise it is found again
+            pll = self.frequency_to_pll(min(BAND_MAX_MHZ, max(BAND_MIN_MHZ, self.frequency + (0.1 if up else -0.1))))
+            self._shadow[0] = self.MUTE | self.SEARCH_MODE | (pll >> 8)
+            self._shadow[1] = pll & 0xFF
+            self._shadow[2] = (self._shadow[2] & ~0xE0) | (self.SEARCH_UP if up else 0) | stop_level
+            self._shadow[3] &= ~self.STANDBY
+            self._write()
+
+            deadline = time.monotonic() + timeout_s
+            status = self.read_status()
+            while not status.ready and time.monotonic() < deadline:
+                time.sleep(0.01)
+                status = self.read_status()
+
+            # stay on the found frequency, leave search mode, keep muted
+            pll = self.frequency_to_pll(min(BAND_MAX_MHZ, max(BAND_MIN_MHZ, status.frequency_mhz)))
+            self._shadow[0] = self.MUTE | (pll >> 8)
+            self._shadow[1] = pll & 0xFF
+            self._write()
+            return status
+
+    @property
+    def muted(self):
+        return bool(self._shadow[0] & self.MUTE)
+
+    @property
+    def frequency(self):
+        """The frequency that was written last (MHz), None if unknown."""
+        if not self._shadow_valid:
+            return None
+        return self.pll_to_frequency(((self._shadow[0] & 0x3F) << 8) | self._shadow[1])
+
+    def read_status(self) -> TunerStatus:
+        """
+        Reads and decodes the 5 status bytes.
+
+        Returns:
+            TunerStatus: tuned frequency (from the PLL), ready flag (tuning or
+            search finished), band limit flag, stereo flag, IF counter and
+            signal level (ADC, 0-15).
+        """
+        with self._lock:
+            data = self._read()
+        return TunerStatus(
+            frequency_mhz=self.pll_to_frequency(((data[0] & 0x3F) << 8) | data[1]),
+            ready=bool(data[0] & 0x80),
+            band_limit=bool(data[0] & 0x40),
+            stereo=bool(data[2] & 0x80),
+            if_counter=data[2] & 0x7F,
+            level=data[3] >> 4,
+        )
+
+    def close(self):
+        with self._lock:
+            if self._bus:
+                self._bus.close()
+                self._bus = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+Station = namedtuple("Station", "frequency_mhz level stereo")
+
+
+class StationIndex:
+    """
+    Result of a band scan: signal level and stereo flag per frequency step,
+    stored as compact JSON so a restart doesn't need a new scan.
+
+    Stations are the local maxima of the level above `min_level`, so preset
+    recall and next/previous are a lookup here plus one write to the tuner.
+    """
+
+    def __init__(self, path=STATION_INDEX_PATH, min_level=7):
+        self.path = path
+        self.min_level = min_level
+        self.samples = {}        # frequency in 10 kHz units -> (level, stereo)
+        self.cursor_mhz = BAND_MIN_MHZ
+        self.complete = False
+        self.last_mhz = None     # last frequency that was listened to
+        self._stations = None
+
+    @classmethod
+    def load(cls, path=STATION_INDEX_PATH, **kwargs):
+        """Loads the index from `path`, an empty index if there is none (yet)."""
+        index = cls(path, **kwargs)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            index.samples = {freq: (level, bool(stereo)) for freq, level, stereo in data["samples"]}
+            index.cursor_mhz = data["cursor"]
+            index.complete = data["complete"]
+            index.last_mhz = data.get("last")
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring broken station index {path}: {e}")
+        return index
+
+    def save(self):
+        data = {
+            "cursor": self.cursor_mhz,
+            "complete": self.complete,
+            "last": self.last_mhz,
+            "samples": [[freq, level, int(stereo)] for freq, (level, stereo) in sorted(self.samples.items())],
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def record(self, freq_mhz, level, stereo):
+        self.samples[round(freq_mhz * 100)] = (level, stereo)
+        self._stations = None
+
+    def reset(self):
+        self.samples = {}
+        self.cursor_mhz = BAND_MIN_MHZ
+        self.complete = False
+        self._stations = None
+
+    @property
+    def stations(self):
+        """Found stations, sorted by frequency."""
+        if self._stations is None:
+            freqs = sorted(self.samples)
+            found = []
+            for i, freq in enumerate(freqs):
+                level, stereo = self.samples[freq]
+                left = self.samples[freqs[i - 1]][0] if i > 0 else -1
+                right = self.samples[freqs[i + 1]][0] if i + 1 < len(freqs) else -1
+                # for plateaus only the first step counts
+                if level >= self.min_level and level > left and level >= right:
+                    found.append(Station(freq / 100, level, stereo))
+            self._stations = found
+        return self._stations
+
+    def preset(self, number):
+        """Station number `number` (0 based), None if there aren't that many."""
+        stations = self.stations
+        return stations[number] if 0 <= number < len(stations) else None
+
+    def next_station(self, freq_mhz):
+        """The next station above `freq_mhz`, wraps around at the end of the band."""
+        stations = self.stations
+        for station in stations:
+            if station.frequency_mhz > freq_mhz + 0.05:
+                return station
+        return stations[0] if stations else None
+
+    def previous_station(self, freq_mhz):
+        """The next station below `freq_mhz`, wraps around at the start of the band."""
+        stations = self.stations
+        for station in reversed(stations):
+            if station.frequency_mhz < freq_mhz - 0.05:
+                return station
+        return stations[-1] if stations else None
+
+    def best_frequency(self):
+        """What to tune to: the last frequency, else the strongest station, else the default."""
+        if self.last_mhz:
+            return self.last_mhz
+        if self.stations:
+            return max(self.stations, key=lambda s: (s.level, s.stereo)).frequency_mhz
+        return DEFAULT_FREQ_MHZ
+
+
+class BandScanner:
+    """
+    Steps through the band in the background, one frequency at a time
+    (tuned muted, wait for the tuner, read level and stereo flag), and fills a
+    StationIndex. The position is saved with the index, so an interrupted
+    scan continues where it stopped.
+
+    The tuner can't play and scan at the same time, so the radio capability
+    pauses the scanner while it is on. pause() waits at most for the one step
+    that is in flight.
+    """
+
+    def __init__(self, tuner, index, step_mhz=0.1, settle_s=0.03, save_every=25):
+        self.tuner = tuner
+        self.index = index
+        self.step_mhz = step_mhz
+        self.settle_s = settle_s
+        self.save_every = save_every
+
+        self._cond = threading.Condition()
+        self._step_lock = threading.Lock()
+        self._paused = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._scan_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.index.save()
+
+    def pause(self):
+        """Stops scanning after the current step. Returns once the tuner is free."""
+        with self._cond:
+            self._paused = True
+        with self._step_lock:
+            pass
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def rescan(self):
+        """Throws the index away and scans the band again."""
+        with self._step_lock:
+            self.index.reset()
+        with self._cond:
+            self._cond.notify_all()
+
+    def step(self):
+        """Measures one frequency. Returns False when the band is complete or the scanner is paused."""
+        with self._step_lock:
+            # checked again under the lock: pause() may have returned after the loop looked at it
+            if self.index.complete or self._paused:
+                return False
+            freq = round(self.index.cursor_mhz, 2)
+            self.tuner.tune(freq, mute=True)
+            deadline = time.monotonic() + self.settle_s
+            status = self.tuner.read_status()
+            while not status.ready and time.monotonic() < deadline:
+                time.sleep(0.005)
+                status = self.tuner.read_status()
+            self.index.record(freq, status.level, status.stereo)
+
+            if freq + self.step_mhz > BAND_MAX_MHZ + 0.001:
+                self.index.complete = True
+            else:
+                self.index.cursor_mhz = round(freq + self.step_mhz, 2)
+            return True
+
+    def _scan_loop(self):
+        steps = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or
+                                    (not self._paused and not self.index.complete))
+                if not self._running:
+                    return
+            try:
+                if not self.step():
+                    continue
+            except OSError as e:
+                _log.warning("Band scan step failed: %s", e)
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._running, 5.0)
+                continue
+
+            steps += 1
+            if self.index.complete or steps % self.save_every == 0:
+                self.index.save()
+            if self.index.complete:
+                _log.info("Band scan complete, %d stations found", len(self.index.stations))
+
+
+_tuner = None
+_tuner_lock = threading.Lock()
+
+def get_tuner() -> TEA5767:
+    """Returns the TEA5767 instance shared by this process, opened on first use."""
+    global _tuner
+    with _tuner_lock:
+        if _tuner is None:
+            _tuner = TEA5767()
+        return _tuner
+
 def set_frequency(freq):
     """
     Sets the radio to the given frequency in MHz.
     Example: set_frequency(98.5)
+
+    Raises:
+        ValueError: If the frequency is outside the band.
+        OSError: If the tuner doesn't answer on the I2C bus.
     """
-    if not 87.5 <= freq <= 108.0:
-        print("Error: Frequency must be between 87.5 and 108.0 MHz.")
-        return
+    if not BAND_MIN_MHZ <= freq <= BAND_MAX_MHZ:
+        raise ValueError(f"Frequency must be between {BAND_MIN_MHZ} and {BAND_MAX_MHZ} MHz.")
+    get_tuner().tune(freq)
+    print(f"Radio tuned to {freq} MHz.")
 
-    # Formula to calculate frequency setting for TEA5767
-    freq_b = int(4 * (freq * 1000000 + 225000) / 32768)
-    
-    # Split into high and low bytes
-    high_byte = freq_b >> 8
-    low_byte = freq_b & 0xFF
+def turn_off():
+    """
+    Mutes the radio by setting the mute bit. Raises OSError like set_frequency().
+    """
+    get_tuner().mute()
+    print("Radio muted (off).")
 
-    # Data to send over I2C bus (5 bytes)
-    # MUTE=0, SEARCH_MODE=0
-    data = [high_byte, low_byte, 0xB0, 0x10, 0x00]
+def seek(up=True):
+    """
+    Lets the tuner search for the next station up or down the band and plays
+    it. Stays muted if the search ran into the end of the band.
 
-    try:
-        bus = smbus2.SMBus(I2C_BUS)
-        bus.write_i2c_block_data(TEA5767_ADDR, 0x00, data)
-        print(f"Radio tuned to {freq} MHz.")
-        bus.close()
-    except Exception as e:
-        print(f"Error setting frequency: {e}")
-        print("Please check I2C connection and address.")
+    Returns:
+        TunerStatus: Where the search stopped.
 
-def turn_off():
-    """
-    Mutes the radio by setting the mute bit.
+    Raises:
+        OSError: If the tuner doesn't answer on the I2C bus.
     """
-    try:
-        bus = smbus2.SMBus(I2C_BUS)
-        # Re-read the current status to avoid changing frequency
-        current_status = bus.read_i2c_block_data(TEA5767_ADDR, 0x00, 5)
-        
-        # Set the mute bit (bit 7 of the first byte)
-        high_byte = current_status[0] | 0x80 # Set MUTE bit
-        
-        data = [high_byte, current_status[1], current_status[2], current_status[3], current_status[4]]
-        
-        bus.write_i2c_block_data(TEA5767_ADDR, 0x00, data)
-        print("Radio muted (off).")
-        bus.close()
-    except Exception as e:
-        print(f"Error turning off radio: {e}")
+    tuner = get_tuner()
+    status = tuner.search(up)
+    if status.band_limit:
+        print(f"No station found {'above' if up else 'below'} {tuner.frequency} MHz.")
+        return status
+    tuner.unmute()
+    print(f"Radio tuned to {tuner.frequency} MHz.")
+    return status
+
+def standby():
+    """Mutes the radio and puts the tuner into standby until the next tune. Raises OSError like set_frequency()."""
+    tuner = get_tuner()
+    tuner.mute()
+    tuner.standby()
+    print("Radio in standby.")
+
+def tune_station(station, index=None):
+    """Tunes to a Station from the index and remembers it as the last one."""
+    if station is None:
+        print("No stations known, run a band scan first.")
+        return
+    set_frequency(station.frequency_mhz)
+    if index is not None:
+        index.last_mhz = station.frequency_mhz
+        index.save()
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Usage: python3 radio.py <frequency_in_mhz> | off")
+        print("Usage: python3 radio.py <frequency_in_mhz> | off | standby | status | seek [down] | scan | stations | next | prev | preset <n>")
         print("Example: python3 radio.py 102.1")
         print("Example: python3 radio.py off")
         sys.exit(1)
 
     command = sys.argv[1].lower()
 
-    if command == 'off':
-        turn_off()
-    else:
-        try:
-            frequency = float(command)
+    # the functions raise, the command line only reports and carries on
+    try:
+        if command == 'off':
+            turn_off()
+        elif command == 'standby':
+            standby()
+        elif command == 'status':
+            print(get_tuner().read_status())
+        elif command == 'seek':
+            seek(up=sys.argv[2:3] != ['down'])
+        elif command == 'scan':
+            index = StationIndex.load()
+            scanner = BandScanner(get_tuner(), index)
+            scanner.rescan()
+            while scanner.step():
+                pass
+            index.save()
+            for station in index.stations:
+                print(station)
+        elif command == 'stations':
+            for i, station in enumerate(StationIndex.load().stations):
+                print(i, station)
+        elif command in ('next', 'prev'):
+            index = StationIndex.load()
+            current = get_tuner().read_status().frequency_mhz
+            station = index.next_station(current) if command == 'next' else index.previous_station(current)
+            tune_station(station, index)
+        elif command == 'preset':
+            index = StationIndex.load()
+            tune_station(index.preset(int(sys.argv[2])), index)
+        else:
+            try:
+                frequency = float(command)
+            except ValueError:
+                print("Invalid command. Please provide a frequency in MHz or 'off'.")
+                sys.exit(1)
             set_frequency(frequency)
-        except ValueError:
-            print("Invalid command. Please provide a frequency in MHz or 'off'.")
\ No newline at end of file
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"Error talking to the radio: {e}")
+        print("Please check I2C connection and address.")
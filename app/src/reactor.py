@@ -0,0 +1,175 @@
+import os
+import select
+import selectors
+import signal
+
+import ringlog
+
+_log = ringlog.get("reactor")
+
+
+class Wakeup:
+    """
+    Lets another thread interrupt a blocking wait on a file descriptor.
+
+    Uses an eventfd (a pipe where eventfd isn't available). Once set() was
+    called, wait() returns immediately until clear() is called, so a stop
+    request that arrives before the wait starts isn't lost either.
+    """
+
+    def __init__(self):
+        if hasattr(os, "eventfd"):
+            self._read_fd = self._write_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        else:
+            self._read_fd, self._write_fd = os.pipe()
+            os.set_blocking(self._read_fd, False)
+            os.set_blocking(self._write_fd, False)
+        self._polls = {}  # watched fd -> poll object
+
+    def fileno(self):
+        return self._read_fd
+
+    def set(self):
+        """Interrupts the current (and every following) wait. Safe to call from any thread."""
+        try:
+            if self._read_fd == self._write_fd:
+                os.eventfd_write(self._write_fd, 1)
+            else:
+                os.write(self._write_fd, b"\0")
+        except BlockingIOError:
+            pass  # already set
+
+    def clear(self):
+        try:
+            while os.read(self._read_fd, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, fd=None, timeout_s=None):
+        """
+        Blocks until `fd` is readable, the wakeup is set or the timeout expired.
+
+        Returns:
+            bool: True if `fd` is readable.
+        """
+        poll = self._polls.get(fd)
+        if poll is None:
+            poll = select.poll()
+            poll.register(self._read_fd, select.POLLIN)
+            if fd is not None:
+                poll.register(fd, select.POLLIN)
+            self._polls[fd] = poll
+        timeout_ms = None if timeout_s is None else max(0, int(timeout_s * 1000))
+        return any(ready == fd for ready, _ in poll.poll(timeout_ms))
+
+    def close(self):
+        self._polls.clear()
+        os.close(self._read_fd)
+        if self._write_fd != self._read_fd:
+            os.close(self._write_fd)
+
+
+class GpioReactor:
+    """
+    A single event loop that waits on all GPIO line requests at once.
+
+    Every registered source (ButtonControl, WheelControl, ...) hands out the
+    file descriptor of its line request. `run()` blocks in one epoll wait until
+    any of them becomes readable, reads all pending edge events, sorts them by
+    their kernel timestamp and hands them back to the source they came from.
+    That way wheel and button events are always processed in the order they
+    happened, no matter which fd was reported first.
+
+    A pipe is registered as well, so `stop()` (and signals, if
+    `install_signal_wakeup()` was called) can interrupt the wait immediately.
+
+    A source needs three methods:
+        fileno() -> int
+        read_events() -> list of events with a `timestamp_ns` attribute
+        handle_event(event)
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._sources = []
+        self._running = False
+        self._signal_wakeup = False
+
+        # number of times the wait returned, used to compare against the threads
+        self.wakeups = 0
+
+    def add_source(self, source):
+        """Registers a source whose fd should be watched."""
+        self._selector.register(source.fileno(), selectors.EVENT_READ, source)
+        self._sources.append(source)
+
+    def remove_source(self, source):
+        self._selector.unregister(source.fileno())
+        self._sources.remove(source)
+
+    def install_signal_wakeup(self):
+        """
+        Lets the C level signal handler write to the wakeup pipe, so a signal
+        arriving right before the wait can't be missed. Must be called from the
+        main thread.
+        """
+        signal.set_wakeup_fd(self._wakeup_w)
+        self._signal_wakeup = True
+
+    def wakeup(self):
+        """Interrupts a running wait. Safe to call from any thread."""
+        if self._wakeup_w is None:
+            return  # closed
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            pass  # pipe is full, the loop will wake up anyway
+
+    def run(self):
+        """Dispatches events until `stop()` is called. Blocks the calling thread."""
+        self._running = True
+        while self._running:
+            ready = self._selector.select()
+            self.wakeups += 1
+
+            batch = []
+            for key, _ in ready:
+                if key.data is None:
+                    self._drain_wakeup()
+                    continue
+                order = self._sources.index(key.data)
+                for event in key.data.read_events():
+                    batch.append((event.timestamp_ns, order, key.data, event))
+
+            batch.sort(key=lambda item: (item[0], item[1]))
+            for _, _, source, event in batch:
+                try:
+                    source.handle_event(event)
+                except Exception as e:
+                    _log.error("Error handling event from %s: %s", source, e)
+
+    def stop(self):
+        self._running = False
+        self.wakeup()
+
+    def close(self):
+        """Releases the selector and the wakeup pipe."""
+        if self._signal_wakeup:
+            signal.set_wakeup_fd(-1)
+            self._signal_wakeup = False
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        self._wakeup_r = self._wakeup_w = None
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
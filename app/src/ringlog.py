@@ -0,0 +1,233 @@
+"""
+Non-blocking logging for the hot paths (GPIO callbacks, mixer writes,
+capability switches).
+
+A log call only checks the level and sampling of its category and stores
+(time, category, level, message, args) in a preallocated ring, formatting
+happens later. A background writer prints the records at or above
+`output_level` shortly after they arrive (right away for warnings), so a
+slow stdout (journald under systemd) never blocks the caller. If the writer
+falls behind by more than `capacity` records, the oldest ones are not
+printed and counted in `dropped`.
+
+The ring also keeps the records below the output level (e.g. every wheel
+event at DEBUG), dump() writes the recent history with timestamps, e.g.
+after a glitch (the radio does that on SIGUSR1).
+
+    _log = ringlog.get("wheel")
+    _log.debug("step %+d at %.1f km/h", direction, speed_kmh)
+"""
+
+import atexit
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class Category:
+    """Log calls of one part of the program, see RingLog.category()."""
+
+    __slots__ = ("name", "level", "sample", "_seen", "_log")
+
+    def __init__(self, log, name, level=INFO, sample=1):
+        self._log = log
+        self.name = name
+        self.level = level
+        self.sample = sample
+        self._seen = 0
+
+    def log(self, level, msg, *args):
+        if level >= self.level:
+            self._add(level, msg, args)
+
+    def _add(self, level, msg, args):
+        if self.sample > 1 and level < WARNING:
+            self._seen += 1
+            if self._seen % self.sample:
+                return
+        self._log.add(self.name, level, msg, args)
+
+    # the level is checked before anything else, a filtered call costs one comparison
+    def debug(self, msg, *args):
+        if DEBUG >= self.level:
+            self._add(DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if INFO >= self.level:
+            self._add(INFO, msg, args)
+
+    def warning(self, msg, *args):
+        if WARNING >= self.level:
+            self._add(WARNING, msg, args)
+
+    def error(self, msg, *args):
+        if ERROR >= self.level:
+            self._add(ERROR, msg, args)
+
+
+class RingLog:
+    def __init__(self, capacity=4096, output_level=INFO, batch_s=0.2, stream=None):
+        """
+        Args:
+            capacity (int): Records kept in memory, also the most records waiting
+                            for the writer.
+            output_level (int): Records at or above this level are printed.
+            batch_s (float): How long the writer collects records before it prints
+                             them (warnings and errors are printed right away).
+            stream: Where the writer prints to, sys.stdout (looked up on every
+                    write) if None.
+        """
+        self.capacity = capacity
+        self.output_level = output_level
+        self.batch_s = batch_s
+        self.stream = stream
+        self._ring = [None] * capacity
+        self._next = 0                          # number of records ever added
+        self._pending = deque()                 # records the writer still has to print
+        self._urgent = False
+        self._dump_path = None
+        self._lock = threading.Lock()           # the ring and the pending records
+        self._cond = threading.Condition()      # wakes the writer (reentrant, see request_dump)
+        self._categories = {}
+        self._running = False
+        self._stopped = False
+        self._thread = None
+        self.dropped = 0
+        self._dropped_reported = 0
+
+    def category(self, name, level=None, sample=None) -> Category:
+        """
+        The Category `name`, created on first use.
+
+        Args:
+            level (int): Records below this level are ignored (not even kept in the ring).
+            sample (int): Keep only every n-th record below WARNING.
+        """
+        with self._lock:
+            category = self._categories.get(name)
+            if category is None:
+                category = self._categories[name] = Category(self, name)
+        if level is not None:
+            category.level = level
+        if sample is not None:
+            category.sample = max(1, sample)
+        return category
+
+    def add(self, category, level, msg, args):
+        record = (time.time(), category, level, msg, args)
+        wake = False
+        with self._lock:
+            self._ring[self._next % self.capacity] = record
+            self._next += 1
+            if level >= self.output_level:
+                if len(self._pending) == self.capacity:
+                    self._pending.popleft()
+                    self.dropped += 1
+                self._pending.append(record)
+                wake = len(self._pending) == 1 or (level >= WARNING and not self._urgent)
+                self._urgent = self._urgent or level >= WARNING
+        if wake:
+            if self._thread is None:
+                self.start()  # on the first output, not when a module creates its category
+            with self._cond:
+                self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._running or self._stopped:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._writer_loop, daemon=True, name="ringlog")
+            self._thread.start()
+
+    def stop(self):
+        """Prints what is left and stops the writer, later records are only kept in the ring."""
+        with self._cond:
+            self._running = False
+            self._stopped = True
+            self._cond.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def request_dump(self, path):
+        """Lets the writer dump the history to `path`. Safe to call from a signal handler."""
+        self._dump_path = path
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            self._cond.notify()
+
+    def flush(self):
+        """Prints the pending records."""
+        with self._lock:
+            records, self._pending = self._pending, deque()
+            self._urgent = False
+            skipped, self._dropped_reported = self.dropped - self._dropped_reported, self.dropped
+        lines = [self._format(record) for record in records]
+        if skipped:
+            lines.insert(0, f"[ringlog] {skipped} messages skipped, the writer fell behind")
+        if lines:
+            stream = self.stream or sys.stdout
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                pass  # closed or broken stdout, the ring still has everything
+
+    def dump(self, stream):
+        """Writes every record still in the ring (all levels), with time and level."""
+        with self._lock:
+            first = max(0, self._next - self.capacity)
+            records = [self._ring[i % self.capacity] for i in range(first, self._next)]
+        for record in records:
+            stamp = time.strftime("%H:%M:%S", time.localtime(record[0]))
+            stream.write(f"{stamp}.{int(record[0] % 1 * 1000):03d} {LEVEL_NAMES.get(record[2], record[2]):7} "
+                         f"{self._format(record)}\n")
+        return len(records)
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                # no timeout while idle, the writer only wakes up for new output
+                self._cond.wait_for(lambda: self._pending or self._dump_path or not self._running)
+                if not self._running:
+                    return
+                if not self._urgent and not self._dump_path:
+                    # collect a batch, a warning or stop() ends the wait early
+                    self._cond.wait_for(lambda: self._urgent or self._dump_path or not self._running,
+                                        self.batch_s)
+            self.flush()
+            if self._dump_path:
+                path, self._dump_path = self._dump_path, None
+                try:
+                    with open(path, "w") as f:
+                        count = self.dump(f)
+                    self.add("ringlog", INFO, "%d records dumped to %s", (count, path))
+                except OSError as e:
+                    self.add("ringlog", ERROR, "dump to %s failed: %s", (path, e))
+
+    @staticmethod
+    def _format(record):
+        _, category, level, msg, args = record
+        if args:
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f"{msg} {args!r}"
+        if level >= WARNING:
+            return f"[{category}] {LEVEL_NAMES.get(level, level)}: {msg}"
+        return f"[{category}] {msg}"
+
+
+LOG = RingLog()
+atexit.register(LOG.flush)
+
+
+def get(name) -> Category:
+    """The category `name` of the process wide RingLog."""
+    return LOG.category(name)
@@ -0,0 +1,287 @@
+"""
+The capability scripts (capabilities/<name>/<mode>_<name>.sh) and the bash
+processes that run them.
+
+CapabilityRegistry scans the capabilities folder once and keeps the
+resolved script paths. An inotify watch (through ctypes) on the folder and
+on every capability folder tells it when a script was added, removed or
+renamed; until then a lookup is a dict access instead of exists() and
+resolve() on the SD card. The scripts themselves are read on every run, so
+an edited script is used right away.
+
+The scripts run on a few ShellWorkers: bash processes started once that
+run every script in a subshell, i.e. a fork of a running shell instead of
+exec'ing and initializing a new bash per call. The worker runs with job
+control (set -m), so every script still gets a process group of its own
+that can be killed together with its background jobs. If all workers are
+busy (e.g. everything is disabled in parallel at startup) a script gets a
+new bash as before.
+"""
+
+import ctypes
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from pathlib import Path
+
+import hal
+import ringlog
+from metrics import SCRIPT_SECONDS
+
+_log = ringlog.get("scripts")
+
+# inotify(7)
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_ONLYDIR = 0x01000000
+
+# A script that was started, `pid` is also the id of its process group
+ScriptJob = namedtuple("ScriptJob", "pid")
+
+
+def run_script(script_path, on_start=None, env=None):
+    """
+    Runs a capability script with a new bash in its own process group, so
+    it can be killed together with everything it started. `on_start(proc)`
+    is called right after the process was created. `env` replaces the
+    environment like with subprocess.Popen.
+    """
+    if script_path is None:
+        return None
+    args = ['/bin/bash', str(script_path)]
+    proc = hal.popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                     text=True, start_new_session=True, env=env)
+    if on_start:
+        on_start(proc)
+    stdout, stderr = proc.communicate()
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+
+class Inotify:
+    """A non-blocking inotify instance that only tells whether a watched folder changed."""
+
+    MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def fileno(self):
+        return self._fd
+
+    def watch(self, path):
+        """Watches a folder, watching it again is a no-op."""
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+
+    def changed(self):
+        """True if there were events since the last call. Reads them all, never blocks."""
+        changed = False
+        try:
+            while os.read(self._fd, 4096):
+                changed = True
+        except BlockingIOError:
+            pass
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+# Reads one script path per line and runs it in a subshell with $0 set to
+# the path and no arguments (the worker's $1/$2 are its output files), like
+# `bash script`. The subshell's pid goes back before the run, its exit status after.
+_WORKER_LOOP = r'''
+set -m
+while IFS= read -r path; do
+    ( set --; BASH_ARGV0=$path; . "$path" ) </dev/null >"$1" 2>"$2" &
+    echo "started $!"
+    wait "$!"
+    echo "exited $?"
+done
+'''
+
+
+class ShellWorker:
+    """A persistent bash that runs one script at a time."""
+
+    def __init__(self, env=None):
+        self._dir = tempfile.mkdtemp(prefix="rrr-shell-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self._stdout = os.path.join(self._dir, "stdout")
+        self._stderr = os.path.join(self._dir, "stderr")
+        self.proc = subprocess.Popen(
+            ["/bin/bash", "--noprofile", "--norc", "-c", _WORKER_LOOP, "rrr-shell", self._stdout, self._stderr],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, start_new_session=True, env=env)
+        self.runs = 0
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def run(self, script_path, on_start=None):
+        """
+        Runs a script, like run_script(). `on_start` gets a ScriptJob.
+
+        Raises:
+            BrokenPipeError: If the worker is gone before the script started.
+        """
+        args = ['/bin/bash', str(script_path)]
+        self.proc.stdin.write(f"{script_path}\n")
+        self.proc.stdin.flush()
+        started = self.proc.stdout.readline()
+        if not started.startswith("started "):
+            raise BrokenPipeError(f"shell worker {self.proc.pid} exited")
+        self.runs += 1
+        if on_start:
+            on_start(ScriptJob(int(started.split()[1])))
+        exited = self.proc.stdout.readline()
+        # the worker itself was killed while the script ran
+        returncode = int(exited.split()[1]) if exited.startswith("exited ") else -9
+        with open(self._stdout) as out, open(self._stderr) as err:
+            return subprocess.CompletedProcess(args, returncode, out.read(), err.read())
+
+    def close(self, timeout_s=1.0):
+        try:
+            self.proc.stdin.close()  # ends the read loop
+            self.proc.wait(timeout=timeout_s)
+        except (BrokenPipeError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class CapabilityRegistry:
+    """
+    The scripts of every capability in `directory`, looked up by capability
+    name and mode ("enable", "disable"), and the ShellWorkers that run them.
+    """
+
+    def __init__(self, directory, workers=2, env=None):
+        """
+        Args:
+            workers (int): Number of persistent bash processes, 0 starts a new
+                           bash for every script. Always 0 with RRR_HAL=sim,
+                           where hal.popen() replaces the scripts.
+            env (dict): Variables added to the environment of the scripts.
+        """
+        self.directory = Path(directory)
+        self.env = {**os.environ, **env} if env else None
+        self._lock = threading.Lock()
+        self._scripts = {}
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"No inotify ({e}), the capability scripts are looked up on every call")
+            self._inotify = None
+        self.scans = 0
+        self._scan()
+
+        self._idle = [ShellWorker(self.env) for _ in range(0 if hal.SIMULATED else workers)]
+        self._workers_lock = threading.Lock()
+        self.exits = {}  # (script name, exit status) -> count
+        self.last_runs = deque(maxlen=64)
+
+    def _scan(self):
+        scripts = {}
+        if not self.directory.is_dir():
+            self._scripts = scripts
+            return
+        if self._inotify:
+            self._inotify.watch(self.directory)
+        for folder in self.directory.iterdir():
+            if not folder.is_dir():
+                continue
+            if self._inotify:
+                self._inotify.watch(folder)
+            suffix = f"_{folder.name}.sh"
+            for path in folder.glob(f"*{suffix}"):
+                scripts.setdefault(folder.name, {})[path.name[:-len(suffix)]] = path.resolve()
+        self._scripts = scripts
+        self.scans += 1
+        _log.debug("capability scripts: %s", ", ".join(f"{name}={sorted(modes)}" for name, modes in scripts.items()))
+
+    def script(self, name, mode):
+        """The resolved path of capabilities/<name>/<mode>_<name>.sh, None if there is none."""
+        with self._lock:
+            if self._inotify is None or self._inotify.changed():
+                self._scan()
+            return self._scripts.get(name, {}).get(mode)
+
+    def names(self):
+        with self._lock:
+            if self._inotify is None or self._inotify.changed():
+                self._scan()
+            return sorted(self._scripts)
+
+    def run(self, name, mode, on_start=None):
+        """
+        Runs a script on an idle ShellWorker (a new bash if there is none).
+
+        Args:
+            on_start (function): Called with the Popen object or ScriptJob once the
+                                 script runs, its `pid` is the process group to kill.
+
+        Returns:
+            subprocess.CompletedProcess: None if the capability has no such script.
+        """
+        path = self.script(name, mode)
+        if path is None:
+            return None
+        with self._workers_lock:
+            worker = self._idle.pop() if self._idle else None
+        runner = "worker" if worker else "bash"
+        start = time.perf_counter()
+        try:
+            result = worker.run(path, on_start) if worker else run_script(path, on_start, self.env)
+        except BrokenPipeError as e:
+            _log.warning("%s, running %s with a new bash", e, path.name)
+            worker.close()
+            worker = ShellWorker(self.env)
+            runner = "bash"
+            result = run_script(path, on_start, self.env)
+        finally:
+            if worker:
+                if not worker.alive:
+                    worker.close()
+                    worker = ShellWorker(self.env)
+                with self._workers_lock:
+                    self._idle.append(worker)
+        wall_s = time.perf_counter() - start
+
+        SCRIPT_SECONDS.observe(wall_s, path.name, runner)
+        with self._workers_lock:
+            key = (path.name, result.returncode)
+            self.exits[key] = self.exits.get(key, 0) + 1
+            self.last_runs.append({"script": path.name, "returncode": result.returncode,
+                                   "wall_ms": wall_s * 1000, "runner": runner})
+        if result.returncode:
+            _log.warning("%s exited with %d after %.1f ms: %s", path.name, result.returncode,
+                         wall_s * 1000, result.stderr.strip()[-200:])
+        else:
+            _log.debug("%s done in %.1f ms", path.name, wall_s * 1000)
+        return result
+
+    def close(self):
+        with self._workers_lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.close()
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
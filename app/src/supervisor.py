@@ -0,0 +1,336 @@
+"""
+Ownership of the long-running child processes of the capabilities.
+
+Every process a capability leaves running (the arecord | aplay bridge, the
+bluetooth pairing agent, cvlc, whatever an enable script put in the
+background) is adopted by the Supervisor under the capability's name and
+tracked through a pidfd, so a pid that was reused by another process can
+never be signalled by mistake. The pidfds sit in one epoll that is a source
+of the GpioReactor (or of a thread of its own without the reactor): when a
+child exits it is reaped right away and its pidfd is closed, nothing waits
+until the next switch.
+
+Disabling a capability kills its process groups (SIGTERM, SIGKILL after a
+timeout), so nothing depends on the pkill and pid file bookkeeping of the
+scripts any more, and a mode switch waits for exactly these processes
+(wait()) instead of looking for process names. usage() reports resident memory and CPU time per
+capability.
+"""
+
+import os
+import select
+import signal
+import threading
+import time
+from collections import namedtuple
+
+import ringlog
+from reactor import Wakeup
+
+_log = ringlog.get("supervisor")
+
+ChildExit = namedtuple("ChildExit", "timestamp_ns child")
+
+
+def process_usage(pid):
+    """(resident bytes, CPU seconds) of a process from /proc, None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, ValueError, IndexError):
+        return None
+    # utime and stime are fields 14 and 15, the list starts at field 3
+    ticks = int(fields[11]) + int(fields[12])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE"), ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _process_table():
+    """pid -> (parent pid, process group) of all processes, from /proc/<pid>/stat."""
+    table = {}
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit():
+            try:
+                with open(f"/proc/{entry.name}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                table[int(entry.name)] = (int(fields[1]), int(fields[2]))
+            except (OSError, ValueError, IndexError):
+                pass  # process is already gone
+    return table
+
+
+def group_members(pgid):
+    """
+    The processes of a process group and everything they started, also in
+    other groups (e.g. a command that `sudo` runs on a new terminal).
+    """
+    table = _process_table()
+    members = {pid for pid, (_, group) in table.items() if group == pgid}
+    added = members
+    while added:
+        added = {pid for pid, (parent, _) in table.items() if parent in added and pid not in members}
+        members |= added
+    members.discard(os.getpid())
+    return sorted(members)
+
+
+class Child:
+    """A supervised process. `proc` is the Popen object if this process started it."""
+
+    def __init__(self, capability, pid, pidfd, pgid, proc=None):
+        self.capability = capability
+        self.pid = pid
+        self.pidfd = pidfd
+        self.pgid = pgid
+        self.proc = proc
+        self.started = time.monotonic()
+        self.usage = (0, 0.0)  # last sample of process_usage()
+
+    def __repr__(self):
+        return f"Child('{self.capability}', {self.pid})"
+
+
+class Supervisor:
+    """
+    Tracks the child processes of the capabilities by pidfd, reaps them as
+    soon as they exit and kills them per capability.
+
+    Attach it to a GpioReactor with `reactor.add_source(supervisor)` or call
+    start() to reap on a thread of its own.
+    """
+
+    def __init__(self):
+        self._children = {}  # pidfd -> Child
+        self._lock = threading.Lock()
+        self._epoll = select.epoll()
+        self._exited_cpu = {}  # capability -> CPU seconds of its reaped children
+        self._wakeup = None
+        self._thread = None
+        self.adopted = 0
+        self.reaped = 0
+        self.killed = 0
+
+    def adopt(self, capability, proc):
+        """
+        Supervises a process this process started (a Popen object), with its
+        process group.
+
+        Returns:
+            Child: None if the process is already gone.
+        """
+        if proc is None or proc.poll() is not None:
+            return None
+        return self._add(capability, proc.pid, proc)
+
+    def adopt_group(self, capability, pgid):
+        """
+        Supervises what is left of a process group, e.g. the background jobs
+        of an enable script that ran with start_new_session=True (its pid is
+        the pgid).
+
+        Returns:
+            list[Child]: The processes that were adopted.
+        """
+        with self._lock:
+            known = {child.pid for child in self._children.values()}
+        children = [self._add(capability, pid) for pid in group_members(pgid) if pid not in known]
+        return [child for child in children if child]
+
+    def _add(self, capability, pid, proc=None):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return None
+        try:
+            pgid = os.getpgid(pid)
+        except ProcessLookupError:
+            os.close(pidfd)
+            return None
+        child = Child(capability, pid, pidfd, pgid, proc)
+        with self._lock:
+            self._children[pidfd] = child
+            self._epoll.register(pidfd, select.EPOLLIN)
+            self.adopted += 1
+        _log.debug("%s: supervising pid %d (group %d)", capability, pid, pgid)
+        return child
+
+    def children(self, capability=None):
+        with self._lock:
+            return [child for child in self._children.values()
+                    if capability is None or child.capability == capability]
+
+    def stop(self, capability, timeout_s=2.0):
+        """
+        Kills the process groups of a capability: SIGTERM, SIGKILL to what is
+        still alive after `timeout_s`. Blocks until they are reaped.
+
+        Returns:
+            int: The number of processes that were still running.
+        """
+        # own copies of the pidfds, the reactor may reap and close the originals meanwhile
+        with self._lock:
+            pending = {os.dup(child.pidfd): child for child in self._children.values()
+                       if child.capability == capability}
+        if not pending:
+            return 0
+        fds = list(pending)
+        count = len(pending)
+        try:
+            self._signal(pending, signal.SIGTERM)
+            pending = self._wait(pending, timeout_s)
+            if pending:
+                _log.warning("%s: %d processes ignored SIGTERM, killing them", capability, len(pending))
+                self._signal(pending, signal.SIGKILL)
+                pending = self._wait(pending, 1.0)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        with self._lock:
+            self.killed += count
+        if pending:
+            _log.error("%s: pids %s survived SIGKILL", capability, [child.pid for child in pending.values()])
+        return count
+
+    def wait(self, capabilities, timeout_s, cancelled=lambda: False):
+        """
+        Waits until the processes of `capabilities` have exited and reaps them.
+        Nothing is signalled, see stop().
+
+        Returns:
+            bool: False if some are still running after `timeout_s` or once `cancelled()` is true.
+        """
+        deadline = time.monotonic() + timeout_s
+        while True:
+            with self._lock:
+                pending = {os.dup(child.pidfd): child for child in self._children.values()
+                           if child.capability in capabilities}
+            if not pending:
+                return True
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or cancelled():
+                    return False
+                # short slices, so `cancelled` is looked at while a process hangs
+                self._wait(pending, min(remaining, 0.05))
+            finally:
+                for fd in pending:
+                    os.close(fd)
+
+    def _signal(self, pending, sig):
+        # the groups still exist while one of their tracked members is alive, so the pgid wasn't reused
+        alive = [child for fd, child in pending.items() if not _exited(fd)]
+        for pgid in {child.pgid for child in alive}:
+            try:
+                os.killpg(pgid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+        for fd in pending:
+            try:
+                signal.pidfd_send_signal(fd, sig)  # members that left their group
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def _wait(self, pending, timeout_s):
+        """Reaps the processes that exit within `timeout_s`, returns the others."""
+        pending = dict(pending)
+        poll = select.poll()
+        for fd in pending:
+            poll.register(fd, select.POLLIN)
+        deadline = time.monotonic() + timeout_s
+        while pending:
+            timeout_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            ready = poll.poll(timeout_ms)
+            for fd, _ in ready:
+                poll.unregister(fd)
+                self._reap(pending.pop(fd))
+            if not ready and time.monotonic() >= deadline:
+                break
+        return pending
+
+    def _reap(self, child):
+        with self._lock:
+            if self._children.get(child.pidfd) is not child:
+                return  # reaped by another thread
+            # a zombie still has its CPU time in /proc
+            child.usage = process_usage(child.pid) or child.usage
+            if child.proc:
+                child.proc.poll()
+            else:
+                try:
+                    os.waitid(os.P_PIDFD, child.pidfd, os.WEXITED | os.WNOHANG)
+                except ChildProcessError:
+                    pass  # not our child (an orphaned script job), init reaps it
+            del self._children[child.pidfd]
+            self._epoll.unregister(child.pidfd)
+            os.close(child.pidfd)
+            self._exited_cpu[child.capability] = self._exited_cpu.get(child.capability, 0.0) + child.usage[1]
+            self.reaped += 1
+        _log.debug("%s: pid %d exited after %.1f s", child.capability, child.pid,
+                   time.monotonic() - child.started)
+
+    def usage(self):
+        """
+        Resident memory and CPU time of the processes of every capability.
+        The CPU time includes the reaped processes (as of their exit).
+
+        Returns:
+            dict[str, dict]: capability -> {"processes", "rss_bytes", "cpu_seconds"}
+        """
+        # background jobs a script forked after adopt_group() looked at its group
+        for capability, pgid in {(child.capability, child.pgid) for child in self.children()}:
+            self.adopt_group(capability, pgid)
+        with self._lock:
+            children = list(self._children.values())
+            result = {capability: {"processes": 0, "rss_bytes": 0, "cpu_seconds": cpu}
+                      for capability, cpu in self._exited_cpu.items()}
+        for child in children:
+            child.usage = process_usage(child.pid) or child.usage
+            entry = result.setdefault(child.capability, {"processes": 0, "rss_bytes": 0, "cpu_seconds": 0.0})
+            entry["processes"] += 1
+            entry["rss_bytes"] += child.usage[0]
+            entry["cpu_seconds"] += child.usage[1]
+        return result
+
+    # GpioReactor source
+
+    def fileno(self):
+        return self._epoll.fileno()
+
+    def read_events(self):
+        now = time.monotonic_ns()
+        with self._lock:
+            return [ChildExit(now, self._children[fd]) for fd, _ in self._epoll.poll(0)
+                    if fd in self._children]
+
+    def handle_event(self, event):
+        self._reap(event.child)
+
+    def start(self):
+        """Reaps on a thread of its own, for when there is no reactor."""
+        if self._thread:
+            return
+        self._wakeup = Wakeup()
+        self._thread = threading.Thread(target=self._reap_loop, name="supervisor", daemon=True)
+        self._thread.start()
+
+    def _reap_loop(self):
+        while self._thread:
+            if self._wakeup.wait(self.fileno()):
+                for event in self.read_events():
+                    self.handle_event(event)
+
+    def close(self, timeout_s=2.0):
+        """Kills every process that is still supervised and releases the epoll."""
+        if self._thread:
+            thread, self._thread = self._thread, None
+            self._wakeup.set()
+            thread.join()
+            self._wakeup.close()
+        for capability in {child.capability for child in self.children()}:
+            self.stop(capability, timeout_s)
+        self._epoll.close()
+
+
+def _exited(pidfd):
+    return bool(select.select([pidfd], [], [], 0)[0])
@@ -2,6 +2,16 @@
 
 import subprocess
 import re
+import ctypes
+import ctypes.util
+import threading
+import time
+from collections import deque
+from metrics import VOLUME_LATENCY_SECONDS
+import ringlog
+
+_log = ringlog.get("volume")
+
 
 class VolumeControl:
     """
@@ -19,15 +29,21 @@ class VolumeControl:
                                 names by running `amixer scontrols` in the terminal.
         """
         self.control_name = control_name
-        # Verify that amixer is installed and the control exists
+        # Verify that amixer is installed and the control exists. The output
+        # already contains the level, no second fork for the first get_volume().
         try:
-            subprocess.run(['amixer', 'sget', self.control_name], 
-                           check=True, 
-                           capture_output=True)
+            result = subprocess.run(['amixer', 'sget', self.control_name], 
+                                    check=True, 
+                                    capture_output=True,
+                                    text=True)
         except FileNotFoundError:
             raise RuntimeError("The 'amixer' command was not found. Please ensure ALSA utils are installed ('sudo apt-get install alsa-utils').")
         except subprocess.CalledProcessError:
             raise ValueError(f"The specified mixer control '{self.control_name}' was not found. Check available controls with 'amixer scontrols'.")
+        match = re.search(r'\[(\d{1,3})%\]', result.stdout)
+        self.initial_volume = int(match.group(1)) if match else -1
+        # level reported by the last amixer call, see _run_command
+        self.last_level = self.initial_volume
 
     def get_volume(self) -> int:
         """
@@ -51,7 +67,7 @@ class VolumeControl:
             else:
                 raise RuntimeError("Could not parse volume from amixer output.")
         except (subprocess.CalledProcessError, RuntimeError) as e:
-            print(f"Error getting volume: {e}")
+            _log.error("Error getting volume: %s", e)
             return -1 # Return an error value
 
     def change_volume(self, step: int):
@@ -72,7 +88,7 @@ class VolumeControl:
         
         command = f"amixer sset '{self.control_name}' {level}%"
         self._run_command(command)
-        print(f"Volume set to {level}%")
+        _log.debug("Volume set to %d%%", level)
 
     def increase_volume(self, amount: int):
         """
@@ -86,7 +102,7 @@ class VolumeControl:
 
         command = f"amixer sset '{self.control_name}' {amount}%+"
         self._run_command(command)
-        print(f"Volume increased by {amount}%")
+        _log.debug("Volume increased by %d%%", amount)
 
     def decrease_volume(self, amount: int):
         """
@@ -100,22 +116,366 @@ class VolumeControl:
 
         command = f"amixer sset '{self.control_name}' {amount}%-"
         self._run_command(command)
-        print(f"Volume decreased by {amount}%")
+        _log.debug("Volume decreased by %d%%", amount)
 
     def _run_command(self, command: str):
         """A helper method to run a shell command."""
         try:
-            subprocess.run(command, shell=True, check=True, capture_output=True)
+            result = subprocess.run(command, shell=True, check=True, capture_output=True)
+            # 'amixer sset' prints the new state of the control
+            match = re.search(rb'\[(\d{1,3})%\]', result.stdout)
+            if match:
+                self.last_level = int(match.group(1))
         except subprocess.CalledProcessError as e:
             # Provide more helpful error info if possible
-            print(f"Error executing command: {command}")
-            print(f"Stderr: {e.stderr.decode()}")
+            _log.error("Error executing command: %s, stderr: %s", command, e.stderr.decode())
             raise
 
+    def close(self):
+        """Nothing to release, every call runs its own amixer process."""
+        pass
+
     def __repr__(self):
         """Provides a developer-friendly representation of the object."""
         return f"VolumeControl(control_name='{self.control_name}')"
 
+class AlsaVolumeControl(VolumeControl):
+    """
+    Same interface as VolumeControl, but talks to libasound directly (via ctypes)
+    instead of forking 'amixer' for every call.
+
+    The mixer handle is opened once and kept for the life of the process. The
+    current level is kept in memory, so get_volume() is just an attribute read.
+    Changes made by other programs are picked up before every relative change.
+    """
+    SND_MIXER_SCHN_FRONT_LEFT = 0
+
+    def __init__(self, control_name='Master', card='default'):
+        """
+        Args:
+            control_name (str): The name of the ALSA mixer control to use.
+            card (str): The mixer device to attach to, e.g. 'default' or 'hw:2'.
+
+        Raises:
+            RuntimeError: If libasound can't be loaded or the mixer can't be opened.
+            ValueError: If the mixer control doesn't exist.
+        """
+        self.control_name = control_name
+        self.card = card
+        self._lock = threading.Lock()
+        self._mixer = ctypes.c_void_p()
+        self._elem = None
+
+        self._lib = self._load_library()
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+        self._level = self._read_level()
+        self.initial_volume = self._level
+
+    @staticmethod
+    def _load_library():
+        name = ctypes.util.find_library('asound') or 'libasound.so.2'
+        try:
+            lib = ctypes.CDLL(name)
+        except OSError as e:
+            raise RuntimeError(f"libasound could not be loaded: {e}")
+
+        c_long_p = ctypes.POINTER(ctypes.c_long)
+        signatures = {
+            'snd_mixer_open': ([ctypes.POINTER(ctypes.c_void_p), ctypes.c_int], ctypes.c_int),
+            'snd_mixer_attach': ([ctypes.c_void_p, ctypes.c_char_p], ctypes.c_int),
+            'snd_mixer_selem_register': ([ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p], ctypes.c_int),
+            'snd_mixer_load': ([ctypes.c_void_p], ctypes.c_int),
+            'snd_mixer_handle_events': ([ctypes.c_void_p], ctypes.c_int),
+            'snd_mixer_close': ([ctypes.c_void_p], ctypes.c_int),
+            'snd_mixer_selem_id_malloc': ([ctypes.POINTER(ctypes.c_void_p)], ctypes.c_int),
+            'snd_mixer_selem_id_free': ([ctypes.c_void_p], None),
+            'snd_mixer_selem_id_set_index': ([ctypes.c_void_p, ctypes.c_uint], None),
+            'snd_mixer_selem_id_set_name': ([ctypes.c_void_p, ctypes.c_char_p], None),
+            'snd_mixer_find_selem': ([ctypes.c_void_p, ctypes.c_void_p], ctypes.c_void_p),
+            'snd_mixer_selem_get_playback_volume_range': ([ctypes.c_void_p, c_long_p, c_long_p], ctypes.c_int),
+            'snd_mixer_selem_get_playback_volume': ([ctypes.c_void_p, ctypes.c_int, c_long_p], ctypes.c_int),
+            'snd_mixer_selem_set_playback_volume_all': ([ctypes.c_void_p, ctypes.c_long], ctypes.c_int),
+            'snd_strerror': ([ctypes.c_int], ctypes.c_char_p),
+        }
+        for func_name, (argtypes, restype) in signatures.items():
+            func = getattr(lib, func_name)
+            func.argtypes = argtypes
+            func.restype = restype
+        return lib
+
+    def _check(self, ret, what):
+        if ret < 0:
+            raise RuntimeError(f"{what} failed: {self._lib.snd_strerror(ret).decode()}")
+        return ret
+
+    def _open(self):
+        lib = self._lib
+        self._check(lib.snd_mixer_open(ctypes.byref(self._mixer), 0), "snd_mixer_open")
+        self._check(lib.snd_mixer_attach(self._mixer, self.card.encode()), f"attaching mixer '{self.card}'")
+        self._check(lib.snd_mixer_selem_register(self._mixer, None, None), "snd_mixer_selem_register")
+        self._check(lib.snd_mixer_load(self._mixer), "snd_mixer_load")
+
+        sid = ctypes.c_void_p()
+        self._check(lib.snd_mixer_selem_id_malloc(ctypes.byref(sid)), "snd_mixer_selem_id_malloc")
+        try:
+            lib.snd_mixer_selem_id_set_index(sid, 0)
+            lib.snd_mixer_selem_id_set_name(sid, self.control_name.encode())
+            self._elem = lib.snd_mixer_find_selem(self._mixer, sid)
+        finally:
+            lib.snd_mixer_selem_id_free(sid)
+
+        if not self._elem:
+            raise ValueError(f"The specified mixer control '{self.control_name}' was not found. Check available controls with 'amixer scontrols'.")
+
+        vmin, vmax = ctypes.c_long(), ctypes.c_long()
+        self._check(lib.snd_mixer_selem_get_playback_volume_range(self._elem, ctypes.byref(vmin), ctypes.byref(vmax)),
+                    "reading the volume range")
+        self._min, self._max = vmin.value, vmax.value
+
+    def _read_level(self) -> int:
+        raw = ctypes.c_long()
+        self._check(self._lib.snd_mixer_selem_get_playback_volume(self._elem, self.SND_MIXER_SCHN_FRONT_LEFT, ctypes.byref(raw)),
+                    "reading the volume")
+        if self._max == self._min:
+            return 0
+        # same rounding as amixer, so both backends report the same percentage
+        return round((raw.value - self._min) * 100 / (self._max - self._min))
+
+    def _sync(self):
+        """Picks up changes made by other programs (e.g. alsamixer)."""
+        if self._lib.snd_mixer_handle_events(self._mixer) > 0:
+            self._level = self._read_level()
+
+    def get_volume(self) -> int:
+        """
+        Gets the current volume level as a percentage, without touching the hardware.
+
+        Returns:
+            int: The current volume level (0-100).
+        """
+        return self._level
+
+    @property
+    def last_level(self) -> int:
+        return self._level
+
+    def set_volume(self, level: int):
+        """
+        Sets the volume to a specific level.
+
+        Args:
+            level (int): The desired volume level (0-100).
+        """
+        if not 0 <= level <= 100:
+            raise ValueError("Volume level must be between 0 and 100.")
+
+        with self._lock:
+            self._write_level(level)
+
+    def increase_volume(self, amount: int):
+        """
+        Increases the volume by a given percentage amount (clamped at 100).
+
+        Args:
+            amount (int): The percentage by which to increase the volume.
+        """
+        if amount < 0:
+            raise ValueError("Amount to increase must be positive.")
+
+        with self._lock:
+            self._sync()
+            self._write_level(min(100, self._level + amount))
+
+    def decrease_volume(self, amount: int):
+        """
+        Decreases the volume by a given percentage amount (clamped at 0).
+
+        Args:
+            amount (int): The percentage by which to decrease the volume.
+        """
+        if amount < 0:
+            raise ValueError("Amount to decrease must be positive.")
+
+        with self._lock:
+            self._sync()
+            self._write_level(max(0, self._level - amount))
+
+    def _write_level(self, level: int):
+        raw = round(level * (self._max - self._min) / 100) + self._min
+        self._check(self._lib.snd_mixer_selem_set_playback_volume_all(self._elem, raw), "setting the volume")
+        self._level = level
+
+    def close(self):
+        """Closes the mixer handle."""
+        if self._mixer:
+            self._lib.snd_mixer_close(self._mixer)
+            self._mixer = ctypes.c_void_p()
+            self._elem = None
+
+    def __repr__(self):
+        return f"AlsaVolumeControl(control_name='{self.control_name}', card='{self.card}')"
+
+
+def open_volume_control(control_name='Master', card='default') -> VolumeControl:
+    """
+    Returns the libasound backed AlsaVolumeControl if possible and falls back
+    to the amixer based VolumeControl otherwise. With RRR_HAL=sim it is the
+    simulated mixer of the hal package.
+    """
+    import hal
+    if hal.SIMULATED:
+        return hal.open_mixer(control_name)
+    try:
+        return AlsaVolumeControl(control_name, card=card)
+    except (RuntimeError, ValueError) as e:
+        print(f"Native ALSA mixer not available ({e}), falling back to amixer")
+        return VolumeControl(control_name)
+
+class VolumeActuator:
+    """
+    A stage between the flywheel callback and a VolumeControl.
+
+    submit() only adds the delta to a pending sum and returns, so the thread
+    reading the wheel edges never waits for the mixer. A writer thread applies
+    the pending sum at most `max_rate_hz` times per second; everything that
+    arrives in between is merged into the next write. Fractions of a percent
+    are carried over instead of being dropped.
+
+    For tuning, it records how many events were merged into an earlier write
+    and the latency from the (oldest) wheel event to the applied volume.
+    """
+
+    def __init__(self, volume_control, max_rate_hz=25.0, history=256,
+                 on_limit=None, limit_notice_interval_s=1.0):
+        """
+        Args:
+            volume_control (VolumeControl): The backend the changes are applied to.
+            max_rate_hz (float): Maximum number of mixer writes per second.
+            history (int): Number of latency samples kept for stats().
+            on_limit (function): Called with the level (0 or 100) when a change
+                                 runs into a limit, at most once per
+                                 `limit_notice_interval_s` while the wheel keeps pushing.
+            limit_notice_interval_s (float): See on_limit.
+        """
+        if max_rate_hz <= 0:
+            raise ValueError("max_rate_hz must be positive.")
+
+        self.vc = volume_control
+        self.min_interval_s = 1.0 / max_rate_hz
+
+        self._cond = threading.Condition()
+        self._pending = 0.0
+        self._pending_events = 0
+        self._oldest_event_ns = None
+        self._last_write = 0.0
+        self.on_limit = on_limit
+        self.limit_notice_interval_s = limit_notice_interval_s
+        self._last_limit_notice = 0.0
+        self._running = False
+        self._thread = None
+
+        self.events = 0
+        self.writes = 0
+        self.merged_events = 0
+        self.latencies_ms = deque(maxlen=history)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the writer thread, pending changes that weren't written yet are dropped."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, delta, timestamp_ns=None):
+        """
+        Queues a relative volume change, never blocks on the mixer.
+
+        Args:
+            delta (float): Change in percent, may be fractional.
+            timestamp_ns (int): CLOCK_MONOTONIC time of the event that caused it,
+                                defaults to now.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with self._cond:
+            self._pending += delta
+            self._pending_events += 1
+            if self._oldest_event_ns is None:
+                self._oldest_event_ns = timestamp_ns
+            self._cond.notify()
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending_events or not self._running)
+                if not self._running:
+                    return
+
+                # rate limit, everything arriving meanwhile is merged into this write
+                wait_s = self._last_write + self.min_interval_s - time.monotonic()
+                if wait_s > 0 and self._cond.wait_for(lambda: not self._running, wait_s):
+                    return
+
+                step = int(self._pending)
+                self._pending -= step
+                events, self._pending_events = self._pending_events, 0
+                oldest_ns, self._oldest_event_ns = self._oldest_event_ns, None
+
+            try:
+                if step:
+                    self.vc.change_volume(step)
+                    self._check_limit(step)
+            except Exception as e:
+                _log.error("Error applying volume change %d: %s", step, e)
+
+            self._last_write = time.monotonic()
+            self.events += events
+            self.writes += 1
+            self.merged_events += events - 1
+            latency_ns = time.monotonic_ns() - oldest_ns
+            self.latencies_ms.append(latency_ns / 1e6)
+            VOLUME_LATENCY_SECONDS.observe(latency_ns / 1e9)
+
+    def _check_limit(self, step):
+        if not self.on_limit:
+            return
+        # no extra mixer access, both backends know the level after a change
+        level = self.vc.last_level
+        if not ((step > 0 and level >= 100) or (step < 0 and level == 0)):
+            return
+        now = time.monotonic()
+        if now - self._last_limit_notice >= self.limit_notice_interval_s:
+            self._last_limit_notice = now
+            self.on_limit(level)
+
+    def stats(self) -> dict:
+        """Returns counters and latency percentiles (ms) of the recent writes."""
+        latencies = sorted(self.latencies_ms)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+        return {
+            "events": self.events,
+            "writes": self.writes,
+            "merged_events": self.merged_events,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p99": percentile(0.99),
+            "latency_ms_max": latencies[-1] if latencies else None,
+        }
+
 # --- Example Usage ---
 if __name__ == "__main__":
     import time
@@ -124,9 +484,9 @@ if __name__ == "__main__":
         # Create an instance of the VolumeControl.
         # It will use the 'Master' control by default.
         # If your control is named 'PCM', you would use:
-        # volume = VolumeControl('PCM')
+        # volume = open_volume_control('PCM')
         print("Initializing volume control...")
-        volume = VolumeControl()
+        volume = open_volume_control()
         print("Initialization successful.")
 
         # 1. Get and display the current volume
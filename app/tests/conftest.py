@@ -0,0 +1,6 @@
+import os
+import sys
+
+# everything runs against the simulated hardware, like the benchmarks
+os.environ["RRR_HAL"] = "sim"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
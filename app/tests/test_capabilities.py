@@ -0,0 +1,117 @@
+import pytest
+
+import cd
+import radio
+from capabilities import CdBackend, RadioBackend, SystemdUnitBackend
+from hal import sim_cdrom
+
+
+class RecordingFallback:
+    def __init__(self):
+        self.calls = []
+
+    def _enable(self, on_start=None):
+        self.calls.append("enable")
+
+    def _disable(self):
+        self.calls.append("disable")
+
+
+def test_radio_falls_back_to_script_when_tuner_fails(monkeypatch):
+    def no_tuner():
+        raise OSError(121, "Remote I/O error")
+    monkeypatch.setattr(radio, "get_tuner", no_tuner)
+    fallback = RecordingFallback()
+    backend = RadioBackend("radio", fallback, frequency=98.5, scan=False)
+    backend.enable()
+    assert fallback.calls == ["enable"]
+    assert not backend.bridge.running
+    backend.disable()
+    assert fallback.calls == ["enable", "disable"]
+
+
+def scanning_radio(tmp_path, fallback):
+    backend = RadioBackend("radio", fallback, frequency=98.5)
+    backend.index = radio.StationIndex(str(tmp_path / "stations.json"))
+    backend.start()
+    return backend
+
+
+def test_failed_tune_keeps_the_band_scan_going(monkeypatch, tmp_path):
+    def no_tuner(frequency):
+        raise OSError(121, "Remote I/O error")
+    monkeypatch.setattr(radio, "set_frequency", no_tuner)
+    fallback = RecordingFallback()
+    backend = scanning_radio(tmp_path, fallback)
+    try:
+        backend.enable()
+        assert fallback.calls == ["enable"]
+        assert backend.scanner._paused  # the script plays the radio now
+        backend.disable()
+        assert fallback.calls == ["enable", "disable"]
+        assert not backend.scanner._paused
+    finally:
+        backend.stop()
+
+
+def test_failed_bridge_mutes_the_tuner(monkeypatch, tmp_path):
+    fallback = RecordingFallback()
+    backend = scanning_radio(tmp_path, fallback)
+    def no_bridge():
+        raise OSError("device busy")
+    monkeypatch.setattr(backend.bridge, "start", no_bridge)
+    try:
+        backend.enable()
+        assert fallback.calls == ["enable"]
+        assert radio.get_tuner().muted
+        assert not backend.bridge.running
+        backend.disable()
+        assert not backend.scanner._paused
+    finally:
+        backend.stop()
+
+
+class FakeSystemd:
+    """The system bus with systemd on it, every unit ends up in `state`."""
+
+    def __init__(self, state):
+        self.state = state
+        self.calls = []
+
+    def call(self, msg, timeout=5.0):
+        from jeepney import HeaderFields
+        method = msg.header.fields[HeaderFields.member]
+        self.calls.append(method)
+        if method == "LoadUnit":
+            return ("/org/freedesktop/systemd1/unit/spotifyd_2eservice",)
+        return ()
+
+    def get_property(self, address, name):
+        return self.state
+
+
+@pytest.mark.parametrize("state, calls", [("active", []), ("failed", ["enable"]), ("inactive", ["enable"])])
+def test_unit_that_did_not_start_falls_back_to_script(state, calls):
+    pytest.importorskip("jeepney")
+    bus = FakeSystemd(state)
+    fallback = RecordingFallback()
+    backend = SystemdUnitBackend("spotify", fallback, bus, "spotifyd.service")
+    backend.enable()
+    assert "StartUnit" in bus.calls
+    assert fallback.calls == calls
+
+
+def test_failed_cd_start_closes_the_player(monkeypatch, tmp_path):
+    drive = sim_cdrom.drive("/dev/sr-test-enable")
+    drive.spin_up_s = 0
+    def no_output(self, track=None):
+        raise OSError("playback device busy")
+    monkeypatch.setattr(cd.CdPlayer, "play", no_output)
+    fallback = RecordingFallback()
+    backend = CdBackend("cd", fallback, device="/dev/sr-test-enable")
+    backend.cache = cd.TocCache(str(tmp_path / "cd.json"))
+    backend.rip_cache = None
+    backend.enable()
+    assert fallback.calls == ["enable"]
+    assert backend.player is None
+    assert drive.open_count == 0
@@ -0,0 +1,30 @@
+from cd import TocCache
+from hal.sim_cdrom import SimCdrom
+
+
+def test_known_disc_toc_comes_from_cache(tmp_path):
+    path = str(tmp_path / "cd.json")
+    drive = SimCdrom("/dev/sr-test", spin_up_s=0)
+    cache = TocCache(path)
+    toc = cache.toc(drive)
+    cache.remember(toc, 3)
+    assert drive.toc_reads == 1
+
+    # a new run with the same disc inserted
+    drive = SimCdrom("/dev/sr-test", spin_up_s=0)
+    cache = TocCache.load(path)
+    cached = cache.toc(drive)
+    assert drive.toc_reads == 0
+    assert (cache.reads, cache.hits) == (0, 1)
+    assert (cached.disc_id, cached.starts, cached.leadout) == (toc.disc_id, toc.starts, toc.leadout)
+    assert cache.last_track(cached) == 3
+
+
+def test_other_disc_is_read(tmp_path):
+    cache = TocCache(str(tmp_path / "cd.json"))
+    drive = SimCdrom("/dev/sr-test", spin_up_s=0)
+    cache.remember(cache.toc(drive), 2)
+    drive.insert([100, 200])
+    toc = cache.toc(drive)
+    assert drive.toc_reads == 2
+    assert len(toc.tracks) == 2 and cache.last_track(toc) is None
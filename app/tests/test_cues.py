@@ -0,0 +1,30 @@
+from cues import CuePlayer
+
+
+class RecordingOutput:
+    rate = 44100
+    channels = 2
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return len(data) // 4
+
+    def close(self):
+        pass
+
+
+def test_start_latency_history_is_bounded():
+    player = CuePlayer(RecordingOutput, period_frames=64, history=4)
+    player.add("click", bytes(64 * 4))
+    player.start()
+    try:
+        for _ in range(10):
+            player.play("click")
+            assert player.wait_idle(2.0)
+    finally:
+        player.stop()
+    assert player.played == 10
+    assert len(player.start_latencies_ms) == 4
@@ -0,0 +1,70 @@
+import time
+from collections import namedtuple
+
+import pytest
+
+from flywheel import GlitchFilter, WheelControl
+from hal import EdgeEvent
+
+Event = namedtuple("Event", "line_offset timestamp_ns event_type")
+FALLING, RISING = EdgeEvent.Type.FALLING_EDGE, EdgeEvent.Type.RISING_EDGE
+
+
+def make_wheel(chip_name, callback=None, **kwargs):
+    return WheelControl(7, 8, callback or (lambda direction, speed_kmh, timestamp_ns=None: None),
+                        chip_name=chip_name, **kwargs)
+
+
+def test_stop_twice():
+    with make_wheel("/dev/gpiochip-test-stop") as wheel:
+        wheel.stop()  # __exit__ stops it again
+
+
+def test_start_after_stop():
+    wheel = make_wheel("/dev/gpiochip-test-restart")
+    wheel.stop()
+    with pytest.raises(RuntimeError):
+        wheel.start()
+
+
+def test_suppress_window_ends():
+    glitch_filter = GlitchFilter()
+    glitch_filter.suppress(0.05)
+    now = time.monotonic_ns()
+    assert not glitch_filter.accept(7, now)
+    assert glitch_filter.accept(7, now + 60_000_000)
+
+
+@pytest.mark.parametrize("duty", [0.08, 0.1, 0.5])
+def test_quadrature_narrow_magnet(duty):
+    # one magnet, 200 ms per revolution: the magnet covers the sensors for `duty` of it
+    steps = []
+    wheel = make_wheel(f"/dev/gpiochip-test-duty-{duty}", lambda direction, *_: steps.append(direction),
+                       mode="quadrature")
+    pulse_ms = 200 * duty
+    for revolution in range(20):
+        t = revolution * 200
+        for line, at_ms, edge in [(7, t, FALLING), (8, t + pulse_ms / 2, FALLING),
+                                  (7, t + pulse_ms, RISING), (8, t + pulse_ms * 1.5, RISING)]:
+            wheel.handle_event(Event(line, int(at_ms * 1_000_000), edge))
+    wheel.stop()
+    assert wheel.filter.rejected_outlier == 0
+    assert steps == [1] * 80
+
+
+def test_speed_up_is_accepted():
+    glitch_filter = GlitchFilter()
+    t = 0
+    for interval_ms in [400] * 5 + [70] * 5:
+        t += interval_ms * 1_000_000
+        assert glitch_filter.accept(7, t)
+
+
+def test_spike_is_rejected():
+    glitch_filter = GlitchFilter()
+    t = 0
+    for _ in range(5):
+        t += 100_000_000
+        assert glitch_filter.accept(7, t)
+    assert not glitch_filter.accept(7, t + 10_000_000)
+    assert glitch_filter.accept(7, t + 100_000_000)
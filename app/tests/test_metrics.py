@@ -0,0 +1,57 @@
+import urllib.request
+
+import pytest
+
+from metrics import MetricsServer, Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("rrr_test_seconds", "Test durations", labels=("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value, "read")
+    assert registry.render().splitlines() == [
+        "# HELP rrr_test_seconds Test durations",
+        "# TYPE rrr_test_seconds histogram",
+        'rrr_test_seconds_bucket{op="read",le="0.1"} 1',
+        'rrr_test_seconds_bucket{op="read",le="1.0"} 3',
+        'rrr_test_seconds_bucket{op="read",le="+Inf"} 4',
+        'rrr_test_seconds_sum{op="read"} 3.05',
+        'rrr_test_seconds_count{op="read"} 4',
+    ]
+
+
+def test_histogram_needs_all_labels():
+    histogram = Registry().histogram("rrr_test_seconds", "Test durations", labels=("op",))
+    with pytest.raises(ValueError):
+        histogram.observe(0.1)
+
+
+def test_collectors_and_label_escaping():
+    registry = Registry()
+    registry.add_collector(lambda: [("rrr_test_total", "counter", "Test events",
+                                     [({"name": 'say "hi"\n'}, 3), ({}, 1)])])
+    def broken():
+        raise RuntimeError("gone")
+    registry.add_collector(broken)
+    assert registry.render() == (
+        "# HELP rrr_test_total Test events\n"
+        "# TYPE rrr_test_total counter\n"
+        'rrr_test_total{name="say \\"hi\\"\\n"} 3\n'
+        "rrr_test_total 1\n"
+        "# collector broken failed: gone\n"
+    )
+
+
+def test_server_answers_scrapes():
+    registry = Registry()
+    registry.add_collector(lambda: [("rrr_test_total", "counter", "Test events", [({}, 7)])])
+    server = MetricsServer(registry, "127.0.0.1:0")
+    server.start()
+    try:
+        port = server.server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "rrr_test_total 7\n" in response.read().decode()
+    finally:
+        server.stop()
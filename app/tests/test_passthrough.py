@@ -0,0 +1,63 @@
+import time
+
+from passthrough import AudioPassthrough, FileCapture, NullPlayback, RingBuffer
+
+
+def test_ring_wraps_around():
+    ring = RingBuffer(8)
+    out = bytearray(3)
+    for chunk in (b"abc", b"def", b"ghi", b"jkl"):
+        ring.write(chunk)
+        assert ring.read_into(out) > 0
+        assert out == chunk
+    assert ring.overruns == 0
+
+
+def test_overrun_drops_the_oldest_bytes():
+    ring = RingBuffer(8)
+    ring.write(b"012345")
+    ring.write(b"6789")
+    assert ring.overruns == 1
+    assert ring.fill == 8
+    out = bytearray(8)
+    ring.read_into(out)
+    assert out == b"23456789"
+
+
+def test_write_larger_than_the_ring_keeps_the_end():
+    ring = RingBuffer(4)
+    ring.write(b"0123456789")
+    out = bytearray(4)
+    ring.read_into(out)
+    assert out == b"6789"
+
+
+def test_read_timeout_and_close():
+    ring = RingBuffer(8)
+    out = bytearray(4)
+    ring.write(b"01")
+    assert ring.read_into(out, timeout=0.01) == -1
+    ring.close()
+    assert ring.read_into(out) == -1
+
+
+def test_passthrough_copies_the_capture_in_order(tmp_path):
+    period_frames, channels = 64, 2
+    period_bytes = period_frames * channels * 2
+    data = bytes(range(1, 256)) * 4  # no zeros, silence can be told apart
+    (tmp_path / "in.raw").write_bytes(data)
+
+    source = FileCapture(str(tmp_path / "in.raw"), channels=channels, period_frames=period_frames)
+    sink = NullPlayback(str(tmp_path / "out.raw"), channels=channels, period_frames=period_frames)
+    engine = AudioPassthrough(source, sink, prefill_periods=1)
+    engine.start()
+    time.sleep(0.1)
+    engine.stop()
+
+    out = (tmp_path / "out.raw").read_bytes()
+    assert engine.frames > 0
+    # one period of silence first (and after every playback underrun), then the file in a loop
+    assert out[:period_bytes] == bytes(period_bytes)
+    played = out.replace(b"\0", b"")
+    if engine.capture_xruns == 0:
+        assert played == (data * (len(played) // len(data) + 1))[:len(played)]
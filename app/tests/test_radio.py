@@ -0,0 +1,110 @@
+import threading
+
+import radio
+from hal.sim_radio import FakeTEA5767, SimI2CBus
+from radio import BAND_MIN_MHZ, TEA5767, TEA5767_ADDR, BandScanner, StationIndex, TunerStatus
+
+
+class BlockingTuner:
+    """Records the tune() calls, a tune can be held until the test releases it."""
+
+    def __init__(self):
+        self.tuned = []
+        self.in_tune = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def tune(self, freq, mute=False):
+        self.tuned.append(freq)
+        self.in_tune.set()
+        self.release.wait(5)
+
+    def read_status(self):
+        return TunerStatus(self.tuned[-1], True, False, False, 0x37, 9)
+
+
+def test_step_after_pause_leaves_tuner_alone(tmp_path):
+    # the scan loop checked _paused, then pause() returned before step() got the tuner
+    tuner = BlockingTuner()
+    scanner = BandScanner(tuner, StationIndex(str(tmp_path / "stations.json")))
+    scanner.pause()
+    assert scanner.step() is False
+    assert tuner.tuned == []
+
+
+def test_pause_during_step(tmp_path):
+    tuner = BlockingTuner()
+    index = StationIndex(str(tmp_path / "stations.json"))
+    scanner = BandScanner(tuner, index)
+    tuner.release.clear()
+    stepping = threading.Thread(target=scanner.step)
+    stepping.start()
+    assert tuner.in_tune.wait(5)
+
+    paused = threading.Event()
+    pausing = threading.Thread(target=lambda: (scanner.pause(), paused.set()))
+    pausing.start()
+    assert not paused.wait(0.05)  # waits for the step in flight
+    tuner.release.set()
+    stepping.join(5)
+    pausing.join(5)
+    assert paused.is_set()
+
+    assert scanner.step() is False
+    assert tuner.tuned == [BAND_MIN_MHZ]
+
+
+def sim_tuner(monkeypatch, stations):
+    chip = FakeTEA5767(stations)
+    tuner = TEA5767(SimI2CBus({TEA5767_ADDR: chip}))
+    monkeypatch.setattr(radio, "get_tuner", lambda: tuner)
+    return tuner, chip
+
+
+def test_seek(monkeypatch):
+    tuner, chip = sim_tuner(monkeypatch, {95.0: 12, 98.5: 8})
+    radio.set_frequency(95.0)
+    status = radio.seek()
+    assert (status.frequency_mhz, status.band_limit) == (98.5, False)
+    assert tuner.frequency == 98.5 and not chip.muted
+    assert radio.seek(up=False).frequency_mhz == 95.0
+
+
+def test_seek_to_end_of_band_stays_muted(monkeypatch):
+    tuner, chip = sim_tuner(monkeypatch, {95.0: 12})
+    radio.set_frequency(95.0)
+    assert radio.seek().band_limit
+    assert chip.muted
+
+
+def test_standby_until_the_next_tune(monkeypatch):
+    tuner, chip = sim_tuner(monkeypatch, {95.0: 12})
+    radio.set_frequency(95.0)
+    radio.standby()
+    assert chip.standby and chip.muted
+    radio.set_frequency(95.0)
+    assert not chip.standby and not chip.muted
+
+
+def test_rescan_starts_over(tmp_path):
+    tuner = BlockingTuner()
+    index = StationIndex(str(tmp_path / "stations.json"))
+    index.record(98.5, 12, True)
+    index.cursor_mhz = 108.0
+    index.complete = True
+    scanner = BandScanner(tuner, index)
+    assert scanner.step() is False
+    scanner.rescan()
+    assert index.samples == {} and not index.complete
+    assert scanner.step() is True
+    assert tuner.tuned == [BAND_MIN_MHZ]
+
+
+def test_search_wakes_tuner_from_standby():
+    chip = FakeTEA5767({95.0: 12, 98.5: 8})
+    tuner = TEA5767(SimI2CBus({TEA5767_ADDR: chip}))
+    tuner.tune(95.0)
+    tuner.standby()
+    status = tuner.search()
+    assert (status.frequency_mhz, status.band_limit) == (98.5, False)
+    assert not chip.standby
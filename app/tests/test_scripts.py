@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+from scripts import ShellWorker
+
+CAPABILITIES_DIR = Path(__file__).resolve().parent.parent / "capabilities"
+
+
+def write_script(tmp_path):
+    script = tmp_path / "enable_args.sh"
+    script.write_text('#!/bin/bash\necho "$# [$1] $0"\n')
+    return script
+
+
+def test_worker_runs_script_without_arguments(tmp_path):
+    script = write_script(tmp_path)
+    worker = ShellWorker()
+    try:
+        result = worker.run(script)
+    finally:
+        worker.close()
+    assert result.returncode == 0
+    assert result.stdout == f"0 [] {script}\n"
+
+
+def test_worker_exit_status(tmp_path):
+    script = tmp_path / "disable_fail.sh"
+    script.write_text("echo failed >&2\nexit 4\n")
+    worker = ShellWorker()
+    try:
+        result = worker.run(script)
+    finally:
+        worker.close()
+    assert (result.returncode, result.stderr) == (4, "failed\n")
+
+
+def run_disable_aux(tmp_path, **env):
+    # a pkill that only reports what it would have killed
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "pkill").write_text('#!/bin/bash\necho "pkill $*"\n')
+    (bin_dir / "pkill").chmod(0o755)
+    worker = ShellWorker({**os.environ, "PATH": f"{bin_dir}:{os.environ['PATH']}", **env})
+    try:
+        return worker.run(CAPABILITIES_DIR / "aux" / "disable_aux.sh").stdout
+    finally:
+        worker.close()
+
+
+def test_disable_aux_leaves_the_bridge_to_the_supervisor(tmp_path):
+    assert "pkill" not in run_disable_aux(tmp_path, RRR_SUPERVISED="1")
+
+
+def test_disable_aux_by_hand_uses_pkill(tmp_path):
+    output = run_disable_aux(tmp_path)
+    assert "pkill arecord\n" in output and "pkill aplay\n" in output
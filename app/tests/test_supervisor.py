@@ -0,0 +1,81 @@
+import os
+import subprocess
+
+from supervisor import Supervisor
+
+
+def start_group(script):
+    """bash in a process group of its own, prints the pid of its background job."""
+    proc = subprocess.Popen(["/bin/bash", "-c", script], stdout=subprocess.PIPE, text=True,
+                            start_new_session=True)
+    return proc, int(proc.stdout.readline())
+
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_stop_kills_the_whole_group():
+    supervisor = Supervisor()
+    proc, job = start_group("sleep 60 & echo $!; wait")
+    try:
+        supervisor.adopt("aux", proc)
+        assert supervisor.stop("aux") == 1
+        assert proc.returncode == -15
+        assert not alive(job)
+        assert supervisor.children("aux") == []
+        assert supervisor.killed == 1 and supervisor.reaped == 1
+    finally:
+        supervisor.close()
+
+
+def test_stop_kills_what_ignores_sigterm():
+    supervisor = Supervisor()
+    proc, job = start_group("trap '' TERM; sleep 60 & echo $!; while :; do wait; done")
+    try:
+        supervisor.adopt("radio", proc)
+        supervisor.adopt_group("radio", proc.pid)
+        assert len(supervisor.children("radio")) == 2
+        assert supervisor.stop("radio", timeout_s=0.2) == 2
+        assert proc.returncode == -9
+        assert not alive(job)
+        assert supervisor.children() == []
+    finally:
+        supervisor.close()
+
+
+def test_stop_leaves_other_capabilities_alone():
+    supervisor = Supervisor()
+    aux, _ = start_group("sleep 60 & echo $!; wait")
+    cd, _ = start_group("sleep 60 & echo $!; wait")
+    try:
+        supervisor.adopt("aux", aux)
+        supervisor.adopt("cd", cd)
+        supervisor.stop("aux")
+        assert aux.poll() is not None
+        assert cd.poll() is None
+        assert [child.pid for child in supervisor.children()] == [cd.pid]
+    finally:
+        supervisor.close()
+    assert cd.poll() is not None
+
+
+def test_wait_for_exit():
+    supervisor = Supervisor()
+    quick, _ = start_group("sleep 0.1 & echo $!; wait")
+    stuck, _ = start_group("sleep 60 & echo $!; wait")
+    try:
+        supervisor.adopt("aux", quick)
+        supervisor.adopt("cd", stuck)
+        assert supervisor.wait({"aux"}, timeout_s=2.0)
+        assert quick.returncode == 0
+        assert supervisor.children("aux") == []
+        assert not supervisor.wait({"aux", "cd"}, timeout_s=0.1)
+        assert not supervisor.wait({"cd"}, timeout_s=2.0, cancelled=lambda: True)
+        assert stuck.poll() is None  # waiting doesn't signal anything
+    finally:
+        supervisor.close()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from volume import VolumeActuator
+
+
+class RecordingVolume:
+    """Records the change_volume() steps, the first one can be held until the test releases it."""
+
+    def __init__(self):
+        self.steps = []
+        self.level = 50
+        self.release = threading.Event()
+        self.release.set()
+
+    def change_volume(self, step):
+        self.release.wait(5)
+        self.steps.append(step)
+        self.level = max(0, min(100, self.level + step))
+
+    @property
+    def last_level(self):
+        return self.level
+
+
+def wait_for(condition, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_events_during_a_write_are_merged():
+    volume = RecordingVolume()
+    actuator = VolumeActuator(volume, max_rate_hz=1000)
+    actuator.start()
+    try:
+        volume.release.clear()
+        actuator.submit(1)
+        wait_for(lambda: actuator._pending_events == 0)  # the writer took it and hangs in the mixer
+        for _ in range(10):
+            actuator.submit(0.5)
+        volume.release.set()
+        wait_for(lambda: actuator.events == 11)
+    finally:
+        actuator.stop()
+    assert volume.steps == [1, 5]
+    assert actuator.writes == 2
+    assert actuator.merged_events == 9
+
+
+def test_fractions_are_carried_over():
+    volume = RecordingVolume()
+    actuator = VolumeActuator(volume, max_rate_hz=1000)
+    actuator.start()
+    try:
+        for i in range(1, 4):
+            actuator.submit(0.4)
+            wait_for(lambda: actuator.writes == i)
+    finally:
+        actuator.stop()
+    assert volume.steps == [1]
+
+
+def test_writes_are_rate_limited():
+    volume = RecordingVolume()
+    actuator = VolumeActuator(volume, max_rate_hz=20)
+    actuator.start()
+    submitted = 0
+    try:
+        start = time.monotonic()
+        while time.monotonic() - start < 0.25:
+            actuator.submit(1)
+            submitted += 1
+            time.sleep(0.001)
+        wait_for(lambda: actuator.events == submitted)
+    finally:
+        actuator.stop()
+    # 20 writes per second: one right away, then one every 50 ms
+    assert actuator.writes <= 7
+    assert sum(volume.steps) == submitted